@@ -0,0 +1,128 @@
+"""
+Turns the scenario log of Benchmarks.py into a table, one row per measured
+call.
+
+Every measured call starts with a `bench <contract> <entry_point> <size>`
+heading (see Benchmarks.measure) and runs until the next one. Within that
+block the extractor reads
+
+    param_bytes        the packed parameter size the benchmark shows right
+                       after the heading, i.e. the part of the operation
+                       the call controls (the envelope is the same for
+                       every call)
+    consumed_gas       sum of the "Consumed gas" receipt lines, internal
+                       operations included
+    paid_storage_diff  sum of the "Paid storage size diff" receipt lines
+    storage_size       last "Storage size" receipt line
+    storage_tz_bytes   size of the storage the call left in the called
+                       contract, read from the step_*_storage.tz file the
+                       compiler wrote for it
+    params_tz_bytes    size of the step_*_params.tz file of the call
+
+The interpreter writes a step_*_storage.tz and step_*_params.tz file for
+every call and lists them in the log, so the *_tz_bytes columns are filled
+on every run. They measure the Michelson text, big_map contents included,
+which tracks how the state grows but is not the serialized size the chain
+charges for. The receipt lines are only printed when the scenario runs
+against a mockup or sandbox node; columns the log has no lines for are left
+empty.
+
+    python BenchmarkTable.py out/Entry_point_benchmarks/log.txt > entry_points.csv
+    python BenchmarkTable.py --json out/*/log.txt
+
+Only the standard library is needed.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+
+
+# Contract labels may contain spaces ("CricTezCards[token operator]").
+HEADING = re.compile(r"\bbench (.+) (\S+) (\S+)\s*$")
+BARE_NUMBER = re.compile(r"^\s*(?:=>\s*)?(\d+)\s*$")
+CONSUMED_GAS = re.compile(r"Consumed gas:\s*([\d.]+)", re.IGNORECASE)
+PAID_STORAGE_DIFF = re.compile(r"Paid storage size diff:\s*(-?\d+)", re.IGNORECASE)
+STORAGE_SIZE = re.compile(r"Storage size:\s*(\d+)", re.IGNORECASE)
+EXECUTING = re.compile(r"^\s*Executing\b")
+# Compiler outputs listed in the log, e.g. " => out/.../step_012_cont_1_storage.tz 1".
+STORAGE_OUTPUT = re.compile(r"=>\s*(\S+_storage\.tz)\b")
+PARAMS_OUTPUT = re.compile(r"=>\s*(\S+_params\.tz)\b")
+# Any other heading closes the current block.
+OTHER_HEADING = re.compile(r"^\s*(?:Comment\.\.\.|h[1-4]:)")
+
+COLUMNS = ["log", "contract", "entry_point", "size", "param_bytes", "consumed_gas", "paid_storage_diff",
+           "storage_size", "storage_tz_bytes", "params_tz_bytes"]
+
+
+def number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def output_size(path, log_name):
+    """ Size in bytes of a compiler output named in the log, None if it cannot be found. """
+    # The log names outputs relative to where the scenario ran; they sit next to log.txt.
+    for candidate in (path, os.path.join(os.path.dirname(log_name), os.path.basename(path))):
+        if os.path.isfile(candidate):
+            return os.path.getsize(candidate)
+    return None
+
+
+def parse_log(lines, log_name=""):
+    """ Rows (dicts keyed by COLUMNS) for the bench blocks of one scenario log. """
+    rows = []
+    row = None
+    executing = False
+    for line in lines:
+        heading = HEADING.search(line)
+        if heading is not None:
+            row = dict.fromkeys(COLUMNS)
+            row.update(log=log_name, contract=heading.group(1), entry_point=heading.group(2),
+                       size=heading.group(3))
+            rows.append(row)
+            executing = False
+            continue
+        if row is None:
+            continue
+        if OTHER_HEADING.search(line):
+            row = None
+            continue
+        if EXECUTING.search(line):
+            executing = True
+        # The parameter size is shown before the call itself runs.
+        bare_number = BARE_NUMBER.match(line)
+        if bare_number is not None and not executing and row["param_bytes"] is None:
+            row["param_bytes"] = int(bare_number.group(1))
+        for field, pattern in (("consumed_gas", CONSUMED_GAS), ("paid_storage_diff", PAID_STORAGE_DIFF)):
+            for match in pattern.finditer(line):
+                row[field] = (row[field] or 0) + number(match.group(1))
+        storage_size = STORAGE_SIZE.search(line)
+        if storage_size is not None:
+            row["storage_size"] = int(storage_size.group(1))
+        # The called contract's storage is written first, then those of its internal operations.
+        for field, pattern in (("storage_tz_bytes", STORAGE_OUTPUT), ("params_tz_bytes", PARAMS_OUTPUT)):
+            output = pattern.search(line)
+            if output is not None and executing and row[field] is None:
+                row[field] = output_size(output.group(1), log_name)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the bench table from Benchmarks.py scenario logs.")
+    parser.add_argument("--json", action="store_true", help="write a JSON array instead of CSV")
+    parser.add_argument("logs", nargs="+", help="scenario logs (log.txt)")
+    arguments = parser.parse_args()
+    rows = []
+    for path in arguments.logs:
+        with open(path) as log:
+            rows += parse_log(log, path)
+    if arguments.json:
+        json.dump(rows, sys.stdout, indent=1)
+        print()
+    else:
+        writer = csv.DictWriter(sys.stdout, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,518 @@
+"""
+Gas and storage benchmarks for CricTezCards and AuctionHouse.
+
+Every measured call is announced by a heading of the form
+
+    bench <contract> <entry_point> <size>
+
+followed by the packed parameter size in bytes (when the parameter can be
+packed) and the call itself. Everything that only builds up state runs with
+show=False. BenchmarkTable.py turns the scenario log into a CSV or JSON
+table per entry point and state size. Storage and parameter sizes come from
+the compiled step_*_storage.tz and step_*_params.tz outputs on any run; gas
+and paid storage diff need a run against a mockup or sandbox node:
+
+    python BenchmarkTable.py out/Entry_point_benchmarks/log.txt > entry_points.csv
+"""
+import smartpy as sp
+
+Source = sp.io.import_script_from_url("file:Source.py")
+
+ADMIN = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+METADATA_URL = "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"
+IPFS_STRING = "ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY"
+
+
+def originate_cards(scenario, auction_house_address, debug=False, voucher_signer=None):
+    cards = Source.CricTezCards(
+        admin=ADMIN,
+        metadata=sp.utils.metadata_of_url(METADATA_URL),
+        initial_auction_house_address=auction_house_address,
+        debug=debug,
+        voucher_signer=voucher_signer)
+    scenario += cards
+    scenario += cards.register_card_template(player_id=0, year=2021, card_type=Source.CardType.STANDARD,
+                                             ipfs_string=IPFS_STRING).run(sender=ADMIN, show=False)
+    # Lets the auction house pull ADMIN's cards into auctions.
+    scenario += cards.update_all_tokens_operators([sp.variant("add_operator", sp.record(
+        owner=ADMIN, operator=auction_house_address))]).run(sender=ADMIN, show=False)
+    return cards
+
+
+FILLER_BATCH_SIZE = 500
+
+
+def edition(edition_no):
+    return sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))}, edition_no=edition_no)
+
+
+def mint_card(cards, edition_no, show=False):
+    return cards.mint(metadata={'': sp.utils.bytes_of_string(str(edition_no))}, template_id=0,
+                      edition_no=edition_no).run(sender=ADMIN, show=show)
+
+
+STATE_SIZES = [10, 100, 1000]
+BATCH_LENGTHS = [1, 10, 100]
+AUCTION_END = 60*60*2
+SALE_PRICE_MUTEZ = 1000000
+SALE_PRICE = sp.mutez(SALE_PRICE_MUTEZ)
+
+
+def measure(scenario, contract_name, entry_point, size, call, params=None, params_type=None):
+    scenario.h3("bench {} {} {}".format(contract_name, entry_point, size))
+    if params is not None:
+        scenario.show(scenario.compute(sp.len(sp.pack(sp.set_type_expr(params, params_type)))))
+    scenario += call
+
+
+def transfer_params(from_, to_, token_ids):
+    return [Source.BatchTransfer.item(from_, [sp.record(to_=to_, token_id=token_id, amount=1) for token_id in token_ids])]
+
+
+def grow_to(scenario, cards, current, target):
+    """ Mints filler cards silently, in batches, until the collection holds `target` tokens. """
+    for start in range(current, target, FILLER_BATCH_SIZE):
+        editions = range(start, min(start + FILLER_BATCH_SIZE, target))
+        scenario += cards.mint_batch(template_id=0, editions=[edition(edition_no)
+                                                              for edition_no in editions]).run(sender=ADMIN, show=False)
+    return target
+
+
+if "templates" not in __name__:
+    @sp.add_test(name="Token registry scaling")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Token registry scaling")
+        scenario.p("Mint, transfer and marketplace calls measured as the collection grows. "
+                   "With the token counter the measured steps should cost the same gas at every size.")
+
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        cards = originate_cards(scenario, auction_house.address)
+        alice = sp.test_account("Alice")
+
+        size = 0
+        for checkpoint in [10, 100, 1000, 10000]:
+            size = grow_to(scenario, cards, size, checkpoint - 1)
+            scenario.h2("{} tokens".format(checkpoint))
+            measure(scenario, "CricTezCards", "mint", checkpoint, mint_card(cards, size, show=True))
+            size += 1
+            params = transfer_params(ADMIN, alice.address, [size - 1])
+            measure(scenario, "CricTezCards", "transfer", checkpoint,
+                    cards.transfer(params).run(sender=ADMIN), params, Source.BatchTransfer.get_type())
+            params = sp.record(token_id=size - 1, sale_price=SALE_PRICE)
+            measure(scenario, "CricTezCards", "list_card_on_marketplace", checkpoint,
+                    cards.list_card_on_marketplace(params).run(sender=alice), params,
+                    Source.marketplace.get_listing_request_type())
+            measure(scenario, "CricTezCards", "set_pause", checkpoint, cards.set_pause(False).run(sender=ADMIN))
+
+        scenario.verify(cards.data.next_token_id == size)
+
+    @sp.add_test(name="Entry point benchmarks")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Entry point benchmarks")
+
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        cards = originate_cards(scenario, auction_house.address)
+        receiver = Source.BalanceOfReceiver()
+        scenario += receiver
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        callback = sp.contract(Source.BalanceOfRequest.get_response_type(), receiver.address,
+                               entry_point="receive_balances").open_some()
+
+        size = 0
+        # Auction ids are allocated sequentially by the auction house; the
+        # measured auctions are settled, so only the filler ones stay live.
+        auction_id = 0
+        live_auctions = 0
+        for state_size in STATE_SIZES:
+            size = grow_to(scenario, cards, size, max(size, state_size))
+            scenario.h2("{} tokens, {} live auctions".format(size, live_auctions))
+
+            measure(scenario, "CricTezCards", "mint", size, mint_card(cards, size, show=True))
+            size += 1
+
+            for batch_length in BATCH_LENGTHS:
+                params = sp.record(template_id=0, editions=[edition(edition_no)
+                                                            for edition_no in range(size, size + batch_length)])
+                measure(scenario, "CricTezCards", "mint_batch", batch_length,
+                        cards.mint_batch(params).run(sender=ADMIN), params, Source.MintRequest.get_batch_type())
+                batch = list(range(size, size + batch_length))
+                size += batch_length
+
+                params = transfer_params(ADMIN, alice.address, batch)
+                measure(scenario, "CricTezCards", "transfer", batch_length,
+                        cards.transfer(params).run(sender=ADMIN), params, Source.BatchTransfer.get_type())
+
+                requests = [sp.record(owner=alice.address, token_id=token_id) for token_id in batch]
+                measure(scenario, "CricTezCards", "balance_of", batch_length,
+                        cards.balance_of(requests=requests, callback=callback).run(sender=bob))
+
+                params = [sp.record(token_id=token_id, sale_price=SALE_PRICE) for token_id in batch]
+                measure(scenario, "CricTezCards", "list_cards_batch", batch_length,
+                        cards.list_cards_batch(params).run(sender=alice), params,
+                        sp.TList(Source.marketplace.get_listing_request_type()))
+                params = batch
+                measure(scenario, "CricTezCards", "withdraw_cards_batch", batch_length,
+                        cards.withdraw_cards_batch(params).run(sender=alice), params, sp.TList(sp.TNat))
+                scenario += cards.list_cards_batch([sp.record(token_id=token_id, sale_price=SALE_PRICE)
+                                                    for token_id in batch]).run(sender=alice, show=False)
+                measure(scenario, "CricTezCards", "buy_cards_batch", batch_length,
+                        cards.buy_cards_batch(params).run(sender=bob, amount=sp.mutez(batch_length * SALE_PRICE_MUTEZ)),
+                        params, sp.TList(sp.TNat))
+                scenario += cards.transfer(transfer_params(bob.address, alice.address, batch)).run(
+                    sender=bob, show=False)
+
+            listed_token = size - 1
+            params = sp.record(token_id=listed_token, sale_price=SALE_PRICE)
+            measure(scenario, "CricTezCards", "list_card_on_marketplace", size,
+                    cards.list_card_on_marketplace(params).run(sender=alice), params,
+                    sp.TRecord(token_id=sp.TNat, sale_price=sp.TMutez))
+            measure(scenario, "CricTezCards", "withdraw_card_from_marketplace", size,
+                    cards.withdraw_card_from_marketplace(token_id=listed_token).run(sender=alice))
+            scenario += cards.list_card_on_marketplace(params).run(sender=alice, show=False)
+            measure(scenario, "CricTezCards", "buy_card_from_marketplace", size,
+                    cards.buy_card_from_marketplace(token_id=listed_token).run(sender=bob, amount=SALE_PRICE))
+            measure(scenario, "CricTezCards", "set_pause", size, cards.set_pause(False).run(sender=ADMIN))
+
+            # Keep roughly one live auction per ten cards around the measured one.
+            spare_tokens = list(range(size, size + max(0, state_size // 10 - live_auctions) + 1))
+            size = grow_to(scenario, cards, size, size + len(spare_tokens))
+            while live_auctions < state_size // 10:
+                scenario += auction_house.create_auction(token_address=cards.address,
+                                                         token_id=spare_tokens.pop(), token_amount=1,
+                                                         end_timestamp=sp.timestamp(AUCTION_END), bid_amount=Source.MINIMAL_BID).run(
+                    sender=ADMIN, now=sp.timestamp(0), show=False)
+                auction_id += 1
+                live_auctions += 1
+
+            params = sp.record(token_address=cards.address, token_id=spare_tokens.pop(),
+                               token_amount=1, end_timestamp=sp.timestamp(AUCTION_END), bid_amount=Source.MINIMAL_BID)
+            measure(scenario, "AuctionHouse", "create_auction", live_auctions,
+                    auction_house.create_auction(params).run(sender=ADMIN, now=sp.timestamp(0)),
+                    params, Source.AuctionCreateRequest.get_type())
+            measure(scenario, "AuctionHouse", "bid", live_auctions,
+                    auction_house.bid(auction_id).run(sender=alice, amount=sp.mutez(200000), now=sp.timestamp(10)))
+            measure(scenario, "AuctionHouse", "bid", live_auctions,
+                    auction_house.bid(auction_id).run(sender=bob, amount=sp.mutez(300000), now=sp.timestamp(20)))
+            measure(scenario, "AuctionHouse", "withdraw", live_auctions,
+                    auction_house.withdraw(auction_id).run(sender=bob, now=sp.timestamp(AUCTION_END + 1)))
+            auction_id += 1
+
+            batch = list(range(size, size + BATCH_LENGTHS[1]))
+            size = grow_to(scenario, cards, size, size + len(batch))
+            params = [sp.record(token_address=cards.address, token_id=token_id, token_amount=1,
+                                end_timestamp=sp.timestamp(AUCTION_END), bid_amount=Source.MINIMAL_BID)
+                      for token_id in batch]
+            measure(scenario, "AuctionHouse", "create_auctions_batch", len(batch),
+                    auction_house.create_auctions_batch(params).run(sender=ADMIN, now=sp.timestamp(0)),
+                    params, sp.TList(Source.AuctionCreateRequest.get_type()))
+            for index, token_id in enumerate(batch):
+                scenario += auction_house.bid(auction_id + index).run(sender=alice, amount=sp.mutez(200000),
+                                                                      now=sp.timestamp(10), show=False)
+            params = [auction_id + index for index in range(len(batch))]
+            measure(scenario, "AuctionHouse", "withdraw_many", len(batch),
+                    auction_house.withdraw_many(params).run(sender=bob, now=sp.timestamp(AUCTION_END + 1)),
+                    params, sp.TList(sp.TNat))
+            auction_id += len(batch)
+
+    @sp.add_test(name="Owner scaling")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Owner scaling")
+        scenario.p("The same collection spread over a growing number of owners, with and without the owner index. "
+                   "Transfers, purchases and balance_of over every owner are measured at each owner count.")
+
+        owner_counts = [1, 10, 100]
+        cards_per_owner = 10
+        receiver = Source.BalanceOfReceiver()
+        scenario += receiver
+        callback = sp.contract(Source.BalanceOfRequest.get_response_type(), receiver.address,
+                               entry_point="receive_balances").open_some()
+        buyer = sp.test_account("Buyer")
+        for build, owner_index in [("plain", False), ("owner index", True)]:
+            scenario.h2("{} build".format(build))
+            auction_house = Source.AuctionHouse()
+            scenario += auction_house
+            cards = Source.CricTezCards(
+                admin=ADMIN,
+                metadata=sp.utils.metadata_of_url(METADATA_URL),
+                initial_auction_house_address=auction_house.address,
+                owner_index=owner_index)
+            scenario += cards
+            scenario += cards.register_card_template(player_id=0, year=2021, card_type=Source.CardType.STANDARD,
+                                                     ipfs_string=IPFS_STRING).run(sender=ADMIN, show=False)
+            contract_name = "CricTezCards[{}]".format(build)
+
+            size = 0
+            owners = []
+            for owner_count in owner_counts:
+                new_owners = [sp.test_account("Owner {}".format(owner_no))
+                              for owner_no in range(len(owners), owner_count)]
+                for owner in new_owners:
+                    size = grow_to(scenario, cards, size, size + cards_per_owner)
+                    scenario += cards.transfer(transfer_params(ADMIN, owner.address, range(
+                        size - cards_per_owner, size))).run(sender=ADMIN, show=False)
+                owners += new_owners
+                scenario.p("{} owners, {} tokens".format(owner_count, size))
+
+                sender = owners[-1]
+                token_id = size - 1
+                params = transfer_params(sender.address, owners[0].address, [token_id])
+                measure(scenario, contract_name, "transfer", owner_count,
+                        cards.transfer(params).run(sender=sender), params, Source.BatchTransfer.get_type())
+                scenario += cards.list_card_on_marketplace(token_id=token_id, sale_price=SALE_PRICE).run(
+                    sender=owners[0], show=False)
+                measure(scenario, contract_name, "buy_card_from_marketplace", owner_count,
+                        cards.buy_card_from_marketplace(token_id=token_id).run(sender=buyer, amount=SALE_PRICE))
+                requests = [Source.LedgerKey.make(owner.address, owner_no * cards_per_owner)
+                            for owner_no, owner in enumerate(owners)]
+                measure(scenario, contract_name, "balance_of", owner_count,
+                        cards.balance_of(requests=requests, callback=callback).run(sender=buyer))
+
+    @sp.add_test(name="Transfer tracing overhead")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Transfer tracing overhead")
+        scenario.p("The same transfer batches against a production build and a debug build that emits a trace event per tx.")
+
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        alice = sp.test_account("Alice")
+
+        for build, debug in [("production", False), ("debug", True)]:
+            scenario.h2("{} build".format(build))
+            cards = originate_cards(scenario, auction_house.address, debug=debug)
+            size = grow_to(scenario, cards, 0, sum(BATCH_LENGTHS))
+            first_token = 0
+            for batch_length in BATCH_LENGTHS:
+                params = transfer_params(ADMIN, alice.address, range(first_token, first_token + batch_length))
+                measure(scenario, "CricTezCards[{}]".format(build), "transfer", batch_length,
+                        cards.transfer(params).run(sender=ADMIN), params, Source.BatchTransfer.get_type())
+                first_token += batch_length
+            scenario.verify(cards.data.next_token_id == size)
+
+    @sp.add_test(name="Transfer hot loop")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Transfer hot loop")
+        scenario.p("100-tx batches through transfer: plain moves, moves of listed cards, no-op self transfers "
+                   "and moves by per-token and all-tokens operators. "
+                   "Run the same scenario on an older revision for the before figures.")
+
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        cards = originate_cards(scenario, auction_house.address)
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        batch_length = 100
+        grow_to(scenario, cards, 0, 2 * batch_length)
+
+        plain = range(0, batch_length)
+        params = transfer_params(ADMIN, alice.address, plain)
+        measure(scenario, "CricTezCards", "transfer", batch_length,
+                cards.transfer(params).run(sender=ADMIN), params, Source.BatchTransfer.get_type())
+        scenario.verify(~cards.data.ledger.contains(
+            Source.LedgerKey.make(ADMIN, 0)))
+
+        listed = range(batch_length, 2 * batch_length)
+        scenario += cards.transfer(transfer_params(ADMIN, bob.address, listed)).run(sender=ADMIN, show=False)
+        for token_id in listed:
+            scenario += cards.list_card_on_marketplace(token_id=token_id, sale_price=SALE_PRICE).run(
+                sender=bob, show=False)
+        params = transfer_params(bob.address, alice.address, listed)
+        measure(scenario, "CricTezCards[listed]", "transfer", batch_length,
+                cards.transfer(params).run(sender=bob), params, Source.BatchTransfer.get_type())
+        scenario.verify(~cards.data.token_states.contains(batch_length))
+
+        params = transfer_params(alice.address, alice.address, plain)
+        measure(scenario, "CricTezCards[self]", "transfer", batch_length,
+                cards.transfer(params).run(sender=alice), params, Source.BatchTransfer.get_type())
+
+        params = [sp.variant("add_operator", Source.OperatorParam.make(alice.address, bob.address, token_id))
+                  for token_id in plain]
+        measure(scenario, "CricTezCards", "update_operators", batch_length,
+                cards.update_operators(params).run(sender=alice))
+        params = transfer_params(alice.address, bob.address, plain)
+        measure(scenario, "CricTezCards[token operator]", "transfer", batch_length,
+                cards.transfer(params).run(sender=bob), params, Source.BatchTransfer.get_type())
+        scenario += cards.update_all_tokens_operators([sp.variant("add_operator", sp.record(
+            owner=bob.address, operator=alice.address))]).run(sender=bob, show=False)
+        params = transfer_params(bob.address, alice.address, plain)
+        measure(scenario, "CricTezCards[all-tokens operator]", "transfer", batch_length,
+                cards.transfer(params).run(sender=alice), params, Source.BatchTransfer.get_type())
+
+    @sp.add_test(name="Bid refund modes")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Bid refund modes")
+        scenario.p("A bidding war on one auction with refunds pushed inside bid versus booked for claim_refunds.")
+
+        bidders = [sp.test_account("Alice"), sp.test_account("Bob")]
+        bid_count = 20
+        for mode, pull_payments in [("push", False), ("pull", True)]:
+            scenario.h2("{} refunds".format(mode))
+            auction_house = Source.AuctionHouse(pull_payments=pull_payments)
+            scenario += auction_house
+            cards = originate_cards(scenario, auction_house.address)
+            scenario += mint_card(cards, 0)
+            scenario += auction_house.create_auction(token_address=cards.address, token_id=0, token_amount=1,
+                                                     end_timestamp=sp.timestamp(AUCTION_END), bid_amount=Source.MINIMAL_BID).run(
+                sender=ADMIN, now=sp.timestamp(0), show=False)
+            for bid_no in range(bid_count):
+                measure(scenario, "AuctionHouse[{}]".format(mode), "bid", bid_no,
+                        auction_house.bid(0).run(sender=bidders[bid_no % 2], amount=sp.mutez(200000 * (bid_no + 1)),
+                                                 now=sp.timestamp(bid_no)))
+            if pull_payments:
+                for bidder in bidders:
+                    measure(scenario, "AuctionHouse[{}]".format(mode), "claim_refunds", bid_count // 2,
+                            auction_house.claim_refunds().run(sender=bidder))
+
+    @sp.add_test(name="balance_of queries")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("balance_of queries")
+        scenario.p("Aggregator-sized balance_of requests with distinct keys, with every key asked twice, "
+                   "and against a paused contract.")
+
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        cards = originate_cards(scenario, auction_house.address)
+        receiver = Source.BalanceOfReceiver()
+        scenario += receiver
+        bob = sp.test_account("Bob")
+        callback = sp.contract(Source.BalanceOfRequest.get_response_type(), receiver.address,
+                               entry_point="receive_balances").open_some()
+        request_counts = [10, 100, 1000]
+        grow_to(scenario, cards, 0, max(request_counts))
+
+        for request_count in request_counts:
+            requests = [sp.record(owner=ADMIN, token_id=token_id) for token_id in range(request_count)]
+            measure(scenario, "CricTezCards", "balance_of", request_count,
+                    cards.balance_of(requests=requests, callback=callback).run(sender=bob))
+            duplicated = [sp.record(owner=ADMIN, token_id=token_id) for token_id in range(request_count // 2)] * 2
+            measure(scenario, "CricTezCards[duplicated]", "balance_of", request_count,
+                    cards.balance_of(requests=duplicated, callback=callback).run(sender=bob))
+
+        scenario += cards.set_pause(True).run(sender=ADMIN, show=False)
+        requests = [sp.record(owner=ADMIN, token_id=token_id) for token_id in range(max(request_counts))]
+        measure(scenario, "CricTezCards[paused]", "balance_of", max(request_counts),
+                cards.balance_of(requests=requests, callback=callback).run(sender=bob))
+
+    @sp.add_test(name="Auction custody modes")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Auction custody modes")
+        scenario.p("Create, bid and settle against an auction house that escrows the card and one that only locks it "
+                   "with the seller. Compare the token contract's share of each step.")
+
+        alice = sp.test_account("Alice")
+        batch_length = BATCH_LENGTHS[1]
+        for mode, escrow_free in [("escrow", False), ("escrow-free", True)]:
+            scenario.h2("{} auctions".format(mode))
+            auction_house = Source.AuctionHouse(escrow_free=escrow_free)
+            scenario += auction_house
+            cards = originate_cards(scenario, auction_house.address)
+            grow_to(scenario, cards, 0, 2 + batch_length)
+            contract_name = "AuctionHouse[{}]".format(mode)
+
+            for token_id, bid_amount in [(0, sp.mutez(200000)), (1, None)]:
+                params = sp.record(token_address=cards.address, token_id=token_id, token_amount=1,
+                                   end_timestamp=sp.timestamp(AUCTION_END), bid_amount=Source.MINIMAL_BID)
+                measure(scenario, contract_name, "create_auction", token_id,
+                        auction_house.create_auction(params).run(sender=ADMIN, now=sp.timestamp(0)),
+                        params, Source.AuctionCreateRequest.get_type())
+                if bid_amount is not None:
+                    measure(scenario, contract_name, "bid", token_id,
+                            auction_house.bid(token_id).run(sender=alice, amount=bid_amount, now=sp.timestamp(10)))
+                measure(scenario, contract_name, "withdraw", token_id,
+                        auction_house.withdraw(token_id).run(sender=alice, now=sp.timestamp(AUCTION_END + 1)))
+
+            batch = list(range(2, 2 + batch_length))
+            params = [sp.record(token_address=cards.address, token_id=token_id, token_amount=1,
+                                end_timestamp=sp.timestamp(AUCTION_END), bid_amount=Source.MINIMAL_BID)
+                      for token_id in batch]
+            measure(scenario, contract_name, "create_auctions_batch", batch_length,
+                    auction_house.create_auctions_batch(params).run(sender=ADMIN, now=sp.timestamp(0)),
+                    params, sp.TList(Source.AuctionCreateRequest.get_type()))
+            for auction_id in range(2, 2 + batch_length):
+                scenario += auction_house.bid(auction_id).run(sender=alice, amount=sp.mutez(200000),
+                                                              now=sp.timestamp(10), show=False)
+            params = list(range(2, 2 + batch_length))
+            measure(scenario, contract_name, "withdraw_many", batch_length,
+                    auction_house.withdraw_many(params).run(sender=alice, now=sp.timestamp(AUCTION_END + 1)),
+                    params, sp.TList(sp.TNat))
+            scenario.verify(cards.data.ledger[Source.LedgerKey.make(alice.address, 2)] == 1)
+
+    @sp.add_test(name="Drop sales")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Drop sales")
+        scenario.p("One register_drop call sets up a 10,000 card drop; buy_from_drop is measured as the drop "
+                   "sells out. The cost per card should not depend on how many cards were sold before.")
+
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        cards = originate_cards(scenario, auction_house.address)
+        bob = sp.test_account("Bob")
+        params = sp.record(template_id=0, metadata={'': sp.utils.bytes_of_string("drop")}, price=SALE_PRICE,
+                           supply=10000, wallet_cap=10000)
+        measure(scenario, "CricTezCards", "register_drop", 10000,
+                cards.register_drop(params).run(sender=ADMIN), params, Source.Drop.get_request_type())
+
+        sold = 0
+        for checkpoint in [0] + STATE_SIZES:
+            # A filler wallet buys silently up to the checkpoint.
+            while sold < checkpoint:
+                quantity = min(BATCH_LENGTHS[-1], checkpoint - sold)
+                scenario += cards.buy_from_drop(drop_id=0, quantity=quantity).run(
+                    sender=bob, amount=sp.mutez(quantity*SALE_PRICE_MUTEZ), show=False)
+                sold += quantity
+            scenario.h2("{} cards sold".format(sold))
+            for quantity in BATCH_LENGTHS[:2]:
+                buyer = sp.test_account("Buyer {} {}".format(sold, quantity))
+                measure(scenario, "CricTezCards", "buy_from_drop", "{}x{}".format(sold, quantity),
+                        cards.buy_from_drop(drop_id=0, quantity=quantity).run(
+                            sender=buyer, amount=sp.mutez(quantity*SALE_PRICE_MUTEZ)))
+                sold += quantity
+
+        scenario.verify(cards.data.drops[0].sold == sold)
+        scenario.verify(cards.data.next_token_id == sold)
+
+    @sp.add_test(name="Lazy minting")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Lazy minting")
+        scenario.p("A primary sale as mint + list_card_on_marketplace + buy_card_from_marketplace against a single "
+                   "redeem_voucher call, at growing collection sizes. Only sold cards are ever minted.")
+
+        signer = sp.test_account("Voucher signer")
+        auction_house = Source.AuctionHouse()
+        scenario += auction_house
+        cards = originate_cards(scenario, auction_house.address, voucher_signer=signer.public_key)
+        alice = sp.test_account("Alice")
+
+        size = 0
+        for checkpoint in STATE_SIZES:
+            size = grow_to(scenario, cards, size, checkpoint)
+            scenario.h2("{} tokens".format(size))
+            measure(scenario, "CricTezCards", "mint", size, mint_card(cards, size, show=True))
+            measure(scenario, "CricTezCards", "list_card_on_marketplace", size,
+                    cards.list_card_on_marketplace(token_id=size, sale_price=SALE_PRICE).run(sender=ADMIN))
+            measure(scenario, "CricTezCards", "buy_card_from_marketplace", size,
+                    cards.buy_card_from_marketplace(token_id=size).run(sender=alice, amount=SALE_PRICE))
+            size += 1
+
+            voucher = sp.record(template_id=0, edition_no=size, metadata={'': sp.utils.bytes_of_string(str(size))},
+                                price=SALE_PRICE)
+            params = sp.record(voucher=voucher, signature=sp.make_signature(
+                signer.secret_key, Source.Voucher.get_payload(cards.address, voucher), message_format="Raw"))
+            measure(scenario, "CricTezCards", "redeem_voucher", size,
+                    cards.redeem_voucher(params).run(sender=alice, amount=SALE_PRICE),
+                    params, Source.Voucher.get_redeem_type())
+            size += 1
+
+        scenario.verify(cards.data.next_token_id == size)
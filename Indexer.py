@@ -0,0 +1,553 @@
+"""
+Off-chain indexer for CricTezCards and AuctionHouse.
+
+Consumes applied transactions in the JSON shape of an indexer API
+transaction list (one object per transaction, internal ones included, with
+the parameter already decoded into named record fields), decodes every call
+to the two contracts against the parameter types of Source.py and keeps an
+SQLite copy of ledger, listings, drops and auctions plus transfer, sale,
+bid and settlement history.
+
+Operations are applied one block at a time, each block in a single SQLite
+transaction that also moves the checkpoint, so an interrupted run resumes
+after the last complete block and replaying the same dump is a no-op.
+
+    python Simulator.py --steps 2000 --dump operations.json
+    python Indexer.py --db crictez.sqlite --cards KT1... --house KT1... operations.json
+
+Only the standard library is needed.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import sqlite3
+
+
+# Parameter schemas, mirroring the SmartPy types in Source.py: a dict is a
+# record, a one-element list a list of that type, a Variant one of its
+# cases.
+NAT = "nat"
+MUTEZ = "mutez"
+ADDRESS = "address"
+TIMESTAMP = "timestamp"
+STRING = "string"
+BOOL = "bool"
+BYTES_MAP = "bytes_map"
+
+
+class Variant(dict):
+    pass
+
+
+LEDGER_KEY = dict(owner=ADDRESS, token_id=NAT)
+TRANSFER_TX = dict(to_=ADDRESS, token_id=NAT, amount=NAT)
+BATCH_TRANSFER = [dict(from_=ADDRESS, txs=[TRANSFER_TX])]
+CARD_TEMPLATE = dict(player_id=NAT, year=NAT, card_type=NAT, ipfs_string=STRING)
+MINT_REQUEST = dict(metadata=BYTES_MAP, template_id=NAT, edition_no=NAT)
+MINT_BATCH_REQUEST = dict(template_id=NAT, editions=[dict(metadata=BYTES_MAP, edition_no=NAT)])
+LISTING_REQUEST = dict(token_id=NAT, sale_price=MUTEZ)
+OPERATOR_PARAM = dict(owner=ADDRESS, operator=ADDRESS, token_id=NAT)
+ALL_TOKENS_OPERATOR_PARAM = dict(owner=ADDRESS, operator=ADDRESS)
+TOKEN_LOCK_REQUEST = dict(owner=ADDRESS, token_id=NAT, amount=NAT)
+DROP_REQUEST = dict(template_id=NAT, metadata=BYTES_MAP, price=MUTEZ, supply=NAT, wallet_cap=NAT)
+DROP_PURCHASE = dict(drop_id=NAT, quantity=NAT)
+VOUCHER = dict(template_id=NAT, edition_no=NAT, metadata=BYTES_MAP, price=MUTEZ)
+AUCTION_CREATE_REQUEST = dict(token_address=ADDRESS, token_id=NAT, token_amount=NAT, end_timestamp=TIMESTAMP,
+                              bid_amount=MUTEZ)
+
+CARDS_ENTRY_POINTS = dict(
+    set_administrator=ADDRESS,
+    set_pause=BOOL,
+    register_card_template=CARD_TEMPLATE,
+    mint=MINT_REQUEST,
+    mint_batch=MINT_BATCH_REQUEST,
+    transfer=BATCH_TRANSFER,
+    list_card_on_marketplace=LISTING_REQUEST,
+    list_cards_batch=[LISTING_REQUEST],
+    withdraw_card_from_marketplace=dict(token_id=NAT),
+    withdraw_cards_batch=[NAT],
+    buy_card_from_marketplace=dict(token_id=NAT),
+    buy_cards_batch=[NAT],
+    intial_auction=dict(token_ids=[NAT]),
+    release_parked=dict(token_id=NAT, to_=ADDRESS),
+    register_drop=DROP_REQUEST,
+    buy_from_drop=DROP_PURCHASE,
+    set_voucher_signer=STRING,
+    redeem_voucher=dict(voucher=VOUCHER, signature=STRING),
+    lock_tokens=[TOKEN_LOCK_REQUEST],
+    update_operators=[Variant(add_operator=OPERATOR_PARAM, remove_operator=OPERATOR_PARAM)],
+    update_all_tokens_operators=[Variant(add_operator=ALL_TOKENS_OPERATOR_PARAM,
+                                         remove_operator=ALL_TOKENS_OPERATOR_PARAM)],
+)
+
+HOUSE_ENTRY_POINTS = dict(
+    create_auction=AUCTION_CREATE_REQUEST,
+    create_auctions_batch=[AUCTION_CREATE_REQUEST],
+    bid=NAT,
+    withdraw=NAT,
+    withdraw_many=[NAT],
+)
+
+# Same as AUCTION_EXTENSION_THRESHOLD in Source.py.
+AUCTION_EXTENSION_THRESHOLD = 60*5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    operation_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contract_state (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS card_templates (
+    template_id INTEGER PRIMARY KEY, player_id INTEGER, year INTEGER, card_type INTEGER, ipfs_string TEXT
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    token_id INTEGER PRIMARY KEY, template_id INTEGER, edition_no INTEGER, metadata TEXT, minted_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    owner TEXT NOT NULL, token_id INTEGER NOT NULL, balance INTEGER NOT NULL, PRIMARY KEY (owner, token_id)
+);
+CREATE INDEX IF NOT EXISTS ledger_token ON ledger (token_id);
+CREATE TABLE IF NOT EXISTS listings (
+    token_id INTEGER PRIMARY KEY, seller TEXT NOT NULL, sale_value INTEGER NOT NULL, listed_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS listings_seller ON listings (seller);
+CREATE TABLE IF NOT EXISTS operators (
+    owner TEXT NOT NULL, operator TEXT NOT NULL, token_id INTEGER, UNIQUE (owner, operator, token_id)
+);
+CREATE TABLE IF NOT EXISTS token_locks (token_id INTEGER PRIMARY KEY, locker TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS parked_tokens (token_id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS drops (
+    drop_id INTEGER PRIMARY KEY, template_id INTEGER, metadata TEXT, price INTEGER, supply INTEGER,
+    wallet_cap INTEGER, sold INTEGER NOT NULL, registered_at INTEGER, first_edition INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drop_purchases (
+    drop_id INTEGER NOT NULL, buyer TEXT NOT NULL, bought INTEGER NOT NULL, PRIMARY KEY (drop_id, buyer)
+);
+CREATE TABLE IF NOT EXISTS auctions (
+    auction_id INTEGER PRIMARY KEY, token_address TEXT, token_id INTEGER, token_amount INTEGER,
+    end_timestamp INTEGER, seller TEXT, bid_amount INTEGER, bidder TEXT, created_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS auctions_token ON auctions (token_address, token_id);
+CREATE INDEX IF NOT EXISTS auctions_seller ON auctions (seller);
+CREATE TABLE IF NOT EXISTS transfers (
+    operation_id INTEGER, timestamp INTEGER, from_ TEXT, to_ TEXT, token_id INTEGER, amount INTEGER
+);
+CREATE INDEX IF NOT EXISTS transfers_token ON transfers (token_id);
+CREATE TABLE IF NOT EXISTS sales (
+    operation_id INTEGER, timestamp INTEGER, token_id INTEGER, seller TEXT, buyer TEXT, price INTEGER
+);
+CREATE TABLE IF NOT EXISTS bids (
+    operation_id INTEGER, timestamp INTEGER, auction_id INTEGER, bidder TEXT, amount INTEGER
+);
+CREATE INDEX IF NOT EXISTS bids_auction ON bids (auction_id);
+CREATE TABLE IF NOT EXISTS settlements (
+    operation_id INTEGER, timestamp INTEGER, auction_id INTEGER, token_address TEXT, token_id INTEGER,
+    seller TEXT, winner TEXT, price INTEGER
+);
+"""
+
+
+class IndexerError(Exception):
+    pass
+
+
+def parse_timestamp(value):
+    if isinstance(value, int):
+        return value
+    if value.isdigit():
+        return int(value)
+    moment = datetime.datetime.strptime(value.replace("Z", "+00:00"), "%Y-%m-%dT%H:%M:%S%z")
+    return int(moment.timestamp())
+
+
+def decode(schema, value):
+    """ Decoded JSON parameter -> Python values (ints, strings, dicts, lists) following `schema`. """
+    if isinstance(schema, Variant):
+        if len(value) != 1 or list(value)[0] not in schema:
+            raise IndexerError("unknown variant {}".format(sorted(value)))
+        case, content = list(value.items())[0]
+        return case, decode(schema[case], content)
+    if isinstance(schema, dict):
+        missing = set(schema) - set(value)
+        if missing:
+            raise IndexerError("missing fields {}".format(sorted(missing)))
+        return {field: decode(field_schema, value[field]) for field, field_schema in schema.items()}
+    if isinstance(schema, list):
+        return [decode(schema[0], item) for item in value]
+    if schema in (NAT, MUTEZ):
+        return int(value)
+    if schema == TIMESTAMP:
+        return parse_timestamp(value)
+    if schema == BOOL:
+        return value in (True, "true", "True")
+    if schema == BYTES_MAP:
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+class Indexer:
+    def __init__(self, database, cards_address, house_address):
+        self.connection = sqlite3.connect(database)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self.cards_address = cards_address
+        self.house_address = house_address
+
+    def close(self):
+        self.connection.close()
+
+    # Checkpoint and counters
+
+    def checkpoint(self):
+        """ (operation_id, level, timestamp) of the last indexed block, or None. """
+        row = self.connection.execute("SELECT operation_id, level, timestamp FROM checkpoint").fetchone()
+        return tuple(row) if row is not None else None
+
+    def get_state(self, name, default=None):
+        row = self.connection.execute("SELECT value FROM contract_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set_state(self, name, value):
+        self.connection.execute("INSERT INTO contract_state (name, value) VALUES (?, ?) "
+                                "ON CONFLICT (name) DO UPDATE SET value = excluded.value", (name, str(value)))
+
+    def next_id(self, name):
+        value = int(self.get_state(name, 0))
+        self.set_state(name, value + 1)
+        return value
+
+    # Ingestion
+
+    def ingest(self, operations):
+        """
+        Applies `operations` (an iterable of transaction dicts in level
+        order) block by block, skipping everything up to the checkpoint.
+        Returns the number of transactions applied.
+        """
+        checkpoint = self.checkpoint()
+        last_operation_id = checkpoint[0] if checkpoint is not None else 0
+        applied = 0
+        for level, block in itertools.groupby(operations, key=lambda operation: operation["level"]):
+            block = [operation for operation in block if operation["id"] > last_operation_id]
+            if not block:
+                continue
+            with self.connection:
+                for operation in block:
+                    if operation.get("status", "applied") == "applied":
+                        applied += self.apply(operation)
+                last = block[-1]
+                self.connection.execute(
+                    "INSERT INTO checkpoint (id, operation_id, level, timestamp) VALUES (0, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET operation_id = excluded.operation_id, "
+                    "level = excluded.level, timestamp = excluded.timestamp",
+                    (last["id"], level, parse_timestamp(last["timestamp"])))
+            last_operation_id = block[-1]["id"]
+        return applied
+
+    def apply(self, operation):
+        target = operation["target"]["address"]
+        parameter = operation.get("parameter")
+        if parameter is None:
+            return 0
+        if target == self.cards_address:
+            entry_points = CARDS_ENTRY_POINTS
+        elif target == self.house_address:
+            entry_points = HOUSE_ENTRY_POINTS
+        else:
+            return 0
+        entry_point = parameter["entrypoint"]
+        if entry_point not in entry_points:
+            # balance_of and callbacks leave no state behind.
+            return 0
+        params = decode(entry_points[entry_point], parameter["value"])
+        context = dict(operation_id=operation["id"], sender=operation["sender"]["address"],
+                       amount=int(operation.get("amount", 0)), timestamp=parse_timestamp(operation["timestamp"]))
+        getattr(self, "apply_" + entry_point)(params, context)
+        return 1
+
+    # CricTezCards
+
+    def move_token(self, from_, to_, token_id, amount, context):
+        if from_ != to_:
+            balance = self.balance(from_, token_id)
+            if balance < amount:
+                raise IndexerError("operation {}: {} holds {} of token {}".format(
+                    context["operation_id"], from_, balance, token_id))
+            if balance == amount:
+                self.connection.execute("DELETE FROM ledger WHERE owner = ? AND token_id = ?", (from_, token_id))
+            else:
+                self.connection.execute("UPDATE ledger SET balance = ? WHERE owner = ? AND token_id = ?",
+                                        (balance - amount, from_, token_id))
+            self.credit(to_, token_id, amount)
+        self.connection.execute("INSERT INTO transfers VALUES (?, ?, ?, ?, ?, ?)",
+                                (context["operation_id"], context["timestamp"], from_, to_, token_id, amount))
+
+    def credit(self, owner, token_id, amount):
+        self.connection.execute("INSERT INTO ledger (owner, token_id, balance) VALUES (?, ?, ?) "
+                                "ON CONFLICT (owner, token_id) DO UPDATE SET balance = balance + excluded.balance",
+                                (owner, token_id, amount))
+
+    def delist(self, token_id):
+        self.connection.execute("DELETE FROM listings WHERE token_id = ?", (token_id,))
+
+    def mint_card(self, owner, template_id, edition, context):
+        token_id = self.next_id("next_token_id")
+        self.connection.execute("INSERT INTO tokens VALUES (?, ?, ?, ?, ?)", (
+            token_id, template_id, edition["edition_no"], edition["metadata"], context["timestamp"]))
+        self.credit(owner, token_id, 1)
+        self.connection.execute("INSERT INTO transfers VALUES (?, ?, NULL, ?, ?, 1)",
+                                (context["operation_id"], context["timestamp"], owner, token_id))
+
+    def list_card(self, token_id, sale_price, context):
+        self.connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)",
+                                (token_id, context["sender"], sale_price, context["timestamp"]))
+
+    def buy_card(self, token_id, context):
+        listing = self.connection.execute("SELECT seller, sale_value FROM listings WHERE token_id = ?",
+                                          (token_id,)).fetchone()
+        if listing is None:
+            raise IndexerError("operation {}: token {} is not listed".format(context["operation_id"], token_id))
+        self.move_token(listing["seller"], context["sender"], token_id, 1, context)
+        self.delist(token_id)
+        self.connection.execute("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?)", (
+            context["operation_id"], context["timestamp"], token_id, listing["seller"], context["sender"],
+            listing["sale_value"]))
+
+    def apply_set_administrator(self, params, context):
+        self.set_state("administrator", params)
+
+    def apply_set_pause(self, params, context):
+        self.set_state("paused", int(params))
+
+    def apply_register_card_template(self, params, context):
+        self.connection.execute("INSERT INTO card_templates VALUES (?, ?, ?, ?, ?)", (
+            self.next_id("next_template_id"), params["player_id"], params["year"], params["card_type"],
+            params["ipfs_string"]))
+
+    def apply_mint(self, params, context):
+        self.mint_card(context["sender"], params["template_id"], params, context)
+
+    def apply_mint_batch(self, params, context):
+        for edition in params["editions"]:
+            self.mint_card(context["sender"], params["template_id"], edition, context)
+
+    def apply_transfer(self, params, context):
+        for transfer in params:
+            for tx in transfer["txs"]:
+                if tx["amount"] > 0:
+                    # Only the locker can move a locked card, which releases it.
+                    self.connection.execute("DELETE FROM token_locks WHERE token_id = ?", (tx["token_id"],))
+                    self.move_token(transfer["from_"], tx["to_"], tx["token_id"], tx["amount"], context)
+                    if tx["to_"] != transfer["from_"]:
+                        self.delist(tx["token_id"])
+                    # The auction house hands back the card of an unsold initial auction.
+                    if tx["to_"] == self.cards_address and context["sender"] == self.house_address:
+                        self.connection.execute("INSERT OR IGNORE INTO parked_tokens VALUES (?)", (tx["token_id"],))
+
+    def apply_list_card_on_marketplace(self, params, context):
+        self.list_card(params["token_id"], params["sale_price"], context)
+
+    def apply_list_cards_batch(self, params, context):
+        for listing_request in params:
+            self.list_card(listing_request["token_id"], listing_request["sale_price"], context)
+
+    def apply_withdraw_card_from_marketplace(self, params, context):
+        self.delist(params["token_id"])
+
+    def apply_withdraw_cards_batch(self, params, context):
+        for token_id in params:
+            self.delist(token_id)
+
+    def apply_buy_card_from_marketplace(self, params, context):
+        self.buy_card(params["token_id"], context)
+
+    def apply_buy_cards_batch(self, params, context):
+        for token_id in params:
+            self.buy_card(token_id, context)
+
+    def set_operator(self, owner, operator, token_id, case):
+        # NULL token ids never compare equal in UNIQUE, so all-tokens rows are
+        # deleted before every insert.
+        self.connection.execute("DELETE FROM operators WHERE owner = ? AND operator = ? AND token_id IS ?",
+                                (owner, operator, token_id))
+        if case == "add_operator":
+            self.connection.execute("INSERT INTO operators VALUES (?, ?, ?)", (owner, operator, token_id))
+
+    def apply_update_operators(self, params, context):
+        for case, operator in params:
+            self.set_operator(operator["owner"], operator["operator"], operator["token_id"], case)
+
+    def apply_update_all_tokens_operators(self, params, context):
+        for case, operator in params:
+            self.set_operator(operator["owner"], operator["operator"], None, case)
+
+    def apply_lock_tokens(self, params, context):
+        for request in params:
+            self.connection.execute("INSERT INTO token_locks VALUES (?, ?)", (request["token_id"], context["sender"]))
+            self.delist(request["token_id"])
+
+    def apply_intial_auction(self, params, context):
+        # The auctions themselves arrive as the internal create_auctions_batch call.
+        for token_id in params["token_ids"]:
+            parked = self.connection.execute("DELETE FROM parked_tokens WHERE token_id = ?", (token_id,)).rowcount
+            if not parked:
+                self.move_token(context["sender"], self.cards_address, token_id, 1, context)
+            self.delist(token_id)
+
+    def apply_release_parked(self, params, context):
+        self.move_token(self.cards_address, params["to_"], params["token_id"], 1, context)
+        self.connection.execute("DELETE FROM parked_tokens WHERE token_id = ?", (params["token_id"],))
+
+    def apply_register_drop(self, params, context):
+        reserved = self.connection.execute("SELECT COALESCE(MAX(first_edition + supply - 1), 0) FROM drops "
+                                           "WHERE template_id = ?", (params["template_id"],)).fetchone()[0]
+        self.connection.execute("INSERT INTO drops VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)", (
+            self.next_id("next_drop_id"), params["template_id"], params["metadata"], params["price"],
+            params["supply"], params["wallet_cap"], context["timestamp"], reserved + 1))
+
+    def apply_buy_from_drop(self, params, context):
+        drop = self.drop(params["drop_id"])
+        if drop is None:
+            raise IndexerError("operation {}: unknown drop {}".format(context["operation_id"], params["drop_id"]))
+        first = drop["first_edition"] + drop["sold"]
+        for edition_no in range(first, first + params["quantity"]):
+            metadata = json.dumps(dict(json.loads(drop["metadata"]), edition_no=str(edition_no).encode().hex()),
+                                  sort_keys=True)
+            self.mint_card(context["sender"], drop["template_id"],
+                           dict(metadata=metadata, edition_no=edition_no), context)
+        self.connection.execute("UPDATE drops SET sold = sold + ? WHERE drop_id = ?",
+                                (params["quantity"], params["drop_id"]))
+        self.connection.execute("INSERT INTO drop_purchases (drop_id, buyer, bought) VALUES (?, ?, ?) "
+                                "ON CONFLICT (drop_id, buyer) DO UPDATE SET bought = bought + excluded.bought",
+                                (params["drop_id"], context["sender"], params["quantity"]))
+
+    def apply_set_voucher_signer(self, params, context):
+        self.set_state("voucher_signer", params)
+
+    def apply_redeem_voucher(self, params, context):
+        # Only applied redemptions reach the indexer, so the signature and
+        # replay checks have already passed on chain.
+        self.mint_card(context["sender"], params["voucher"]["template_id"], params["voucher"], context)
+
+    # AuctionHouse
+
+    def add_auction(self, request, context):
+        self.connection.execute("INSERT INTO auctions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            self.next_id("next_auction_id"), request["token_address"], request["token_id"],
+            request["token_amount"], request["end_timestamp"], context["sender"], request["bid_amount"],
+            context["sender"], context["timestamp"]))
+
+    def settle_auction(self, auction_id, context):
+        auction = self.auction(auction_id)
+        if auction is None:
+            raise IndexerError("operation {}: auction {} is unknown".format(context["operation_id"], auction_id))
+        # The token moves back out in the internal transfer call that follows.
+        self.connection.execute("INSERT INTO settlements VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (
+            context["operation_id"], context["timestamp"], auction_id, auction["token_address"],
+            auction["token_id"], auction["seller"], auction["bidder"], auction["bid_amount"]))
+        self.connection.execute("DELETE FROM auctions WHERE auction_id = ?", (auction_id,))
+
+    def apply_create_auction(self, params, context):
+        self.add_auction(params, context)
+
+    def apply_create_auctions_batch(self, params, context):
+        for request in params:
+            self.add_auction(request, context)
+
+    def apply_bid(self, params, context):
+        auction = self.auction(params)
+        if auction is None:
+            raise IndexerError("operation {}: auction {} is unknown".format(context["operation_id"], params))
+        end_timestamp = auction["end_timestamp"]
+        if end_timestamp - context["timestamp"] < AUCTION_EXTENSION_THRESHOLD:
+            end_timestamp = context["timestamp"] + AUCTION_EXTENSION_THRESHOLD
+        self.connection.execute("UPDATE auctions SET bidder = ?, bid_amount = ?, end_timestamp = ? "
+                                "WHERE auction_id = ?", (context["sender"], context["amount"], end_timestamp, params))
+        self.connection.execute("INSERT INTO bids VALUES (?, ?, ?, ?, ?)", (
+            context["operation_id"], context["timestamp"], params, context["sender"], context["amount"]))
+
+    def apply_withdraw(self, params, context):
+        self.settle_auction(params, context)
+
+    def apply_withdraw_many(self, params, context):
+        for auction_id in params:
+            self.settle_auction(auction_id, context)
+
+    # Queries
+
+    def balance(self, owner, token_id):
+        row = self.connection.execute("SELECT balance FROM ledger WHERE owner = ? AND token_id = ?",
+                                      (owner, token_id)).fetchone()
+        return row[0] if row is not None else 0
+
+    def tokens_of(self, owner):
+        return [row[0] for row in self.connection.execute(
+            "SELECT token_id FROM ledger WHERE owner = ? ORDER BY token_id", (owner,))]
+
+    def owners_of(self, token_id):
+        return [row[0] for row in self.connection.execute(
+            "SELECT owner FROM ledger WHERE token_id = ? ORDER BY owner", (token_id,))]
+
+    def operators_of(self, owner):
+        """ (operator, token_id) pairs; token_id None for all-tokens operators. """
+        return [tuple(row) for row in self.connection.execute(
+            "SELECT operator, token_id FROM operators WHERE owner = ? ORDER BY operator, token_id", (owner,))]
+
+    def locker_of(self, token_id):
+        row = self.connection.execute("SELECT locker FROM token_locks WHERE token_id = ?", (token_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def listing(self, token_id):
+        row = self.connection.execute("SELECT * FROM listings WHERE token_id = ?", (token_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def listings(self, seller=None):
+        if seller is None:
+            rows = self.connection.execute("SELECT * FROM listings ORDER BY token_id")
+        else:
+            rows = self.connection.execute("SELECT * FROM listings WHERE seller = ? ORDER BY token_id", (seller,))
+        return [dict(row) for row in rows]
+
+    def drop(self, drop_id):
+        row = self.connection.execute("SELECT * FROM drops WHERE drop_id = ?", (drop_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def auction(self, auction_id):
+        row = self.connection.execute("SELECT * FROM auctions WHERE auction_id = ?", (auction_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def live_auctions(self, now):
+        return [dict(row) for row in self.connection.execute(
+            "SELECT * FROM auctions WHERE end_timestamp >= ? ORDER BY end_timestamp", (now,))]
+
+    def token_history(self, token_id):
+        return [dict(row) for row in self.connection.execute(
+            "SELECT * FROM transfers WHERE token_id = ? ORDER BY operation_id", (token_id,))]
+
+
+def read_operations(path):
+    """ A JSON array of transactions, or one transaction per line. """
+    with open(path) as dump:
+        content = dump.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index CricTezCards / AuctionHouse operations into SQLite.")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--cards", required=True, help="CricTezCards address")
+    parser.add_argument("--house", required=True, help="AuctionHouse address")
+    parser.add_argument("dumps", nargs="+", help="JSON operation dumps, oldest first")
+    arguments = parser.parse_args()
+    indexer = Indexer(arguments.db, arguments.cards, arguments.house)
+    for path in arguments.dumps:
+        print("{}: {} calls indexed".format(path, indexer.ingest(read_operations(path))))
+    checkpoint = indexer.checkpoint()
+    if checkpoint is not None:
+        print("checkpoint: operation {}, level {}".format(*checkpoint[:2]))
+    indexer.close()
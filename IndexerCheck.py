@@ -0,0 +1,111 @@
+"""
+Differential check of Indexer.py against the reference model.
+
+Generates a ScenarioGenerator run for each configuration below, dumps its
+applied operations with operation_dump, ingests them in two halves (the
+second ingest resumes from the checkpoint, a third one must be a no-op)
+and compares the indexed tables with the model's storage.
+
+    python IndexerCheck.py --steps 3000
+
+Exits with status 1 and names the first table that differs.
+"""
+import argparse
+import json
+import sys
+
+import Indexer
+import Simulator
+
+
+CONFIGURATIONS = [
+    ("default", 3, dict()),
+    ("owner index, pull payments", 4, dict(owner_index=True, pull_payments=True)),
+    ("escrow-free", 5, dict(escrow_free=True)),
+]
+
+
+def query(indexer, sql):
+    return indexer.connection.execute(sql).fetchall()
+
+
+def compare(indexer, generator):
+    """ (table, indexed, model) for every table that differs from the model. """
+    cards = generator.cards.storage
+    house = generator.house.storage
+    tables = [
+        ("ledger",
+         {(row["owner"], row["token_id"]): row["balance"] for row in query(indexer, "SELECT * FROM ledger")},
+         cards["ledger"]),
+        ("tokens",
+         {row["token_id"]: dict(template_id=row["template_id"], edition_no=row["edition_no"])
+          for row in query(indexer, "SELECT * FROM tokens")},
+         cards["tokens"]),
+        ("listings",
+         {row["token_id"]: dict(seller=row["seller"], sale_value=row["sale_value"])
+          for row in query(indexer, "SELECT * FROM listings")},
+         generator.cards.listings()),
+        ("token_locks",
+         {row["token_id"]: row["locker"] for row in query(indexer, "SELECT * FROM token_locks")},
+         {token_id: state["in_auction"]["locker"] for token_id, state in cards["token_states"].items()
+          if "in_auction" in state}),
+        ("parked_tokens",
+         {row["token_id"]: True for row in query(indexer, "SELECT * FROM parked_tokens")},
+         cards["parked_tokens"]),
+        ("operators",
+         {(row["owner"], row["operator"], row["token_id"]): True for row in query(indexer, "SELECT * FROM operators")},
+         cards["operators"]),
+        ("drops",
+         {row["drop_id"]: dict(sold=row["sold"], first_edition=row["first_edition"])
+          for row in query(indexer, "SELECT * FROM drops")},
+         {drop_id: dict(sold=drop["sold"], first_edition=drop["first_edition"])
+          for drop_id, drop in cards["drops"].items()}),
+        ("token_metadata",
+         {row["token_id"]: json.loads(row["metadata"]) for row in query(indexer, "SELECT * FROM tokens")},
+         {token_id: {key: value.encode().hex() for key, value in entry["token_info"].items()}
+          for token_id, entry in cards["token_metadata"].items()}),
+        ("drop_purchases",
+         {(row["drop_id"], row["buyer"]): row["bought"] for row in query(indexer, "SELECT * FROM drop_purchases")},
+         cards["drop_purchases"]),
+        ("auctions",
+         {row["auction_id"]: {field: row[field] for field in ("token_address", "token_id", "token_amount",
+                                                              "end_timestamp", "seller", "bid_amount", "bidder")}
+          for row in query(indexer, "SELECT * FROM auctions")},
+         house["auctions"]),
+    ]
+    return [(table, indexed, model) for table, indexed, model in tables if indexed != model]
+
+
+def check(name, seed, options, steps):
+    generator = Simulator.ScenarioGenerator(seed=seed, **options)
+    for _ in generator.steps(steps):
+        pass
+    # Round-trip through JSON, as a real dump would be read back.
+    operations = json.loads(json.dumps(Simulator.operation_dump(generator.network)))
+    indexer = Indexer.Indexer(":memory:", generator.cards.address, generator.house.address)
+    half = len(operations) // 2
+    applied = indexer.ingest(operations[:half]) + indexer.ingest(operations)
+    replayed = indexer.ingest(operations)
+    failures = compare(indexer, generator)
+    if replayed:
+        failures.append(("checkpoint", replayed, 0))
+    print("{}: {} operations, {} calls indexed, {} tokens, {} auctions".format(
+        name, len(operations), applied, len(generator.cards.storage["ledger"]),
+        len(generator.house.storage["auctions"])))
+    indexer.close()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check Indexer.py against the reference model.")
+    parser.add_argument("--steps", type=int, default=3000)
+    arguments = parser.parse_args()
+    for name, seed, options in CONFIGURATIONS:
+        failures = check(name, seed, options, arguments.steps)
+        for table, indexed, model in failures:
+            print("{}: {} differs from the model ({} indexed entries, {} in the model)".format(
+                name, table, indexed if isinstance(indexed, int) else len(indexed),
+                model if isinstance(model, int) else len(model)))
+        if failures:
+            sys.exit(1)
+    print("ok")
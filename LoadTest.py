@@ -0,0 +1,176 @@
+"""
+Randomized load test for CricTezCards and AuctionHouse.
+
+Replays a ScenarioGenerator run (see Simulator.py) through the SmartPy
+harness. Every call is announced by a heading of the form
+
+    load <step> <contract> <entry_point>
+
+followed by the big_map entries the call adds or removes, and runs with the
+outcome the reference model predicts: calls the model rejects run with
+valid=False and, when the contract fails with one of its own error
+messages, the expected message. Every CHECKPOINT_INTERVAL steps the
+scenario prints the big_map sizes and checks the counters and a sample of
+ledger and marketplace entries, the drop counters and the last balance_of
+answer against the model.
+"""
+import random
+
+import smartpy as sp
+
+Source = sp.io.import_script_from_url("file:Source.py")
+Simulator = sp.io.import_script_from_url("file:Simulator.py")
+
+METADATA_URL = "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"
+CHECKPOINT_INTERVAL = 250
+SAMPLE_SIZE = 20
+
+MUTEZ_FIELDS = ["sale_price", "bid_amount", "price"]
+TIMESTAMP_FIELDS = ["end_timestamp"]
+STRING_FIELDS = ["ipfs_string"]
+VARIANTS = ["add_operator", "remove_operator"]
+ERROR_PREFIXES = [Source.FA2ErrorMessage.PREFIX, Source.CricTezErrorMessage.PREFIX, Source.AuctionErrorMessage.PREFIX]
+
+
+def address_of(address, contracts):
+    if address in contracts:
+        return contracts[address].address
+    return sp.address(address)
+
+
+def to_smartpy(value, contracts, field=None):
+    """ Model parameter (dicts, lists, ints, strings) -> SmartPy expression. """
+    if field in MUTEZ_FIELDS:
+        return sp.mutez(value)
+    if field in TIMESTAMP_FIELDS:
+        return sp.timestamp(value)
+    if field in STRING_FIELDS:
+        return value
+    if field == "metadata":
+        return {key: sp.utils.bytes_of_string(content) for key, content in value.items()}
+    if isinstance(value, dict) and len(value) == 1 and list(value)[0] in VARIANTS:
+        variant, content = list(value.items())[0]
+        return sp.variant(variant, to_smartpy(content, contracts))
+    if isinstance(value, dict):
+        return sp.record(**{key: to_smartpy(item, contracts, key) for key, item in value.items()})
+    if isinstance(value, list):
+        return [to_smartpy(item, contracts, field) for item in value]
+    if isinstance(value, str):
+        return address_of(value, contracts)
+    return value
+
+
+def voucher_params(params, destination, contracts, signers):
+    """
+    The model signs vouchers with keyed hashes; sign the same voucher again
+    with the test account whose name keyed the model signature.
+    """
+    voucher = to_smartpy(params["voucher"], contracts)
+    payload = Simulator.voucher_payload(destination, params["voucher"])
+    signer = [account for name, account in signers.items() if Simulator.sign(name, payload) == params["signature"]][0]
+    signature = sp.make_signature(signer.secret_key, Source.Voucher.get_payload(
+        contracts[destination].address, voucher), message_format="Raw")
+    return sp.record(voucher=voucher, signature=signature)
+
+
+def replay(scenario, step, contracts, names, signers):
+    scenario.h3("load {} {} {}".format(step.index, names[step.destination], step.entry_point))
+    if step.growth:
+        scenario.p(", ".join("{} {:+d}".format(field, change) for field, change in sorted(step.growth.items())))
+    entry_point = getattr(contracts[step.destination], step.entry_point)
+    if step.params is None:
+        call = entry_point()
+    elif step.entry_point == "redeem_voucher":
+        call = entry_point(voucher_params(step.params, step.destination, contracts, signers))
+    elif step.entry_point == "balance_of":
+        address, callback_entry_point = step.params["callback"]
+        callback = sp.contract(Source.BalanceOfRequest.get_response_type(), contracts[address].address,
+                               entry_point=callback_entry_point).open_some()
+        call = entry_point(requests=to_smartpy(step.params["requests"], contracts), callback=callback)
+    else:
+        call = entry_point(to_smartpy(step.params, contracts))
+    sender = sp.address(step.sender)
+    run_arguments = dict(sender=sender, source=sender, amount=sp.mutez(step.amount), now=sp.timestamp(step.now))
+    if step.error is not None:
+        run_arguments["valid"] = False
+        if any(step.error.startswith(prefix) for prefix in ERROR_PREFIXES):
+            run_arguments["exception"] = step.error
+    scenario += call.run(**run_arguments)
+
+
+def check_against_model(scenario, generator, cards, auction_house, contracts, sample):
+    scenario.h2("checkpoint after {} calls".format(generator.index))
+    scenario.p(", ".join("{} {}".format(field, size) for field, size in sorted(generator.storage_sizes().items())))
+    scenario.verify(cards.data.next_token_id == generator.cards.storage["next_token_id"])
+    scenario.verify(auction_house.data.next_auction_id == generator.house.storage["next_auction_id"])
+    scenario.verify(cards.data.next_drop_id == generator.cards.storage["next_drop_id"])
+    for drop_id, drop in generator.cards.storage["drops"].items():
+        scenario.verify(cards.data.drops[drop_id].sold == drop["sold"])
+    ledger = generator.cards.storage["ledger"]
+    for owner, token_id in sample.sample(list(ledger), min(SAMPLE_SIZE, len(ledger))):
+        scenario.verify(cards.data.ledger[Source.LedgerKey.make(
+            address_of(owner, contracts), token_id)] == ledger[(owner, token_id)])
+    listings = generator.cards.listings()
+    for token_id in sample.sample(sorted(listings), min(SAMPLE_SIZE, len(listings))):
+        scenario.verify(cards.data.token_states[token_id].open_variant("listed").sale_value ==
+                        sp.mutez(listings[token_id]["sale_value"]))
+    last_responses = generator.receiver.storage.get("last_responses")
+    if last_responses is not None:
+        scenario.verify_equal(contracts[generator.receiver.address].data.last_responses,
+                              to_smartpy(last_responses, contracts))
+
+
+def run_load(scenario, step_count, seed=0, owner_index=False, pull_payments=False, escrow_free=False):
+    generator = Simulator.ScenarioGenerator(seed=seed, owner_index=owner_index, pull_payments=pull_payments,
+                                            escrow_free=escrow_free)
+    signers = {name: sp.test_account(name) for name in [Simulator.VOUCHER_SIGNER, Simulator.VOUCHER_FORGER]}
+    auction_house = Source.AuctionHouse(pull_payments=pull_payments, escrow_free=escrow_free)
+    scenario += auction_house
+    cards = Source.CricTezCards(
+        admin=sp.address(generator.admin),
+        metadata=sp.utils.metadata_of_url(METADATA_URL),
+        initial_auction_house_address=auction_house.address,
+        owner_index=owner_index,
+        voucher_signer=signers[Simulator.VOUCHER_SIGNER].public_key)
+    scenario += cards
+    receiver = Source.BalanceOfReceiver()
+    scenario += receiver
+    contracts = {generator.cards.address: cards, generator.house.address: auction_house,
+                 generator.receiver.address: receiver}
+    names = {generator.cards.address: "CricTezCards", generator.house.address: "AuctionHouse",
+             generator.receiver.address: "BalanceOfReceiver"}
+    sample = random.Random(seed)
+
+    steps = []
+    for step in generator.steps(step_count):
+        steps.append(step)
+        replay(scenario, step, contracts, names, signers)
+        if step.index % CHECKPOINT_INTERVAL == CHECKPOINT_INTERVAL - 1:
+            check_against_model(scenario, generator, cards, auction_house, contracts, sample)
+    check_against_model(scenario, generator, cards, auction_house, contracts, sample)
+    scenario.h2("Summary")
+    for line in Simulator.summarize(generator, steps):
+        scenario.p(line)
+
+
+if "templates" not in __name__:
+    @sp.add_test(name="Randomized load")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Randomized load")
+        scenario.p("Interleaved mints, drop sales, voucher redemptions, transfers, listings, purchases, bids "
+                   "and withdrawals over about a day of simulated time, checked call by call against the "
+                   "reference model.")
+        run_load(scenario, 2000)
+
+    @sp.add_test(name="Randomized load, owner index and pull payments")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Randomized load, owner index and pull payments")
+        run_load(scenario, 1000, seed=1, owner_index=True, pull_payments=True)
+
+    @sp.add_test(name="Randomized load, escrow-free auctions")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Randomized load, escrow-free auctions")
+        run_load(scenario, 1000, seed=2, escrow_free=True)
@@ -0,0 +1,1280 @@
+"""
+Pure-Python reference model of CricTezCards and AuctionHouse.
+
+The model follows the entry points of Source.py one to one (same checks in
+the same order, same error strings, same storage field names) but needs no
+SmartPy toolchain, so large randomized runs take seconds. A failing call
+raises ContractError and every storage change made by the operation group
+is rolled back, as on chain.
+
+    network = Network()
+    house = network.originate(AuctionHouseModel())
+    cards = network.originate(CricTezCardsModel(ADMIN, house.address))
+    network.call(ADMIN, cards.address, "register_card_template", {...}, now=0)
+
+Amounts are mutez and timestamps are seconds, both as plain ints.
+
+ScenarioGenerator drives the model with a reproducible random stream of
+mints, transfers, marketplace and auction traffic; LoadTest.py replays that
+stream through the SmartPy harness. Run this file directly for a quick
+summary of a generated run:
+
+    python Simulator.py --steps 5000 --seed 7 --dump operations.json
+
+--dump also writes every applied transaction as JSON, the input format of
+Indexer.py.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import random
+
+
+INITIAL_BID = 900000
+MINIMAL_BID = 100000
+INITIAL_AUCTION_DURATION = 24*5*3600
+MINIMAL_AUCTION_DURATION = 1*3600
+MAXIMAL_AUCTION_DURATION = 24*7*3600
+THRESHOLD_ADDRESS = "tz3jfebmewtfXYD1Xef34TwrfMg2rrrw6oum"
+DEFAULT_ADDRESS = "tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9"
+AUCTION_EXTENSION_THRESHOLD = 60*5
+BID_STEP_THRESHOLD = 100000
+MAXIMAL_AUCTIONS_PER_SELLER = 500
+
+CARD_TYPE_NAMES = ["Standard", "Limited", "Rare", "Legendary"]
+
+
+class FA2ErrorMessage:
+    PREFIX = "FA2_"
+    TOKEN_UNDEFINED = "{}TOKEN_UNDEFINED".format(PREFIX)
+    INSUFFICIENT_BALANCE = "{}INSUFFICIENT_BALANCE".format(PREFIX)
+    NOT_OWNER = "{}NOT_OWNER".format(PREFIX)
+    NOT_OPERATOR = "{}NOT_OPERATOR".format(PREFIX)
+
+
+class CricTezErrorMessage:
+    PREFIX = "CricTez_"
+    CONTRACT_IS_PAUSED = "{}CONTRACT_IS_PAUSED".format(PREFIX)
+    MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO = "{}MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO".format(
+        PREFIX)
+    INCORRECT_PURCHASE_VALUE = "{}INCORRECT_PURCHASE_VALUE".format(PREFIX)
+    TEMPLATE_UNDEFINED = "{}TEMPLATE_UNDEFINED".format(PREFIX)
+    UNKNOWN_CARD_TYPE = "{}UNKNOWN_CARD_TYPE".format(PREFIX)
+    TOKEN_LOCKED = "{}TOKEN_LOCKED".format(PREFIX)
+    DROP_UNDEFINED = "{}DROP_UNDEFINED".format(PREFIX)
+    DROP_SOLD_OUT = "{}DROP_SOLD_OUT".format(PREFIX)
+    WALLET_CAP_EXCEEDED = "{}WALLET_CAP_EXCEEDED".format(PREFIX)
+    BAD_VOUCHER_SIGNATURE = "{}BAD_VOUCHER_SIGNATURE".format(PREFIX)
+    VOUCHER_ALREADY_REDEEMED = "{}VOUCHER_ALREADY_REDEEMED".format(PREFIX)
+
+
+class AuctionErrorMessage:
+    PREFIX = "AUC_"
+    SELLER_CANNOT_BID = "{}SELLER_CANNOT_BID".format(PREFIX)
+    BID_AMOUNT_TOO_LOW = "{}BID_AMOUNT_TOO_LOW".format(PREFIX)
+    AUCTION_IS_OVER = "{}AUCTION_IS_OVER".format(PREFIX)
+    AUCTION_IS_ONGOING = "{}AUCTION_IS_ONGOING".format(PREFIX)
+    TOKEN_AMOUNT_TOO_LOW = "{}TOKEN_AMOUNT_TOO_LOW".format(PREFIX)
+    END_DATE_TOO_SOON = "{}END_DATE_TOO_SOON".format(PREFIX)
+    END_DATE_TOO_LATE = "{}END_DATE_TOO_LATE".format(PREFIX)
+    NO_PENDING_REFUND = "{}NO_PENDING_REFUND".format(PREFIX)
+    AUCTION_UNDEFINED = "{}AUCTION_UNDEFINED".format(PREFIX)
+    SELLER_AUCTION_LIMIT_REACHED = "{}SELLER_AUCTION_LIMIT_REACHED".format(
+        PREFIX)
+    TOKEN_ALREADY_IN_AUCTION = "{}TOKEN_ALREADY_IN_AUCTION".format(PREFIX)
+
+
+# Raised by the model where the Michelson code fails without a message of
+# its own (missing big_map key, missing entry point, failed sp.send...).
+MISSING_KEY = "MISSING_KEY"
+BAD_CONTRACT = "BAD_CONTRACT"
+
+
+class ContractError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def verify(condition, message):
+    if not condition:
+        raise ContractError(message)
+
+
+_ADDRESS_KINDS = {"tz1": 0, "tz2": 1, "tz3": 2, "KT1": 3}
+
+
+def address_key(address):
+    """ Sort key matching Michelson address comparison. """
+    return (_ADDRESS_KINDS.get(address[:3], len(_ADDRESS_KINDS)), address)
+
+
+def is_implicit(address):
+    return address[:2] == "tz"
+
+
+_BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_TZ1_PREFIX = bytes([6, 161, 159])
+
+
+def implicit_address(name):
+    """ A valid, deterministic tz1 address for a test user called `name`. """
+    payload = _TZ1_PREFIX + hashlib.sha256(name.encode()).digest()[:20]
+    payload += hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(payload, "big")
+    encoded = ""
+    while number:
+        number, digit = divmod(number, 58)
+        encoded = _BASE58_ALPHABET[digit] + encoded
+    return encoded
+
+
+def voucher_payload(contract_address, voucher):
+    """ Stand-in for pack((contract address, voucher)): canonical JSON bytes. """
+    return json.dumps([contract_address, voucher], sort_keys=True).encode()
+
+
+def sign(key, payload):
+    """
+    Stand-in for an ed25519 signature: a hash of `payload` keyed with the
+    signer's name. The model only needs signatures to match or not;
+    LoadTest.py re-signs with real test account keys.
+    """
+    return hashlib.blake2b(payload, key=key.encode()).hexdigest()
+
+
+class Journal:
+    """ Undo log shared by every model taking part in an operation group. """
+
+    _MISSING = object()
+    _APPENDED = object()
+
+    def __init__(self):
+        self.entries = []
+
+    def set(self, mapping, key, value):
+        self.entries.append((mapping, key, mapping.get(key, Journal._MISSING)))
+        mapping[key] = value
+
+    def delete(self, mapping, key):
+        self.entries.append((mapping, key, mapping[key]))
+        del mapping[key]
+
+    def append(self, sequence, item):
+        self.entries.append((sequence, None, Journal._APPENDED))
+        sequence.append(item)
+
+    def rollback(self):
+        for mapping, key, value in reversed(self.entries):
+            if value is Journal._APPENDED:
+                mapping.pop()
+            elif value is Journal._MISSING:
+                mapping.pop(key, None)
+            else:
+                mapping[key] = value
+        self.entries = []
+
+    def commit(self):
+        self.entries = []
+
+
+class Context:
+    def __init__(self, sender, source, amount, now, self_address):
+        self.sender = sender
+        self.source = source
+        self.amount = amount
+        self.now = now
+        self.self_address = self_address
+
+
+class Operation:
+    """ An internal operation emitted by an entry point. """
+
+    def __init__(self, destination, amount=0, entry_point=None, params=None):
+        self.destination = destination
+        self.amount = amount
+        self.entry_point = entry_point
+        self.params = params
+
+
+class Model:
+    ENTRY_POINTS = ()
+
+    def __init__(self):
+        self.address = None
+        self.network = None
+        self.storage = {}
+
+    @property
+    def journal(self):
+        return self.network.journal
+
+    def set(self, key, value, mapping=None):
+        self.journal.set(self.storage if mapping is None else mapping, key, value)
+
+    def delete(self, key, mapping):
+        self.journal.delete(mapping, key)
+
+    def emit(self, tag, payload):
+        self.network.emit(self.address, tag, payload)
+
+    def dispatch(self, entry_point, params, context):
+        verify(entry_point in self.ENTRY_POINTS, BAD_CONTRACT)
+        operations = []
+        getattr(self, entry_point)(params, context, operations)
+        return operations
+
+
+class CricTezCardsModel(Model):
+    ENTRY_POINTS = ("set_administrator", "set_pause", "register_card_template", "mint", "mint_batch",
+                    "transfer", "list_card_on_marketplace", "list_cards_batch", "withdraw_card_from_marketplace",
+                    "withdraw_cards_batch", "buy_card_from_marketplace", "buy_cards_batch", "balance_of",
+                    "update_operators", "update_all_tokens_operators", "lock_tokens", "intial_auction",
+                    "release_parked", "register_drop", "buy_from_drop")
+
+    def __init__(self, admin, initial_auction_house_address, owner_index=False, voucher_signer=None):
+        super().__init__()
+        self.owner_index = owner_index
+        self.storage = dict(
+            ledger={},
+            token_metadata={},
+            paused=False,
+            administrator=admin,
+            next_token_id=0,
+            tokens={},
+            card_templates={},
+            next_template_id=0,
+            # (owner, operator, token_id) -> True; token_id None for all tokens.
+            operators={},
+            # token_id -> {"listed": {seller, sale_value}} or {"in_auction": {locker, owner}}.
+            token_states={},
+            drops={},
+            next_drop_id=0,
+            # (drop_id, buyer) -> cards bought.
+            drop_purchases={},
+            # template_id -> editions already reserved by drops.
+            template_editions={},
+            initial_auction_house_address=initial_auction_house_address,
+            # token_id -> True for cards the initial auction house handed back unsold.
+            parked_tokens={},
+        )
+        if owner_index:
+            self.storage.update(owner_token_count={}, owner_tokens={}, owner_token_index={})
+        if voucher_signer is not None:
+            # voucher_hash -> True.
+            self.storage.update(voucher_signer=voucher_signer, redeemed_vouchers={})
+            self.ENTRY_POINTS = CricTezCardsModel.ENTRY_POINTS + ("set_voucher_signer", "redeem_voucher")
+
+    # Helpers
+
+    def verify_not_paused(self):
+        verify(not self.storage["paused"], CricTezErrorMessage.CONTRACT_IS_PAUSED)
+
+    def verify_administrator(self, sender):
+        verify(sender == self.storage["administrator"], FA2ErrorMessage.NOT_OWNER)
+
+    def is_token_defined(self, token_id):
+        return token_id < self.storage["next_token_id"]
+
+    def index_add_token(self, owner, token_id):
+        count = self.storage["owner_token_count"].get(owner, 0)
+        self.set((owner, count), token_id, self.storage["owner_tokens"])
+        self.set((owner, token_id), count, self.storage["owner_token_index"])
+        self.set(owner, count + 1, self.storage["owner_token_count"])
+
+    def index_remove_token(self, owner, token_id):
+        index = self.storage["owner_token_index"][(owner, token_id)]
+        last = self.storage["owner_token_count"][owner] - 1
+        if index != last:
+            last_token_id = self.storage["owner_tokens"][(owner, last)]
+            self.set((owner, index), last_token_id, self.storage["owner_tokens"])
+            self.set((owner, last_token_id), index, self.storage["owner_token_index"])
+        self.delete((owner, last), self.storage["owner_tokens"])
+        self.delete((owner, token_id), self.storage["owner_token_index"])
+        if last == 0:
+            self.delete(owner, self.storage["owner_token_count"])
+        else:
+            self.set(owner, last, self.storage["owner_token_count"])
+
+    def mint_card(self, owner, token_id, template_id, edition):
+        self.set((owner, token_id), 1, self.storage["ledger"])
+        if self.owner_index:
+            self.index_add_token(owner, token_id)
+        self.set(token_id, dict(token_id=token_id, token_info=edition["metadata"]), self.storage["token_metadata"])
+        self.set(token_id, dict(template_id=template_id, edition_no=edition["edition_no"]), self.storage["tokens"])
+
+    def move_token(self, from_, to_, token_id, amount):
+        ledger = self.storage["ledger"]
+        from_balance = ledger.get((from_, token_id), 0)
+        verify(from_balance >= amount, FA2ErrorMessage.INSUFFICIENT_BALANCE)
+        if to_ != from_:
+            if from_balance == amount:
+                self.delete((from_, token_id), ledger)
+                if self.owner_index:
+                    self.index_remove_token(from_, token_id)
+            else:
+                self.set((from_, token_id), from_balance - amount, ledger)
+            to_balance = ledger.get((to_, token_id), 0)
+            self.set((to_, token_id), to_balance + amount, ledger)
+            if self.owner_index and to_balance == 0:
+                self.index_add_token(to_, token_id)
+
+    def can_transfer_all_from(self, from_, context):
+        return (context.sender == from_ or (from_, context.sender, None) in self.storage["operators"] or
+                (from_ == context.self_address and
+                 context.sender == self.storage["initial_auction_house_address"]))
+
+    def set_operator(self, owner, operator, token_id, add, context):
+        verify(owner == context.sender, FA2ErrorMessage.NOT_OWNER)
+        if add:
+            self.set((owner, operator, token_id), True, self.storage["operators"])
+        elif (owner, operator, token_id) in self.storage["operators"]:
+            self.delete((owner, operator, token_id), self.storage["operators"])
+
+    def listings(self):
+        """ token_id -> listing of every card currently on the marketplace. """
+        return {token_id: state["listed"] for token_id, state in self.storage["token_states"].items()
+                if "listed" in state}
+
+    def lock_of(self, token_id):
+        return self.storage["token_states"].get(token_id, {}).get("in_auction")
+
+    def verify_not_in_auction(self, token_id):
+        verify(self.lock_of(token_id) is None, CricTezErrorMessage.TOKEN_LOCKED)
+
+    def list_card(self, seller, token_id, sale_price):
+        verify(self.is_token_defined(token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        verify(sale_price > 0, CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+        verify((seller, token_id) in self.storage["ledger"], FA2ErrorMessage.NOT_OWNER)
+        self.verify_not_in_auction(token_id)
+        self.set(token_id, {"listed": dict(seller=seller, sale_value=sale_price)}, self.storage["token_states"])
+
+    def withdraw_card(self, seller, token_id):
+        verify(self.is_token_defined(token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        verify("listed" in self.storage["token_states"].get(token_id, {}), FA2ErrorMessage.TOKEN_UNDEFINED)
+        verify((seller, token_id) in self.storage["ledger"], FA2ErrorMessage.NOT_OWNER)
+        self.delete(token_id, self.storage["token_states"])
+
+    def buy_card(self, buyer, token_id):
+        verify(self.is_token_defined(token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        listing = self.storage["token_states"].get(token_id, {}).get("listed")
+        verify(listing is not None, FA2ErrorMessage.TOKEN_UNDEFINED)
+        self.move_token(listing["seller"], buyer, token_id, 1)
+        self.delete(token_id, self.storage["token_states"])
+        return listing
+
+    # Entry points
+
+    def set_administrator(self, params, context, operations):
+        self.verify_administrator(context.sender)
+        self.set("administrator", params)
+
+    def set_pause(self, params, context, operations):
+        self.verify_administrator(context.sender)
+        self.set("paused", params)
+
+    def register_card_template(self, params, context, operations):
+        self.verify_administrator(context.sender)
+        verify(params["card_type"] < len(CARD_TYPE_NAMES), CricTezErrorMessage.UNKNOWN_CARD_TYPE)
+        self.set(self.storage["next_template_id"], dict(params), self.storage["card_templates"])
+        self.set("next_template_id", self.storage["next_template_id"] + 1)
+
+    def mint(self, params, context, operations):
+        self.verify_not_paused()
+        self.verify_administrator(context.sender)
+        verify(params["template_id"] < self.storage["next_template_id"], CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        self.mint_card(context.sender, self.storage["next_token_id"], params["template_id"], params)
+        self.set("next_token_id", self.storage["next_token_id"] + 1)
+
+    def mint_batch(self, params, context, operations):
+        self.verify_not_paused()
+        self.verify_administrator(context.sender)
+        verify(params["template_id"] < self.storage["next_template_id"], CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        token_id = self.storage["next_token_id"]
+        for edition in params["editions"]:
+            self.mint_card(context.sender, token_id, params["template_id"], edition)
+            token_id += 1
+        self.set("next_token_id", token_id)
+
+    def register_drop(self, params, context, operations):
+        self.verify_administrator(context.sender)
+        verify(params["template_id"] < self.storage["next_template_id"], CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        verify(params["price"] > 0 and params["supply"] > 0 and params["wallet_cap"] > 0,
+               CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+        reserved = self.storage["template_editions"].get(params["template_id"], 0)
+        self.set(self.storage["next_drop_id"], dict(params, sold=0, first_edition=reserved + 1), self.storage["drops"])
+        self.set(params["template_id"], reserved + params["supply"], self.storage["template_editions"])
+        self.set("next_drop_id", self.storage["next_drop_id"] + 1)
+
+    def buy_from_drop(self, params, context, operations):
+        self.verify_not_paused()
+        drop = self.storage["drops"].get(params["drop_id"])
+        verify(drop is not None, CricTezErrorMessage.DROP_UNDEFINED)
+        verify(params["quantity"] > 0, CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+        sold = drop["sold"] + params["quantity"]
+        verify(sold <= drop["supply"], CricTezErrorMessage.DROP_SOLD_OUT)
+        wallet_key = (params["drop_id"], context.sender)
+        bought = self.storage["drop_purchases"].get(wallet_key, 0) + params["quantity"]
+        verify(bought <= drop["wallet_cap"], CricTezErrorMessage.WALLET_CAP_EXCEEDED)
+        verify(context.amount == params["quantity"] * drop["price"], CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+        token_id = self.storage["next_token_id"]
+        for edition_no in range(drop["first_edition"] + drop["sold"], drop["first_edition"] + sold):
+            self.mint_card(context.sender, token_id, drop["template_id"],
+                           dict(metadata=dict(drop["metadata"], edition_no=str(edition_no)), edition_no=edition_no))
+            token_id += 1
+        self.set("next_token_id", token_id)
+        self.set(params["drop_id"], dict(drop, sold=sold), self.storage["drops"])
+        self.set(wallet_key, bought, self.storage["drop_purchases"])
+        operations.append(Operation(self.storage["administrator"], context.amount))
+
+    def set_voucher_signer(self, params, context, operations):
+        self.verify_administrator(context.sender)
+        self.set("voucher_signer", params)
+
+    def redeem_voucher(self, params, context, operations):
+        self.verify_not_paused()
+        voucher = params["voucher"]
+        payload = voucher_payload(context.self_address, voucher)
+        verify(params["signature"] == sign(self.storage["voucher_signer"], payload),
+               CricTezErrorMessage.BAD_VOUCHER_SIGNATURE)
+        voucher_hash = hashlib.blake2b(payload).hexdigest()
+        verify(voucher_hash not in self.storage["redeemed_vouchers"], CricTezErrorMessage.VOUCHER_ALREADY_REDEEMED)
+        verify(voucher["template_id"] < self.storage["next_template_id"], CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        verify(context.amount == voucher["price"], CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+        self.mint_card(context.sender, self.storage["next_token_id"], voucher["template_id"], voucher)
+        self.set("next_token_id", self.storage["next_token_id"] + 1)
+        self.set(voucher_hash, True, self.storage["redeemed_vouchers"])
+        if context.amount > 0:
+            operations.append(Operation(self.storage["administrator"], context.amount))
+
+    def transfer(self, params, context, operations):
+        self.verify_not_paused()
+        for transfer in params:
+            can_transfer_all = self.can_transfer_all_from(transfer["from_"], context)
+            for tx in transfer["txs"]:
+                state = self.storage["token_states"].get(tx["token_id"])
+                if state is not None and "in_auction" in state:
+                    lock = state["in_auction"]
+                    verify(lock["locker"] == context.sender and lock["owner"] == transfer["from_"],
+                           CricTezErrorMessage.TOKEN_LOCKED)
+                    if tx["amount"] > 0:
+                        self.delete(tx["token_id"], self.storage["token_states"])
+                else:
+                    if not can_transfer_all:
+                        verify((transfer["from_"], context.sender, tx["token_id"]) in self.storage["operators"],
+                               FA2ErrorMessage.NOT_OPERATOR)
+                    if state is not None and tx["amount"] > 0 and tx["to_"] != transfer["from_"]:
+                        self.delete(tx["token_id"], self.storage["token_states"])
+                if tx["amount"] > 0:
+                    verify(self.is_token_defined(tx["token_id"]), FA2ErrorMessage.TOKEN_UNDEFINED)
+                    self.move_token(transfer["from_"], tx["to_"], tx["token_id"], tx["amount"])
+                    if (tx["to_"] == context.self_address and
+                            context.sender == self.storage["initial_auction_house_address"]):
+                        self.set(tx["token_id"], True, self.storage["parked_tokens"])
+
+    def list_card_on_marketplace(self, params, context, operations):
+        self.verify_not_paused()
+        self.list_card(context.sender, params["token_id"], params["sale_price"])
+
+    def list_cards_batch(self, params, context, operations):
+        self.verify_not_paused()
+        for listing_request in params:
+            self.list_card(context.sender, listing_request["token_id"], listing_request["sale_price"])
+
+    def withdraw_card_from_marketplace(self, params, context, operations):
+        self.verify_not_paused()
+        self.withdraw_card(context.sender, params["token_id"])
+
+    def withdraw_cards_batch(self, params, context, operations):
+        self.verify_not_paused()
+        for token_id in params:
+            self.withdraw_card(context.sender, token_id)
+
+    def buy_card_from_marketplace(self, params, context, operations):
+        self.verify_not_paused()
+        listing = self.buy_card(context.sender, params["token_id"])
+        verify(listing["sale_value"] == context.amount, CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+        operations.append(Operation(listing["seller"], context.amount))
+
+    def buy_cards_batch(self, params, context, operations):
+        self.verify_not_paused()
+        total = 0
+        payouts = {}
+        for token_id in params:
+            listing = self.buy_card(context.sender, token_id)
+            total += listing["sale_value"]
+            payouts[listing["seller"]] = payouts.get(listing["seller"], 0) + listing["sale_value"]
+        verify(total == context.amount, CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+        for seller in sorted(payouts, key=address_key):
+            operations.append(Operation(seller, payouts[seller]))
+
+    def balance_of(self, params, context, operations):
+        responses = [dict(request=dict(request), balance=self.storage["ledger"].get(
+            (request["owner"], request["token_id"]), 0)) for request in params["requests"]]
+        address, entry_point = params["callback"]
+        operations.append(Operation(address, 0, entry_point, responses))
+
+    def update_operators(self, params, context, operations):
+        # Updates are {"add_operator": {...}} / {"remove_operator": {...}}.
+        for update in params:
+            for action, operator in update.items():
+                self.set_operator(operator["owner"], operator["operator"], operator["token_id"],
+                                  action == "add_operator", context)
+
+    def update_all_tokens_operators(self, params, context, operations):
+        for update in params:
+            for action, operator in update.items():
+                self.set_operator(operator["owner"], operator["operator"], None, action == "add_operator", context)
+
+    def lock_tokens(self, params, context, operations):
+        self.verify_not_paused()
+        for request in params:
+            verify(self.is_token_defined(request["token_id"]), FA2ErrorMessage.TOKEN_UNDEFINED)
+            verify(self.can_transfer_all_from(request["owner"], context) or
+                   (request["owner"], context.sender, request["token_id"]) in self.storage["operators"],
+                   FA2ErrorMessage.NOT_OPERATOR)
+            verify(request["amount"] > 0, CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+            verify(self.storage["ledger"].get((request["owner"], request["token_id"]), 0) >= request["amount"],
+                   FA2ErrorMessage.INSUFFICIENT_BALANCE)
+            self.verify_not_in_auction(request["token_id"])
+            self.set(request["token_id"], {"in_auction": dict(locker=context.sender, owner=request["owner"])},
+                     self.storage["token_states"])
+
+    def intial_auction(self, params, context, operations):
+        self.verify_not_paused()
+        self.verify_administrator(context.sender)
+        end_timestamp = context.now + INITIAL_AUCTION_DURATION
+        requests = []
+        for token_id in params["token_ids"]:
+            verify(self.is_token_defined(token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+            self.verify_not_in_auction(token_id)
+            if token_id in self.storage["parked_tokens"]:
+                self.delete(token_id, self.storage["parked_tokens"])
+            else:
+                self.move_token(context.sender, context.self_address, token_id, 1)
+            if token_id in self.storage["token_states"]:
+                self.delete(token_id, self.storage["token_states"])
+            requests.append(dict(token_address=context.self_address, token_id=token_id, token_amount=1,
+                                 end_timestamp=end_timestamp, bid_amount=INITIAL_BID))
+        operations.append(Operation(self.storage["initial_auction_house_address"], 0,
+                                    "create_auctions_batch", requests))
+
+    def release_parked(self, params, context, operations):
+        self.verify_administrator(context.sender)
+        self.verify_not_in_auction(params["token_id"])
+        self.move_token(context.self_address, params["to_"], params["token_id"], 1)
+        if params["token_id"] in self.storage["parked_tokens"]:
+            self.delete(params["token_id"], self.storage["parked_tokens"])
+
+    # Views
+
+    def get_card(self, token_id):
+        verify(self.is_token_defined(token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        token = self.storage["tokens"][token_id]
+        template = self.storage["card_templates"][token["template_id"]]
+        return dict(global_card_id=token_id, player_id=template["player_id"], year=template["year"],
+                    type=CARD_TYPE_NAMES[template["card_type"]], edition_no=token["edition_no"],
+                    ipfs_string=template["ipfs_string"])
+
+    def get_balance(self, owner, token_id):
+        verify(self.is_token_defined(token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        return self.storage["ledger"].get((owner, token_id), 0)
+
+    def get_listing(self, token_id):
+        return self.storage["token_states"].get(token_id, {}).get("listed")
+
+    def count_tokens(self):
+        return self.storage["next_token_id"]
+
+    def get_drop(self, drop_id):
+        verify(drop_id in self.storage["drops"], CricTezErrorMessage.DROP_UNDEFINED)
+        return self.storage["drops"][drop_id]
+
+    def get_owner_tokens(self, owner, offset=0, limit=None):
+        count = self.storage["owner_token_count"].get(owner, 0)
+        end = count if limit is None else min(offset + limit, count)
+        return [self.storage["owner_tokens"][(owner, index)] for index in range(offset, end)]
+
+
+class AuctionHouseModel(Model):
+    ENTRY_POINTS = ("create_auction", "create_auctions_batch", "bid", "withdraw", "withdraw_many")
+
+    def __init__(self, pull_payments=False, escrow_free=False):
+        super().__init__()
+        self.pull_payments = pull_payments
+        self.escrow_free = escrow_free
+        self.storage = dict(auctions={}, next_auction_id=0, token_auctions={}, seller_auction_count={},
+                            seller_auctions={}, seller_auction_index={})
+        if pull_payments:
+            self.storage["pending_refunds"] = {}
+            self.ENTRY_POINTS = AuctionHouseModel.ENTRY_POINTS + ("claim_refunds",)
+
+    def add_auction(self, auction_id, request, context):
+        verify(request["token_amount"] > 0, AuctionErrorMessage.TOKEN_AMOUNT_TOO_LOW)
+        verify(request["end_timestamp"] >= context.now + MINIMAL_AUCTION_DURATION,
+               AuctionErrorMessage.END_DATE_TOO_SOON)
+        verify(request["end_timestamp"] <= context.now + MAXIMAL_AUCTION_DURATION,
+               AuctionErrorMessage.END_DATE_TOO_LATE)
+        verify(request["bid_amount"] >= MINIMAL_BID, AuctionErrorMessage.BID_AMOUNT_TOO_LOW)
+        verify((request["token_address"], request["token_id"]) not in self.storage["token_auctions"],
+               AuctionErrorMessage.TOKEN_ALREADY_IN_AUCTION)
+        count = self.storage["seller_auction_count"].get(context.sender, 0)
+        verify(count < MAXIMAL_AUCTIONS_PER_SELLER or context.sender == request["token_address"],
+               AuctionErrorMessage.SELLER_AUCTION_LIMIT_REACHED)
+        self.set(auction_id, dict(token_address=request["token_address"], token_id=request["token_id"],
+                                  token_amount=request["token_amount"], end_timestamp=request["end_timestamp"],
+                                  seller=context.sender, bid_amount=request["bid_amount"], bidder=context.sender),
+                 self.storage["auctions"])
+        self.set((request["token_address"], request["token_id"]), auction_id, self.storage["token_auctions"])
+        self.set((context.sender, count), auction_id, self.storage["seller_auctions"])
+        self.set(auction_id, count, self.storage["seller_auction_index"])
+        self.set(context.sender, count + 1, self.storage["seller_auction_count"])
+        self.emit("auction_created", dict(auction_id=auction_id, token_address=request["token_address"],
+                                          token_id=request["token_id"], seller=context.sender))
+
+    def remove_auction(self, auction_id, auction):
+        self.delete((auction["token_address"], auction["token_id"]), self.storage["token_auctions"])
+        seller = auction["seller"]
+        index = self.storage["seller_auction_index"][auction_id]
+        last = self.storage["seller_auction_count"][seller] - 1
+        if index != last:
+            last_auction_id = self.storage["seller_auctions"][(seller, last)]
+            self.set((seller, index), last_auction_id, self.storage["seller_auctions"])
+            self.set(last_auction_id, index, self.storage["seller_auction_index"])
+        self.delete((seller, last), self.storage["seller_auctions"])
+        self.delete(auction_id, self.storage["seller_auction_index"])
+        if last == 0:
+            self.delete(seller, self.storage["seller_auction_count"])
+        else:
+            self.set(seller, last, self.storage["seller_auction_count"])
+        self.delete(auction_id, self.storage["auctions"])
+
+    def get_auction_or_fail(self, auction_id, message=MISSING_KEY):
+        auction = self.storage["auctions"].get(auction_id)
+        verify(auction is not None, message)
+        return auction
+
+    @staticmethod
+    def payee(address):
+        if address_key(address) > address_key(THRESHOLD_ADDRESS):
+            return DEFAULT_ADDRESS
+        return address
+
+    # Entry points
+
+    def add_custody(self, custody, request, context):
+        # Escrow: the card moves into the auction house. Escrow-free: it stays
+        # with its seller, locked until settlement.
+        if self.escrow_free:
+            item = dict(owner=context.sender, token_id=request["token_id"], amount=request["token_amount"])
+        else:
+            item = dict(to_=context.self_address, token_id=request["token_id"], amount=request["token_amount"])
+        custody.setdefault(request["token_address"], []).append(item)
+
+    def send_custody(self, custody, context, operations):
+        for token_address in sorted(custody, key=address_key):
+            if self.escrow_free:
+                operations.append(Operation(token_address, 0, "lock_tokens", custody[token_address]))
+            else:
+                operations.append(Operation(token_address, 0, "transfer", [dict(
+                    from_=context.sender, txs=custody[token_address])]))
+
+    def settle(self, auction_id, auction, payouts, token_transfers, context):
+        verify(context.now > auction["end_timestamp"], AuctionErrorMessage.AUCTION_IS_ONGOING)
+        if auction["bidder"] != auction["seller"]:
+            payee = self.payee(auction["seller"])
+            payouts[payee] = payouts.get(payee, 0) + auction["bid_amount"]
+        from_ = auction["seller"] if self.escrow_free else context.self_address
+        token_transfers.setdefault(auction["token_address"], []).append(dict(from_=from_, txs=[dict(
+            to_=auction["bidder"], token_id=auction["token_id"], amount=auction["token_amount"])]))
+        self.remove_auction(auction_id, auction)
+
+    @staticmethod
+    def send_settlements(payouts, token_transfers, operations):
+        for payee in sorted(payouts, key=address_key):
+            operations.append(Operation(payee, payouts[payee]))
+        for token_address in sorted(token_transfers, key=address_key):
+            operations.append(Operation(token_address, 0, "transfer", token_transfers[token_address]))
+
+    # Entry points
+
+    def create_auction(self, params, context, operations):
+        custody = {}
+        self.add_auction(self.storage["next_auction_id"], params, context)
+        self.add_custody(custody, params, context)
+        self.set("next_auction_id", self.storage["next_auction_id"] + 1)
+        self.send_custody(custody, context, operations)
+
+    def create_auctions_batch(self, params, context, operations):
+        custody = {}
+        auction_id = self.storage["next_auction_id"]
+        for request in params:
+            self.add_auction(auction_id, request, context)
+            self.add_custody(custody, request, context)
+            auction_id += 1
+        self.set("next_auction_id", auction_id)
+        self.send_custody(custody, context, operations)
+
+    def bid(self, params, context, operations):
+        auction_id = params
+        auction = dict(self.get_auction_or_fail(auction_id))
+        verify(context.sender != auction["seller"], AuctionErrorMessage.SELLER_CANNOT_BID)
+        verify(context.amount >= auction["bid_amount"] + BID_STEP_THRESHOLD, AuctionErrorMessage.BID_AMOUNT_TOO_LOW)
+        verify(context.now < auction["end_timestamp"], AuctionErrorMessage.AUCTION_IS_OVER)
+        if auction["bidder"] != auction["seller"]:
+            if self.pull_payments:
+                self.set(auction["bidder"], self.storage["pending_refunds"].get(auction["bidder"], 0) +
+                         auction["bid_amount"], self.storage["pending_refunds"])
+            else:
+                operations.append(Operation(self.payee(auction["bidder"]), auction["bid_amount"]))
+        auction["bidder"] = context.sender
+        auction["bid_amount"] = context.amount
+        if auction["end_timestamp"] - context.now < AUCTION_EXTENSION_THRESHOLD:
+            auction["end_timestamp"] = context.now + AUCTION_EXTENSION_THRESHOLD
+        self.set(auction_id, auction, self.storage["auctions"])
+
+    def claim_refunds(self, params, context, operations):
+        verify(context.sender in self.storage["pending_refunds"], AuctionErrorMessage.NO_PENDING_REFUND)
+        operations.append(Operation(context.sender, self.storage["pending_refunds"][context.sender]))
+        self.delete(context.sender, self.storage["pending_refunds"])
+
+    def withdraw(self, params, context, operations):
+        payouts, token_transfers = {}, {}
+        self.settle(params, self.get_auction_or_fail(params), payouts, token_transfers, context)
+        self.send_settlements(payouts, token_transfers, operations)
+
+    def withdraw_many(self, params, context, operations):
+        payouts, token_transfers = {}, {}
+        for auction_id in params:
+            auction = self.get_auction_or_fail(auction_id, AuctionErrorMessage.AUCTION_UNDEFINED)
+            self.settle(auction_id, auction, payouts, token_transfers, context)
+        self.send_settlements(payouts, token_transfers, operations)
+
+    # Views
+
+    def get_auction(self, auction_id):
+        return self.storage["auctions"].get(auction_id)
+
+    def get_token_auction(self, token_address, token_id):
+        return self.storage["token_auctions"].get((token_address, token_id))
+
+    def get_seller_auction_count(self, seller):
+        return self.storage["seller_auction_count"].get(seller, 0)
+
+    def get_seller_auctions(self, seller, offset=0, limit=None):
+        count = self.get_seller_auction_count(seller)
+        end = count if limit is None else min(offset + limit, count)
+        return [self.storage["seller_auctions"][(seller, index)] for index in range(offset, end)]
+
+
+class Receiver(Model):
+    """ Stand-in for a balance_of callback contract; keeps the last response. """
+
+    ENTRY_POINTS = ("receive_balances",)
+
+    def receive_balances(self, params, context, operations):
+        self.set("last_responses", params)
+
+
+class Network:
+    """
+    Routes calls between originated models, keeps tez balances and applies
+    each external call as one atomic operation group (internal operations run
+    depth first, as on Tezos).
+    """
+
+    def __init__(self):
+        self.journal = Journal()
+        self.contracts = {}
+        self.balances = {}
+        self.events = []
+        # Every transaction of every successful group, internal ones
+        # included, in application order: (group, sender, destination,
+        # entry_point, params, amount, now).
+        self.applied = []
+        self.group = 0
+
+    def originate(self, model):
+        model.address = "KT1{:033d}".format(len(self.contracts) + 1)
+        model.network = self
+        self.contracts[model.address] = model
+        return model
+
+    def balance(self, address):
+        return self.balances.get(address, 0)
+
+    def emit(self, address, tag, payload):
+        self.journal.append(self.events, (address, tag, payload))
+
+    def move_tez(self, from_, to_, amount):
+        if amount == 0:
+            return
+        if from_ in self.contracts:
+            verify(self.balance(from_) >= amount, BAD_CONTRACT)
+        self.journal.set(self.balances, from_, self.balance(from_) - amount)
+        self.journal.set(self.balances, to_, self.balance(to_) + amount)
+
+    def apply(self, sender, source, destination, entry_point, params, amount, now):
+        self.journal.append(self.applied, (self.group, sender, destination, entry_point, params, amount, now))
+        self.move_tez(sender, destination, amount)
+        if is_implicit(destination):
+            verify(entry_point is None, BAD_CONTRACT)
+            return
+        contract = self.contracts.get(destination)
+        verify(contract is not None and entry_point is not None, BAD_CONTRACT)
+        context = Context(sender, source, amount, now, destination)
+        for operation in contract.dispatch(entry_point, params, context):
+            self.apply(destination, source, operation.destination, operation.entry_point,
+                       operation.params, operation.amount, now)
+
+    def call(self, sender, destination, entry_point, params=None, amount=0, now=0):
+        """ Runs an external call; raises ContractError after rolling everything back. """
+        try:
+            self.apply(sender, sender, destination, entry_point, params, amount, now)
+        except ContractError:
+            self.journal.rollback()
+            raise
+        finally:
+            self.group += 1
+        self.journal.commit()
+
+
+START_TIMESTAMP = 1640995200  # 2022-01-01T00:00:00Z
+MEAN_CALL_GAP = 30
+TEMPLATE_COUNT = 4
+IPFS_STRING = "ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY"
+PRICE_STEP = 100000
+VOUCHER_SIGNER = "Voucher signer"
+VOUCHER_FORGER = "Voucher forger"
+
+
+class Step:
+    """ One generated external call and what the model says it does. """
+
+    def __init__(self, index, sender, destination, entry_point, params, amount, now, error, growth):
+        self.index = index
+        self.sender = sender
+        self.destination = destination
+        self.entry_point = entry_point
+        self.params = params
+        self.amount = amount
+        self.now = now
+        # None when the call succeeds, the failure message otherwise.
+        self.error = error
+        # Change in entry count of every big_map the call touched.
+        self.growth = growth
+
+
+class ScenarioGenerator:
+    """
+    Reproducible random traffic against a fresh CricTezCards / AuctionHouse
+    pair. Calls are built from the current model state (owners list their own
+    cards, bids beat the current bid, withdrawals target ended auctions...),
+    so most of them go through; `invalid_rate` of them are sent by a random
+    user instead, and timing makes some bids and buys fail on their own.
+    """
+
+    WEIGHTS = dict(
+        mint=2,
+        mint_batch=3,
+        transfer=10,
+        balance_of=2,
+        list_card_on_marketplace=8,
+        list_cards_batch=2,
+        withdraw_card_from_marketplace=2,
+        withdraw_cards_batch=1,
+        buy_card_from_marketplace=6,
+        buy_cards_batch=2,
+        intial_auction=1,
+        release_parked=1,
+        register_drop=1,
+        buy_from_drop=6,
+        redeem_voucher=4,
+        create_auction=5,
+        update_operators=2,
+        lock_tokens=1,
+        bid=12,
+        withdraw=3,
+        withdraw_many=1,
+        claim_refunds=1,
+    )
+
+    def __init__(self, seed=0, users=20, admin=DEFAULT_ADDRESS, invalid_rate=0.05,
+                 owner_index=False, pull_payments=False, escrow_free=False):
+        self.random = random.Random(seed)
+        self.admin = admin
+        self.users = [implicit_address("user{}".format(user_no)) for user_no in range(users)]
+        self.invalid_rate = invalid_rate
+        self.network = Network()
+        self.house = self.network.originate(AuctionHouseModel(pull_payments, escrow_free))
+        self.cards = self.network.originate(CricTezCardsModel(admin, self.house.address, owner_index,
+                                                              voucher_signer=VOUCHER_SIGNER))
+        self.receiver = self.network.originate(Receiver())
+        self.now = START_TIMESTAMP
+        self.index = 0
+        self.next_edition_no = 0
+        self.issued_vouchers = []
+
+    def storage_sizes(self):
+        """ Entry count of every big_map of both contracts, keyed "cards.ledger" and so on. """
+        sizes = {}
+        for name, model in (("cards", self.cards), ("house", self.house)):
+            for field, value in model.storage.items():
+                if isinstance(value, dict):
+                    sizes["{}.{}".format(name, field)] = len(value)
+        return sizes
+
+    def call(self, sender, destination, entry_point, params=None, amount=0):
+        before = self.storage_sizes()
+        error = None
+        try:
+            self.network.call(sender, destination, entry_point, params, amount, self.now)
+        except ContractError as exception:
+            error = exception.message
+        after = self.storage_sizes()
+        growth = {field: after[field] - before[field] for field in after if after[field] != before[field]}
+        step = Step(self.index, sender, destination, entry_point, params, amount, self.now, error, growth)
+        self.index += 1
+        return step
+
+    def steps(self, count):
+        """ Yields the template registrations, then `count` random calls. """
+        for template_id in range(TEMPLATE_COUNT):
+            yield self.call(self.admin, self.cards.address, "register_card_template", dict(
+                player_id=template_id, year=2021, card_type=template_id % len(CARD_TYPE_NAMES),
+                ipfs_string=IPFS_STRING))
+        entry_points = list(self.WEIGHTS)
+        weights = [self.WEIGHTS[entry_point] for entry_point in entry_points]
+        for _ in range(count):
+            self.now += max(1, int(self.random.expovariate(1.0 / MEAN_CALL_GAP)))
+            entry_point = self.random.choices(entry_points, weights)[0]
+            # Nothing to act on yet (no listings, no ended auctions...): mint instead.
+            call = getattr(self, "plan_" + entry_point)() or self.plan_mint_batch()
+            sender, destination, entry_point, params, amount = call
+            if self.random.random() < self.invalid_rate:
+                sender = self.random.choice(self.users)
+            yield self.call(sender, destination, entry_point, params, amount)
+
+    # State sampling
+
+    def holdings(self):
+        """ (owner, token_id) pairs held by implicit accounts. """
+        return [key for key in self.cards.storage["ledger"] if is_implicit(key[0])]
+
+    def tokens_of(self, owner, limit):
+        tokens = [token_id for holder, token_id in self.cards.storage["ledger"] if holder == owner]
+        return self.random.sample(tokens, min(limit, len(tokens)))
+
+    def price(self, low=5, high=200):
+        return self.random.randint(low, high) * PRICE_STEP
+
+    def other_user(self, *excluded):
+        return self.random.choice([user for user in self.users if user not in excluded])
+
+    def auctions(self, ended):
+        return [auction_id for auction_id, auction in self.house.storage["auctions"].items()
+                if (auction["end_timestamp"] < self.now) == ended]
+
+    def edition(self):
+        self.next_edition_no += 1
+        return dict(metadata={"": str(self.next_edition_no)}, edition_no=self.next_edition_no)
+
+    # Call planners: each returns (sender, destination, entry_point, params,
+    # amount), or None when the current state offers nothing to act on.
+
+    def plan_mint(self):
+        params = self.edition()
+        params["template_id"] = self.random.randrange(TEMPLATE_COUNT)
+        return self.admin, self.cards.address, "mint", params, 0
+
+    def plan_mint_batch(self):
+        editions = [self.edition() for _ in range(self.random.randint(2, 10))]
+        params = dict(template_id=self.random.randrange(TEMPLATE_COUNT), editions=editions)
+        return self.admin, self.cards.address, "mint_batch", params, 0
+
+    def plan_transfer(self):
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        owner, token_id = self.random.choice(holdings)
+        # Some transfers are sent by an operator of the owner instead.
+        operators = [operator for owner_, operator, operator_token_id in self.cards.storage["operators"]
+                     if owner_ == owner and operator_token_id in (None, token_id) and is_implicit(operator)]
+        if operators and self.random.random() < 0.5:
+            sender = self.random.choice(operators)
+            token_ids = [token_id]
+        else:
+            sender = owner
+            token_ids = self.tokens_of(owner, self.random.randint(1, 3))
+        to_ = self.other_user(owner)
+        txs = [dict(to_=to_, token_id=token_id, amount=1) for token_id in token_ids]
+        return sender, self.cards.address, "transfer", [dict(from_=owner, txs=txs)], 0
+
+    def plan_balance_of(self):
+        # Wallet-style queries: held cards, a few keys nobody holds, and the
+        # odd repeated key.
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        requests = [dict(owner=owner, token_id=token_id)
+                    for owner, token_id in self.random.sample(holdings, min(len(holdings), self.random.randint(1, 5)))]
+        requests.append(dict(owner=self.random.choice(self.users),
+                             token_id=self.random.randrange(self.cards.storage["next_token_id"] + 1)))
+        if self.random.random() < 0.2:
+            requests.append(self.random.choice(requests))
+        params = dict(requests=requests, callback=(self.receiver.address, "receive_balances"))
+        return self.random.choice(self.users), self.cards.address, "balance_of", params, 0
+
+    def plan_list_card_on_marketplace(self):
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        owner, token_id = self.random.choice(holdings)
+        params = dict(token_id=token_id, sale_price=self.price())
+        return owner, self.cards.address, "list_card_on_marketplace", params, 0
+
+    def plan_list_cards_batch(self):
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        owner = self.random.choice(holdings)[0]
+        params = [dict(token_id=token_id, sale_price=self.price())
+                  for token_id in self.tokens_of(owner, self.random.randint(2, 5))]
+        return owner, self.cards.address, "list_cards_batch", params, 0
+
+    def plan_withdraw_card_from_marketplace(self):
+        listings = self.cards.listings()
+        if not listings:
+            return None
+        token_id = self.random.choice(sorted(listings))
+        seller = listings[token_id]["seller"]
+        return seller, self.cards.address, "withdraw_card_from_marketplace", dict(token_id=token_id), 0
+
+    def plan_withdraw_cards_batch(self):
+        listings = self.cards.listings()
+        if not listings:
+            return None
+        seller = listings[self.random.choice(sorted(listings))]["seller"]
+        token_ids = [token_id for token_id in sorted(listings) if listings[token_id]["seller"] == seller]
+        params = self.random.sample(token_ids, min(len(token_ids), self.random.randint(1, 4)))
+        return seller, self.cards.address, "withdraw_cards_batch", params, 0
+
+    def plan_buy_card_from_marketplace(self):
+        listings = self.cards.listings()
+        if not listings:
+            return None
+        token_id = self.random.choice(sorted(listings))
+        listing = listings[token_id]
+        buyer = self.other_user(listing["seller"])
+        return buyer, self.cards.address, "buy_card_from_marketplace", dict(token_id=token_id), listing["sale_value"]
+
+    def plan_buy_cards_batch(self):
+        marketplace = self.cards.listings()
+        if len(marketplace) < 2:
+            return None
+        token_ids = self.random.sample(sorted(marketplace), min(len(marketplace), self.random.randint(2, 4)))
+        buyer = self.other_user(*[marketplace[token_id]["seller"] for token_id in token_ids])
+        amount = sum(marketplace[token_id]["sale_value"] for token_id in token_ids)
+        return buyer, self.cards.address, "buy_cards_batch", token_ids, amount
+
+    def parked(self, limit):
+        """ Cards of unsold initial auctions, waiting on the token contract. """
+        parked = sorted(self.cards.storage["parked_tokens"])
+        return self.random.sample(parked, min(limit, len(parked)))
+
+    def plan_intial_auction(self):
+        token_ids = self.tokens_of(self.admin, self.random.randint(1, 3)) + self.parked(2)
+        if not token_ids:
+            return None
+        return self.admin, self.cards.address, "intial_auction", dict(token_ids=token_ids), 0
+
+    def plan_release_parked(self):
+        token_ids = self.parked(1)
+        if not token_ids:
+            return None
+        params = dict(token_id=token_ids[0], to_=self.random.choice(self.users))
+        return self.admin, self.cards.address, "release_parked", params, 0
+
+    def plan_register_drop(self):
+        params = dict(template_id=self.random.randrange(TEMPLATE_COUNT),
+                      metadata={"": "drop{}".format(self.cards.storage["next_drop_id"])},
+                      price=self.price(), supply=self.random.randint(5, 50), wallet_cap=self.random.randint(1, 4))
+        return self.admin, self.cards.address, "register_drop", params, 0
+
+    def plan_buy_from_drop(self):
+        open_drops = [drop_id for drop_id, drop in self.cards.storage["drops"].items() if drop["sold"] < drop["supply"]]
+        if not open_drops:
+            return None
+        drop_id = self.random.choice(open_drops)
+        drop = self.cards.storage["drops"][drop_id]
+        buyer = self.random.choice(self.users)
+        # Buyers stay within their wallet cap but not within the remaining
+        # supply; buyers who already hit the cap try once more anyway.
+        allowance = drop["wallet_cap"] - self.cards.storage["drop_purchases"].get((drop_id, buyer), 0)
+        quantity = self.random.randint(1, max(1, allowance))
+        amount = quantity * drop["price"]
+        return buyer, self.cards.address, "buy_from_drop", dict(drop_id=drop_id, quantity=quantity), amount
+
+    def plan_redeem_voucher(self):
+        # A few buyers replay a voucher that was already issued, or bring one
+        # signed by the wrong key.
+        roll = self.random.random()
+        if self.issued_vouchers and roll < 0.1:
+            params = self.random.choice(self.issued_vouchers)
+        else:
+            edition = self.edition()
+            voucher = dict(template_id=self.random.randrange(TEMPLATE_COUNT), edition_no=edition["edition_no"],
+                           metadata=edition["metadata"], price=self.price())
+            signer = VOUCHER_FORGER if roll > 0.95 else VOUCHER_SIGNER
+            params = dict(voucher=voucher, signature=sign(signer, voucher_payload(self.cards.address, voucher)))
+            self.issued_vouchers.append(params)
+        amount = params["voucher"]["price"]
+        return self.random.choice(self.users), self.cards.address, "redeem_voucher", params, amount
+
+    def plan_update_operators(self):
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        owner, token_id = self.random.choice(holdings)
+        operator = dict(owner=owner, operator=self.random.choice(self.users + [self.house.address]),
+                        token_id=token_id)
+        action = self.random.choice(["add_operator", "remove_operator"])
+        return owner, self.cards.address, "update_operators", [{action: operator}], 0
+
+    def plan_lock_tokens(self):
+        # Owners (or their operators) lock a card in place; it stays put
+        # until the locker transfers it.
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        owner, token_id = self.random.choice(holdings)
+        operators = [operator for owner_, operator, operator_token_id in self.cards.storage["operators"]
+                     if owner_ == owner and operator_token_id in (None, token_id) and is_implicit(operator)]
+        sender = self.random.choice(operators) if operators and self.random.random() < 0.5 else owner
+        params = [dict(owner=owner, token_id=token_id, amount=1)]
+        return sender, self.cards.address, "lock_tokens", params, 0
+
+    def plan_create_auction(self):
+        holdings = self.holdings()
+        if not holdings:
+            return None
+        owner, token_id = self.random.choice(holdings)
+        operators = self.cards.storage["operators"]
+        if ((owner, self.house.address, None) not in operators and
+                (owner, self.house.address, token_id) not in operators):
+            # The seller has to let the auction house pull the card first.
+            if self.random.random() < 0.5:
+                return owner, self.cards.address, "update_all_tokens_operators", [
+                    {"add_operator": dict(owner=owner, operator=self.house.address)}], 0
+            return owner, self.cards.address, "update_operators", [
+                {"add_operator": dict(owner=owner, operator=self.house.address, token_id=token_id)}], 0
+        params = dict(token_address=self.cards.address, token_id=token_id, token_amount=1,
+                      end_timestamp=self.now + self.random.randint(MINIMAL_AUCTION_DURATION, 6*3600),
+                      bid_amount=self.price(1, 10))
+        return owner, self.house.address, "create_auction", params, 0
+
+    def plan_bid(self):
+        # Mostly live auctions; the odd late bid exercises AUCTION_IS_OVER.
+        auction_ids = self.auctions(ended=self.random.random() < 0.05) or self.auctions(ended=False)
+        if not auction_ids:
+            return None
+        auction_id = self.random.choice(auction_ids)
+        auction = self.house.storage["auctions"][auction_id]
+        amount = auction["bid_amount"] + BID_STEP_THRESHOLD + self.price(0, 20)
+        return self.other_user(auction["seller"]), self.house.address, "bid", auction_id, amount
+
+    def plan_withdraw(self):
+        auction_ids = self.auctions(ended=True)
+        if not auction_ids:
+            return None
+        return self.random.choice(self.users), self.house.address, "withdraw", self.random.choice(auction_ids), 0
+
+    def plan_withdraw_many(self):
+        auction_ids = self.auctions(ended=True)
+        if len(auction_ids) < 2:
+            return None
+        params = self.random.sample(auction_ids, min(len(auction_ids), 10))
+        return self.random.choice(self.users), self.house.address, "withdraw_many", params, 0
+
+    def plan_claim_refunds(self):
+        if not self.house.pull_payments or not self.house.storage["pending_refunds"]:
+            return None
+        bidder = self.random.choice(list(self.house.storage["pending_refunds"]))
+        return bidder, self.house.address, "claim_refunds", None, 0
+
+
+def iso_timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def to_json_value(value, field=None):
+    """ Model parameter -> the JSON an indexer API returns for it (nats as strings, bytes as hex...). """
+    if field == "end_timestamp":
+        return iso_timestamp(value)
+    if field == "metadata":
+        return {key: content.encode().hex() for key, content in value.items()}
+    if isinstance(value, dict):
+        return {key: to_json_value(item, key) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item, field) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def operation_dump(network):
+    """
+    The applied transactions of `network` in the shape of an indexer API
+    transaction list, for feeding Indexer.py. Each distinct timestamp gets its
+    own block level.
+    """
+    operations = []
+    level = 0
+    last_now = None
+    for operation_id, (group, sender, destination, entry_point, params, amount, now) in enumerate(network.applied, 1):
+        if now != last_now:
+            level += 1
+            last_now = now
+        operation = dict(id=operation_id, level=level, timestamp=iso_timestamp(now), hash="op{}".format(group),
+                         sender=dict(address=sender), target=dict(address=destination), amount=amount,
+                         status="applied")
+        if entry_point is not None:
+            operation["parameter"] = dict(entrypoint=entry_point, value=to_json_value(params))
+        operations.append(operation)
+    return operations
+
+
+def summarize(generator, steps):
+    """ Per entry point call / failure counts and big_map growth, as text lines. """
+    rows = {}
+    for step in steps:
+        calls, failures, growth = rows.get(step.entry_point, (0, 0, 0))
+        rows[step.entry_point] = (calls + 1, failures + (step.error is not None),
+                                  growth + sum(step.growth.values()))
+    lines = ["{:<32}{:>8}{:>10}{:>14}".format("entry point", "calls", "failures", "entries added")]
+    for entry_point in sorted(rows):
+        lines.append("{:<32}{:>8}{:>10}{:>14}".format(entry_point, *rows[entry_point]))
+    lines.append("")
+    for field, size in sorted(generator.storage_sizes().items()):
+        lines.append("{:<32}{:>8}".format(field, size))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a random load scenario and summarize it.")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--owner-index", action="store_true")
+    parser.add_argument("--pull-payments", action="store_true")
+    parser.add_argument("--escrow-free", action="store_true")
+    parser.add_argument("--dump", metavar="PATH", help="also write the applied operations as JSON, for Indexer.py")
+    arguments = parser.parse_args()
+    generator = ScenarioGenerator(seed=arguments.seed, users=arguments.users, owner_index=arguments.owner_index,
+                                  pull_payments=arguments.pull_payments, escrow_free=arguments.escrow_free)
+    print("\n".join(summarize(generator, list(generator.steps(arguments.steps)))))
+    if arguments.dump:
+        with open(arguments.dump, "w") as dump:
+            json.dump(operation_dump(generator.network), dump)
+        print("\ncards {}\nhouse {}".format(generator.cards.address, generator.house.address))
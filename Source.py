@@ -6,7 +6,7 @@ class FA2ErrorMessage:
     TOKEN_UNDEFINED = "{}TOKEN_UNDEFINED".format(PREFIX)
     INSUFFICIENT_BALANCE = "{}INSUFFICIENT_BALANCE".format(PREFIX)
     NOT_OWNER = "{}NOT_OWNER".format(PREFIX)
-    OPERATORS_UNSUPPORTED = "{}OPERATORS_UNSUPPORTED".format(PREFIX)
+    NOT_OPERATOR = "{}NOT_OPERATOR".format(PREFIX)
 
 
 class CricTezErrorMessage:
@@ -17,6 +17,14 @@ class CricTezErrorMessage:
     MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO = "{}MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO".format(
         PREFIX)
     INCORRECT_PURCHASE_VALUE = "{}INCORRECT_PURCHASE_VALUE".format(PREFIX)
+    TEMPLATE_UNDEFINED = "{}TEMPLATE_UNDEFINED".format(PREFIX)
+    UNKNOWN_CARD_TYPE = "{}UNKNOWN_CARD_TYPE".format(PREFIX)
+    TOKEN_LOCKED = "{}TOKEN_LOCKED".format(PREFIX)
+    DROP_UNDEFINED = "{}DROP_UNDEFINED".format(PREFIX)
+    DROP_SOLD_OUT = "{}DROP_SOLD_OUT".format(PREFIX)
+    WALLET_CAP_EXCEEDED = "{}WALLET_CAP_EXCEEDED".format(PREFIX)
+    BAD_VOUCHER_SIGNATURE = "{}BAD_VOUCHER_SIGNATURE".format(PREFIX)
+    VOUCHER_ALREADY_REDEEMED = "{}VOUCHER_ALREADY_REDEEMED".format(PREFIX)
 
 
 class LedgerKey:
@@ -27,7 +35,35 @@ class LedgerKey:
         return sp.set_type_expr(sp.record(owner=owner, token_id=token_id), LedgerKey.get_type())
 
 
+class CardType:
+    STANDARD = 0
+    LIMITED = 1
+    RARE = 2
+    LEGENDARY = 3
+    NAMES = ["Standard", "Limited", "Rare", "Legendary"]
+
+    def get_names():
+        return sp.map({card_type: name for card_type, name in enumerate(CardType.NAMES)}, tkey=sp.TNat, tvalue=sp.TString)
+
+
+class CardTemplate:
+    """
+    Attributes shared by every edition of a card, stored once per
+    player / year / type instead of once per token.
+    """
+
+    def get_type():
+        return sp.TRecord(player_id=sp.TNat, year=sp.TNat, card_type=sp.TNat, ipfs_string=sp.TString).layout(("player_id", ("year", ("card_type", "ipfs_string"))))
+
+
 class TokenValue:
+    def get_type():
+        return sp.TRecord(template_id=sp.TNat, edition_no=sp.TNat).layout(("template_id", "edition_no"))
+
+
+class CardValue:
+    """ Full card record as exposed by the get_card view. """
+
     def get_type():
         return sp.TRecord(global_card_id=sp.TNat, player_id=sp.TNat, year=sp.TNat, type=sp.TString, edition_no=sp.TNat, ipfs_string=sp.TString).layout(("global_card_id", ("player_id", ("year", ("type", ("edition_no", ("ipfs_string")))))))
 
@@ -60,16 +96,40 @@ class marketplace:
         """ CricTez Token ID """
         return sp.TNat
 
+    def get_listing_request_type():
+        return sp.TRecord(token_id=sp.TNat, sale_price=sp.TMutez)
+
+
+class TokenLock:
+    def get_type():
+        return sp.TRecord(locker=sp.TAddress, owner=sp.TAddress).layout(("locker", "owner"))
+
+    def make(locker, owner):
+        return sp.set_type_expr(sp.record(locker=locker, owner=owner), TokenLock.get_type())
+
+
+class TokenState:
+    """
+    token_states value. Free cards have no entry; a listed card carries its
+    marketplace listing, a card in an escrow-free auction the address that
+    locked it and the owner it was locked with.
+    """
+
+    def get_type():
+        return sp.TVariant(listed=marketplace.get_value_type(), in_auction=TokenLock.get_type())
+
 
 class BatchTransfer:
-    def get_transfer_type():
-        tx_type = sp.TRecord(to_=sp.TAddress,
-                             token_id=sp.TNat,
-                             amount=sp.TNat).layout(
+    def get_tx_type():
+        return sp.TRecord(to_=sp.TAddress,
+                          token_id=sp.TNat,
+                          amount=sp.TNat).layout(
             ("to_", ("token_id", "amount"))
         )
+
+    def get_transfer_type():
         transfer_type = sp.TRecord(from_=sp.TAddress,
-                                   txs=sp.TList(tx_type)).layout(
+                                   txs=sp.TList(BatchTransfer.get_tx_type())).layout(
                                        ("from_", "txs"))
         return transfer_type
 
@@ -80,6 +140,22 @@ class BatchTransfer:
         return sp.set_type_expr(sp.record(from_=from_, txs=txs), BatchTransfer.get_transfer_type())
 
 
+class MintRequest:
+    def get_type():
+        return sp.TRecord(metadata=sp.TMap(sp.TString, sp.TBytes), template_id=sp.TNat, edition_no=sp.TNat)
+
+    def get_edition_type():
+        return sp.TRecord(metadata=sp.TMap(sp.TString, sp.TBytes), edition_no=sp.TNat)
+
+    def get_batch_type():
+        return sp.TRecord(template_id=sp.TNat, editions=sp.TList(MintRequest.get_edition_type()))
+
+
+class InitialAuctionRequest:
+    def get_type():
+        return sp.TRecord(token_ids=sp.TList(sp.TNat))
+
+
 class MultipleIPFSList:
     def get_type():
         return sp.TList(sp.TString)
@@ -116,22 +192,275 @@ class OperatorParam:
         return sp.set_type_expr(r, OperatorParam.get_type())
 
 
+class AllTokensOperatorParam:
+    def get_type():
+        return sp.TRecord(owner=sp.TAddress, operator=sp.TAddress).layout(("owner", "operator"))
+
+
+class OperatorKey:
+    """
+    Key of the operators big_map. token_id is sp.none for an operator of
+    all the owner's tokens, so one lookup clears a whole batch item.
+    """
+
+    def get_type():
+        return sp.TRecord(owner=sp.TAddress, operator=sp.TAddress, token_id=sp.TOption(sp.TNat)).layout(
+            ("owner", ("operator", "token_id")))
+
+    def make(owner, operator, token_id):
+        return sp.set_type_expr(sp.record(owner=owner, operator=operator, token_id=token_id), OperatorKey.get_type())
+
+
+class TokenLockRequest:
+    def get_type():
+        return sp.TRecord(owner=sp.TAddress, token_id=sp.TNat, amount=sp.TNat).layout(("owner", ("token_id", "amount")))
+
+
+class Drop:
+    """
+    A fixed-price primary sale of one card template. Editions are minted on
+    demand by buy_from_drop; sold counts them, so the admin never pre-mints.
+    register_drop reserves editions first_edition .. first_edition + supply - 1
+    of the template, so two drops of one template never share an edition.
+    """
+
+    def get_type():
+        return sp.TRecord(template_id=sp.TNat, metadata=sp.TMap(sp.TString, sp.TBytes), price=sp.TMutez,
+                          supply=sp.TNat, wallet_cap=sp.TNat, sold=sp.TNat, first_edition=sp.TNat).layout(
+            ("template_id", ("metadata", ("price", ("supply", ("wallet_cap", ("sold", "first_edition")))))))
+
+    def get_request_type():
+        return sp.TRecord(template_id=sp.TNat, metadata=sp.TMap(sp.TString, sp.TBytes), price=sp.TMutez,
+                          supply=sp.TNat, wallet_cap=sp.TNat).layout(
+            ("template_id", ("metadata", ("price", ("supply", "wallet_cap")))))
+
+    def get_purchase_type():
+        return sp.TRecord(drop_id=sp.TNat, quantity=sp.TNat).layout(("drop_id", "quantity"))
+
+
+class DropWalletKey:
+    def get_type():
+        return sp.TRecord(drop_id=sp.TNat, buyer=sp.TAddress).layout(("drop_id", "buyer"))
+
+    def make(drop_id, buyer):
+        return sp.set_type_expr(sp.record(drop_id=drop_id, buyer=buyer), DropWalletKey.get_type())
+
+
+class OwnerTokenKey:
+    def get_type():
+        return sp.TRecord(owner=sp.TAddress, index=sp.TNat).layout(("owner", "index"))
+
+    def make(owner, index):
+        return sp.set_type_expr(sp.record(owner=owner, index=index), OwnerTokenKey.get_type())
+
+
+class OwnerTokensRequest:
+    def get_type():
+        return sp.TRecord(owner=sp.TAddress, offset=sp.TNat, limit=sp.TNat).layout(("owner", ("offset", "limit")))
+
+
+class Voucher:
+    """
+    An admin-signed offer of one card edition at a fixed price. The signature
+    covers pack((contract address, voucher)), so a voucher only redeems on
+    the contract it was issued for.
+    """
+
+    def get_type():
+        return sp.TRecord(template_id=sp.TNat, edition_no=sp.TNat, metadata=sp.TMap(sp.TString, sp.TBytes),
+                          price=sp.TMutez).layout(("template_id", ("edition_no", ("metadata", "price"))))
+
+    def get_redeem_type():
+        return sp.TRecord(voucher=Voucher.get_type(), signature=sp.TSignature).layout(("voucher", "signature"))
+
+    def get_payload(contract_address, voucher):
+        return sp.pack(sp.set_type_expr(sp.pair(contract_address, voucher), sp.TPair(sp.TAddress, Voucher.get_type())))
+
+
+def get_card(self, token_id):
+    sp.set_type(token_id, sp.TNat)
+    sp.verify(self.is_token_defined(token_id),
+              message=FA2ErrorMessage.TOKEN_UNDEFINED)
+    token = self.data.tokens[token_id]
+    template = self.data.card_templates[token.template_id]
+    sp.result(sp.set_type_expr(sp.record(global_card_id=token_id, player_id=template.player_id, year=template.year,
+                                         type=CardType.get_names()[template.card_type], edition_no=token.edition_no,
+                                         ipfs_string=template.ipfs_string), CardValue.get_type()))
+
+
+def get_balance(self, request):
+    sp.set_type(request, LedgerKey.get_type())
+    sp.verify(self.is_token_defined(request.token_id),
+              message=FA2ErrorMessage.TOKEN_UNDEFINED)
+    sp.result(self.data.ledger.get(request, sp.nat(0)))
+
+
+def get_listing(self, token_id):
+    sp.set_type(token_id, marketplace.get_key_type())
+    listing = sp.local("listing", sp.none, t=sp.TOption(marketplace.get_value_type()))
+    token_state = self.data.token_states.get_opt(token_id)
+    sp.if token_state.is_some():
+        sp.if token_state.open_some().is_variant("listed"):
+            listing.value = sp.some(token_state.open_some().open_variant("listed"))
+    sp.result(listing.value)
+
+
+def total_supply(self, token_id):
+    sp.set_type(token_id, sp.TNat)
+    sp.verify(self.is_token_defined(token_id),
+              message=FA2ErrorMessage.TOKEN_UNDEFINED)
+    sp.result(sp.nat(1))
+
+
+def get_owner_token_count(self, owner):
+    sp.set_type(owner, sp.TAddress)
+    sp.result(self.data.owner_token_count.get(owner, sp.nat(0)))
+
+
+def get_owner_tokens(self, request):
+    sp.set_type(request, OwnerTokensRequest.get_type())
+    token_ids = sp.local("token_ids", sp.list(t=sp.TNat))
+    end = sp.local("end", request.offset + request.limit)
+    count = self.data.owner_token_count.get(request.owner, sp.nat(0))
+    sp.if end.value > count:
+        end.value = count
+    index = sp.local("index", request.offset)
+    sp.while index.value < end.value:
+        token_ids.value.push(
+            self.data.owner_tokens[OwnerTokenKey.make(request.owner, index.value)])
+        index.value += 1
+    sp.result(token_ids.value.rev())
+
+
+def set_voucher_signer(self, params):
+    sp.verify(self.is_administrator(sp.sender),
+              message=FA2ErrorMessage.NOT_OWNER)
+    sp.set_type(params, sp.TKey)
+    self.data.voucher_signer = params
+
+
+def redeem_voucher(self, params):
+    # Lazy minting: the card only exists once someone pays for it. The hash
+    # of the signed payload is kept so that each voucher mints once.
+    sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+    sp.set_type(params, Voucher.get_redeem_type())
+    payload = sp.local("payload", Voucher.get_payload(
+        sp.self_address, params.voucher)).value
+    sp.verify(sp.check_signature(self.data.voucher_signer, params.signature, payload),
+              message=CricTezErrorMessage.BAD_VOUCHER_SIGNATURE)
+    voucher_hash = sp.local("voucher_hash", sp.blake2b(payload)).value
+    sp.verify(~self.data.redeemed_vouchers.contains(voucher_hash),
+              message=CricTezErrorMessage.VOUCHER_ALREADY_REDEEMED)
+    sp.verify(params.voucher.template_id < self.data.next_template_id,
+              message=CricTezErrorMessage.TEMPLATE_UNDEFINED)
+    sp.verify(sp.amount == params.voucher.price,
+              message=CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+    self.mint_card(sp.sender, self.data.next_token_id,
+                   params.voucher.template_id, params.voucher)
+    self.data.next_token_id += 1
+    self.data.redeemed_vouchers[voucher_hash] = sp.unit
+    sp.if sp.amount > sp.mutez(0):
+        sp.send(self.data.administrator, sp.amount)
+
+
 class CricTezCards(sp.Contract):
-    def __init__(self, admin, metadata, initial_auction_house_address):
-        self.init(
+    def __init__(self, admin, metadata, initial_auction_house_address, debug=False, owner_index=False,
+                 voucher_signer=None):
+        # Compile-time switches: debug builds emit a trace event per
+        # transferred tx, production builds carry no tracing code or storage
+        # at all. owner_index maintains an enumerable owner -> tokens index.
+        # A voucher_signer key enables redeem_voucher lazy minting.
+        self.debug = debug
+        self.owner_index = owner_index
+        storage = dict(
             ledger=sp.big_map(tkey=LedgerKey.get_type(), tvalue=sp.TNat),
             token_metadata=sp.big_map(
                 tkey=sp.TNat, tvalue=TokenMetadataValue.get_type()),
             paused=False,
             administrator=admin,
             metadata=metadata,
-            all_tokens=sp.set(t=sp.TNat),
+            next_token_id=sp.nat(0),
             tokens=sp.big_map(tkey=sp.TNat, tvalue=TokenValue.get_type()),
-            marketplace=sp.big_map(
-                tkey=marketplace.get_key_type(), tvalue=marketplace.get_value_type()),
+            card_templates=sp.big_map(
+                tkey=sp.TNat, tvalue=CardTemplate.get_type()),
+            next_template_id=sp.nat(0),
+            token_states=sp.big_map(
+                tkey=marketplace.get_key_type(), tvalue=TokenState.get_type()),
+            operators=sp.big_map(tkey=OperatorKey.get_type(), tvalue=sp.TUnit),
+            drops=sp.big_map(tkey=sp.TNat, tvalue=Drop.get_type()),
+            next_drop_id=sp.nat(0),
+            drop_purchases=sp.big_map(
+                tkey=DropWalletKey.get_type(), tvalue=sp.TNat),
+            # Editions of each template already reserved by drops.
+            template_editions=sp.big_map(tkey=sp.TNat, tvalue=sp.TNat),
             initial_auction_house_address=initial_auction_house_address,
-            test_data=sp.address("tz1-AAA")
+            # Cards the initial auction house handed back unsold; only these
+            # may go up again through intial_auction.
+            parked_tokens=sp.big_map(tkey=sp.TNat, tvalue=sp.TUnit)
         )
+        if owner_index:
+            # owner_tokens holds each owner's tokens as a dense array so that
+            # adding or removing one costs a constant number of big_map
+            # accesses, however many cards the owner holds.
+            storage["owner_token_count"] = sp.big_map(
+                tkey=sp.TAddress, tvalue=sp.TNat)
+            storage["owner_tokens"] = sp.big_map(
+                tkey=OwnerTokenKey.get_type(), tvalue=sp.TNat)
+            storage["owner_token_index"] = sp.big_map(
+                tkey=LedgerKey.get_type(), tvalue=sp.TNat)
+            self.get_owner_token_count = sp.onchain_view()(get_owner_token_count)
+            self.get_owner_tokens = sp.onchain_view()(get_owner_tokens)
+        if voucher_signer is not None:
+            storage["voucher_signer"] = voucher_signer
+            storage["redeemed_vouchers"] = sp.big_map(
+                tkey=sp.TBytes, tvalue=sp.TUnit)
+            self.set_voucher_signer = sp.entry_point(set_voucher_signer)
+            self.redeem_voucher = sp.entry_point(redeem_voucher)
+        self.get_card = sp.onchain_view()(get_card)
+        self.get_balance = sp.onchain_view()(get_balance)
+        self.get_listing = sp.onchain_view()(get_listing)
+        self.total_supply = sp.onchain_view()(total_supply)
+        # The same views, off-chain, for the TZIP-16 metadata JSON. The
+        # scenario output holds the generated JSON, which is what the
+        # `metadata` URL has to serve.
+        self.offchain_get_card = sp.offchain_view(pure=True)(get_card)
+        self.offchain_get_balance = sp.offchain_view(pure=True)(get_balance)
+        self.offchain_get_listing = sp.offchain_view(pure=True)(get_listing)
+        self.offchain_total_supply = sp.offchain_view(pure=True)(total_supply)
+        self.init_metadata("CricTezCards", dict(
+            name="CricTez Cards",
+            description="CricTez cricket NFT cards with a marketplace, drops and initial auctions",
+            interfaces=["TZIP-012", "TZIP-016"],
+            views=[self.offchain_get_balance, self.offchain_get_listing, self.offchain_get_card,
+                   self.offchain_total_supply]))
+        self.init(**storage)
+
+    def index_add_token(self, owner, token_id):
+        count = sp.local("count", self.data.owner_token_count.get(
+            owner, sp.nat(0))).value
+        self.data.owner_tokens[OwnerTokenKey.make(owner, count)] = token_id
+        self.data.owner_token_index[LedgerKey.make(owner, token_id)] = count
+        self.data.owner_token_count[owner] = count + 1
+
+    def index_remove_token(self, owner, token_id):
+        # Swap-remove: the owner's last token takes the freed slot.
+        owner_token = LedgerKey.make(owner, token_id)
+        index = sp.local("index", self.data.owner_token_index[owner_token]).value
+        last = sp.local("last", sp.as_nat(
+            self.data.owner_token_count[owner] - 1)).value
+        sp.if index != last:
+            last_token_id = sp.local("last_token_id", self.data.owner_tokens[OwnerTokenKey.make(
+                owner, last)]).value
+            self.data.owner_tokens[OwnerTokenKey.make(
+                owner, index)] = last_token_id
+            self.data.owner_token_index[LedgerKey.make(
+                owner, last_token_id)] = index
+        del self.data.owner_tokens[OwnerTokenKey.make(owner, last)]
+        del self.data.owner_token_index[owner_token]
+        sp.if last == 0:
+            del self.data.owner_token_count[owner]
+        sp.else:
+            self.data.owner_token_count[owner] = last
 
     def is_administrator(self, sender):
         return sender == self.data.administrator
@@ -145,125 +474,355 @@ class CricTezCards(sp.Contract):
     def is_paused(self):
         return self.data.paused
 
+    def is_token_defined(self, token_id):
+        # Token ids are handed out sequentially and never burned, so the
+        # counter alone answers existence without touching any big_map.
+        return token_id < self.data.next_token_id
+
     @sp.entry_point
     def set_pause(self, params):
         sp.verify(self.is_administrator(sp.sender),
                   message=FA2ErrorMessage.NOT_OWNER)
         self.data.paused = params
 
+    @sp.entry_point
+    def register_card_template(self, params):
+        sp.verify(self.is_administrator(sp.sender),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        sp.set_type(params, CardTemplate.get_type())
+        sp.verify(params.card_type < len(CardType.NAMES),
+                  message=CricTezErrorMessage.UNKNOWN_CARD_TYPE)
+        self.data.card_templates[self.data.next_template_id] = params
+        self.data.next_template_id += 1
+
+    def bytes_of_nat(self, value):
+        # Decimal digits as UTF-8 bytes, the encoding TZIP-21 readers expect
+        # in token_info.
+        digits = sp.local("digits", value)
+        result = sp.local("result", sp.bytes("0x30"))
+        sp.if value > 0:
+            result.value = sp.bytes("0x")
+        sp.while digits.value > 0:
+            result.value = sp.concat([sp.slice(sp.bytes("0x30313233343536373839"), digits.value % 10, 1).open_some(),
+                                      result.value])
+            digits.value //= 10
+        return result.value
+
+    def mint_card(self, owner, token_id, template_id, edition):
+        self.data.ledger[LedgerKey.make(owner, token_id)] = 1
+        if self.owner_index:
+            self.index_add_token(owner, token_id)
+        self.data.token_metadata[token_id] = sp.record(
+            token_id=token_id, token_info=edition.metadata)
+        self.data.tokens[token_id] = sp.record(
+            template_id=template_id, edition_no=edition.edition_no)
+
     @sp.entry_point
     def mint(self, params):
         sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
         sp.verify(self.is_administrator(sp.sender),
                   message=FA2ErrorMessage.NOT_OWNER)
-        token_id = sp.len(self.data.all_tokens)
-        sp.verify(~ self.data.all_tokens.contains(token_id),
-                  message=CricTezErrorMessage.CANT_MINT_SAME_TOKEN_TWICE)
-        sp.set_type(params.metadata, sp.TMap(sp.TString, sp.TBytes))
-        user = LedgerKey.make(sp.sender, token_id)
-        self.data.ledger[user] = 1
-        self.data.token_metadata[token_id] = sp.record(
-            token_id=token_id, token_info=params.metadata)
-        self.data.tokens[token_id] = sp.record(global_card_id=token_id, player_id=params.player_id,
-                                               year=params.year, type=params.type, edition_no=params.edition_no, ipfs_string=params.ipfs_string)
-        self.data.all_tokens.add(token_id)
+        sp.set_type(params, MintRequest.get_type())
+        sp.verify(params.template_id < self.data.next_template_id,
+                  message=CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        token_id = sp.local("token_id", self.data.next_token_id).value
+        self.mint_card(sp.sender, token_id, params.template_id, params)
+        self.data.next_token_id += 1
         ###########################################################################
         # 1. Token ID -> During Tx
         # 2. Put on Sale Directly
-        # 3. Mint Multiple Cards
         ###########################################################################
 
+    @sp.entry_point
+    def mint_batch(self, batch_mint_requests):
+        sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.verify(self.is_administrator(sp.sender),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        sp.set_type(batch_mint_requests, MintRequest.get_batch_type())
+        sp.verify(batch_mint_requests.template_id < self.data.next_template_id,
+                  message=CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        token_id_runner = sp.local("token_id_runner", self.data.next_token_id)
+        sp.for edition in batch_mint_requests.editions:
+            self.mint_card(sp.sender, token_id_runner.value,
+                           batch_mint_requests.template_id, edition)
+            token_id_runner.value += 1
+        self.data.next_token_id = token_id_runner.value
+
+    @sp.entry_point
+    def register_drop(self, params):
+        sp.verify(self.is_administrator(sp.sender),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        sp.set_type(params, Drop.get_request_type())
+        sp.verify(params.template_id < self.data.next_template_id,
+                  message=CricTezErrorMessage.TEMPLATE_UNDEFINED)
+        sp.verify((params.price > sp.mutez(0)) & (params.supply > 0) & (params.wallet_cap > 0),
+                  message=CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+        reserved = sp.local("reserved", self.data.template_editions.get(params.template_id, sp.nat(0))).value
+        self.data.drops[self.data.next_drop_id] = sp.record(
+            template_id=params.template_id, metadata=params.metadata, price=params.price,
+            supply=params.supply, wallet_cap=params.wallet_cap, sold=sp.nat(0), first_edition=reserved + 1)
+        self.data.template_editions[params.template_id] = reserved + params.supply
+        self.data.next_drop_id += 1
+
+    @sp.entry_point
+    def buy_from_drop(self, params):
+        # Costs one drops and one drop_purchases access plus the mints,
+        # however large the drop or however many buyers came before.
+        sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.set_type(params, Drop.get_purchase_type())
+        drop = sp.local("drop", self.data.drops.get(
+            params.drop_id, message=CricTezErrorMessage.DROP_UNDEFINED)).value
+        sp.verify(params.quantity > 0,
+                  message=CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+        sold = sp.local("sold", drop.sold + params.quantity).value
+        sp.verify(sold <= drop.supply, message=CricTezErrorMessage.DROP_SOLD_OUT)
+        wallet_key = DropWalletKey.make(params.drop_id, sp.sender)
+        bought = sp.local("bought", self.data.drop_purchases.get(
+            wallet_key, sp.nat(0)) + params.quantity).value
+        sp.verify(bought <= drop.wallet_cap,
+                  message=CricTezErrorMessage.WALLET_CAP_EXCEEDED)
+        sp.verify(sp.amount == sp.split_tokens(drop.price, params.quantity, 1),
+                  message=CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+        token_id_runner = sp.local("token_id_runner", self.data.next_token_id)
+        sp.for edition_no in sp.range(drop.first_edition + drop.sold, drop.first_edition + sold):
+            metadata = sp.local("metadata", drop.metadata)
+            metadata.value["edition_no"] = self.bytes_of_nat(edition_no)
+            self.mint_card(sp.sender, token_id_runner.value, drop.template_id,
+                           sp.record(metadata=metadata.value, edition_no=edition_no))
+            token_id_runner.value += 1
+        self.data.next_token_id = token_id_runner.value
+        self.data.drops[params.drop_id].sold = sold
+        self.data.drop_purchases[wallet_key] = bought
+        sp.send(self.data.administrator, sp.amount)
+
+    @sp.onchain_view()
+    def get_token_state(self, token_id):
+        sp.set_type(token_id, marketplace.get_key_type())
+        sp.result(self.data.token_states.get_opt(token_id))
+
+    @sp.onchain_view()
+    def count_tokens(self):
+        sp.result(self.data.next_token_id)
+
+    @sp.onchain_view()
+    def get_drop(self, drop_id):
+        sp.set_type(drop_id, sp.TNat)
+        sp.result(self.data.drops.get(
+            drop_id, message=CricTezErrorMessage.DROP_UNDEFINED))
+
+    def move_token(self, from_, to_, token_id, amount):
+        # Reads each ledger key once; emptied balances are removed rather
+        # than kept around as 0 entries.
+        from_user = LedgerKey.make(from_, token_id)
+        from_balance = sp.local(
+            "from_balance", self.data.ledger.get(from_user, sp.nat(0)))
+        sp.verify(from_balance.value >= amount,
+                  message=FA2ErrorMessage.INSUFFICIENT_BALANCE)
+        sp.if to_ != from_:
+            sp.if from_balance.value == amount:
+                del self.data.ledger[from_user]
+                if self.owner_index:
+                    self.index_remove_token(from_, token_id)
+            sp.else:
+                self.data.ledger[from_user] = sp.as_nat(
+                    from_balance.value - amount)
+            to_user = LedgerKey.make(to_, token_id)
+            to_balance = sp.local(
+                "to_balance", self.data.ledger.get(to_user, sp.nat(0)))
+            self.data.ledger[to_user] = to_balance.value + amount
+            if self.owner_index:
+                sp.if to_balance.value == 0:
+                    self.index_add_token(to_, token_id)
+
+    def can_transfer_all_from(self, from_):
+        # `|` does not short-circuit, so the owner check comes first and the
+        # operators big_map is only read when it fails. Cards parked on this
+        # contract by intial_auction may only be pulled by the initial
+        # auction house.
+        can_transfer_all = sp.local("can_transfer_all", sp.sender == from_)
+        sp.if ~can_transfer_all.value:
+            sp.if from_ == sp.self_address:
+                can_transfer_all.value = sp.sender == self.data.initial_auction_house_address
+            sp.else:
+                can_transfer_all.value = self.data.operators.contains(
+                    OperatorKey.make(from_, sp.sender, sp.none))
+        return can_transfer_all
+
+    def verify_operator(self, from_, token_id, can_transfer_all):
+        sp.if ~can_transfer_all.value:
+            sp.verify(self.data.operators.contains(OperatorKey.make(from_, sp.sender, sp.some(token_id))),
+                      message=FA2ErrorMessage.NOT_OPERATOR)
+
+    def verify_not_in_auction(self, token_state):
+        sp.if token_state.value.is_some():
+            sp.verify(token_state.value.open_some().is_variant("listed"),
+                      message=CricTezErrorMessage.TOKEN_LOCKED)
+
     @sp.entry_point
     def transfer(self, batch_transfers):
         sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
         sp.set_type(batch_transfers, BatchTransfer.get_type())
         sp.for transfer in batch_transfers:
+            # Owner and all-tokens operators are settled once per batch item;
+            # only per-token operators cost a lookup per tx.
+            can_transfer_all = self.can_transfer_all_from(transfer.from_)
             sp.for tx in transfer.txs:
+                # One token_states lookup per tx: a card in auction only moves
+                # at the hands of its locker, which releases it; a listed card
+                # is delisted when it changes hands; free cards have no entry.
+                token_state = sp.local(
+                    "token_state", self.data.token_states.get_opt(tx.token_id))
+                sp.if token_state.value.is_some():
+                    sp.if token_state.value.open_some().is_variant("in_auction"):
+                        lock = sp.local("lock", token_state.value.open_some().open_variant("in_auction")).value
+                        sp.verify((lock.locker == sp.sender) & (lock.owner == transfer.from_),
+                                  message=CricTezErrorMessage.TOKEN_LOCKED)
+                        sp.if tx.amount > sp.nat(0):
+                            del self.data.token_states[tx.token_id]
+                    sp.else:
+                        self.verify_operator(
+                            transfer.from_, tx.token_id, can_transfer_all)
+                        sp.if (tx.amount > sp.nat(0)) & (tx.to_ != transfer.from_):
+                            del self.data.token_states[tx.token_id]
+                sp.else:
+                    self.verify_operator(
+                        transfer.from_, tx.token_id, can_transfer_all)
                 sp.if (tx.amount > sp.nat(0)):
-                    from_user = LedgerKey.make(transfer.from_, tx.token_id)
-                    to_user = LedgerKey.make(tx.to_, tx.token_id)
-                    sp.verify(self.data.all_tokens.contains(
+                    sp.verify(self.is_token_defined(
                         tx.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
-                    sp.verify((self.data.ledger[from_user] >= tx.amount),
-                              message=FA2ErrorMessage.INSUFFICIENT_BALANCE)
-                    sp.verify((sp.sender == transfer.from_) | (
-                        sp.source == transfer.from_), message=FA2ErrorMessage.NOT_OWNER)
-                    self.data.test_data = sp.source
-                    self.data.ledger[from_user] = sp.as_nat(
-                        self.data.ledger[from_user] - tx.amount)
-                    self.data.ledger[to_user] = self.data.ledger.get(
-                        to_user, 0) + tx.amount
-                sp.if self.data.marketplace.contains(tx.token_id):
-                    del self.data.marketplace[tx.token_id]
+                    if self.debug:
+                        sp.emit(sp.record(source=sp.source, sender=sp.sender, from_=transfer.from_,
+                                          to_=tx.to_, token_id=tx.token_id, amount=tx.amount), tag="transfer_trace")
+                    self.move_token(transfer.from_, tx.to_,
+                                    tx.token_id, tx.amount)
+                    # An unsold initial auction: the auction house hands the
+                    # card back to this contract, its seller.
+                    sp.if tx.to_ == sp.self_address:
+                        sp.if sp.sender == self.data.initial_auction_house_address:
+                            self.data.parked_tokens[tx.token_id] = sp.unit
         ###########################################################################
         # 1. Ownership Check
         # 2. Admin Can Transfer Anything
         # 3. marketplace se kya relation
         ###########################################################################
 
+    def list_card(self, seller, token_id, sale_price):
+        sp.verify(self.is_token_defined(
+            token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        sp.verify(sale_price > sp.mutez(0),
+                  CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+        # Emptied balances are deleted from the ledger, so presence alone
+        # proves ownership.
+        sp.verify(self.data.ledger.contains(LedgerKey.make(seller, token_id)),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        self.verify_not_in_auction(sp.local(
+            "token_state", self.data.token_states.get_opt(token_id)))
+        self.data.token_states[token_id] = sp.variant("listed", sp.record(
+            seller=seller,
+            sale_value=sale_price
+        ))
+
+    def withdraw_card(self, seller, token_id):
+        sp.verify(self.is_token_defined(
+            token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        sp.verify(self.data.token_states.get(token_id, message=FA2ErrorMessage.TOKEN_UNDEFINED).is_variant(
+            "listed"), FA2ErrorMessage.TOKEN_UNDEFINED)
+        sp.verify(self.data.ledger.contains(LedgerKey.make(seller, token_id)),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        del self.data.token_states[token_id]
+
     @sp.entry_point
     def list_card_on_marketplace(self, params):
         sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
         sp.set_type(params.token_id, sp.TNat)
         sp.set_type(params.sale_price, sp.TMutez)
-        from_user = LedgerKey.make(sp.sender, params.token_id)
-        sp.verify(self.data.all_tokens.contains(
-            params.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
-        sp.verify(params.sale_price > sp.mutez(0),
-                  CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
-        sp.verify(self.data.ledger.contains(from_user),
-                  message=FA2ErrorMessage.NOT_OWNER)
-        sp.verify((self.data.ledger.get(from_user, sp.nat(0)) >= 1),
-                  message=FA2ErrorMessage.INSUFFICIENT_BALANCE)
-        self.data.marketplace[params.token_id] = sp.record(
-            seller=sp.sender,
-            sale_value=params.sale_price
-        )
+        self.list_card(sp.sender, params.token_id, params.sale_price)
+
+    @sp.entry_point
+    def list_cards_batch(self, listing_requests):
+        sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.set_type(listing_requests, sp.TList(
+            marketplace.get_listing_request_type()))
+        sp.for listing_request in listing_requests:
+            self.list_card(sp.sender, listing_request.token_id,
+                           listing_request.sale_price)
 
     @sp.entry_point
     def withdraw_card_from_marketplace(self, params):
         sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
         sp.set_type(params.token_id, sp.TNat)
-        from_user = LedgerKey.make(sp.sender, params.token_id)
-        sp.verify(self.data.all_tokens.contains(
-            params.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
-        sp.verify(self.data.marketplace.contains(
-            params.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
-        sp.verify(self.data.ledger.contains(from_user),
-                  message=FA2ErrorMessage.NOT_OWNER)
-        sp.verify((self.data.ledger.get(from_user, sp.nat(0)) >= 1),
-                  message=FA2ErrorMessage.INSUFFICIENT_BALANCE)
-        del self.data.marketplace[params.token_id]
+        self.withdraw_card(sp.sender, params.token_id)
+
+    @sp.entry_point
+    def withdraw_cards_batch(self, token_ids):
+        sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.set_type(token_ids, sp.TList(marketplace.get_key_type()))
+        sp.for token_id in token_ids:
+            self.withdraw_card(sp.sender, token_id)
+
+    def buy_card(self, buyer, token_id):
+        sp.verify(self.is_token_defined(
+            token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+        token_state = sp.local("token_state", self.data.token_states.get(
+            token_id, message=FA2ErrorMessage.TOKEN_UNDEFINED)).value
+        sp.verify(token_state.is_variant("listed"),
+                  FA2ErrorMessage.TOKEN_UNDEFINED)
+        listing = sp.local("listing", token_state.open_variant("listed")).value
+        self.move_token(listing.seller, buyer, token_id, 1)
+        del self.data.token_states[token_id]
+        return listing
 
     @sp.entry_point
     def buy_card_from_marketplace(self, params):
         sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
         sp.set_type(params.token_id, sp.TNat)
-        sp.verify(self.data.all_tokens.contains(
-            params.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
-        sp.verify(self.data.marketplace.contains(
-            params.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
-        sp.verify(self.data.marketplace[params.token_id].sale_value ==
+        listing = self.buy_card(sp.sender, params.token_id)
+        sp.verify(listing.sale_value ==
                   sp.amount, CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
-        seller = LedgerKey.make(
-            self.data.marketplace[params.token_id].seller, params.token_id)
-        buyer = LedgerKey.make(sp.sender, params.token_id)
-        self.data.ledger[seller] = sp.as_nat(
-            self.data.ledger[seller] - 1)
-        self.data.ledger[buyer] = 1
-        sp.send(self.data.marketplace[params.token_id].seller, sp.amount)
-        del self.data.marketplace[params.token_id]
+        sp.send(listing.seller, sp.amount)
 
     @sp.entry_point
-    def balance_of(self, balance_of_request):
+    def buy_cards_batch(self, token_ids):
         sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.set_type(token_ids, sp.TList(marketplace.get_key_type()))
+        total = sp.local("total", sp.mutez(0))
+        payouts = sp.local("payouts", sp.map(
+            tkey=sp.TAddress, tvalue=sp.TMutez))
+        sp.for token_id in token_ids:
+            listing = self.buy_card(sp.sender, token_id)
+            total.value += listing.sale_value
+            payouts.value[listing.seller] = payouts.value.get(
+                listing.seller, sp.mutez(0)) + listing.sale_value
+        sp.verify(total.value == sp.amount,
+                  CricTezErrorMessage.INCORRECT_PURCHASE_VALUE)
+        sp.for payout in payouts.value.items():
+            sp.send(payout.key, payout.value)
+
+    @sp.entry_point
+    def balance_of(self, balance_of_request):
+        # Read-only, so it keeps answering while the contract is paused.
         sp.set_type(balance_of_request, BalanceOfRequest.get_type())
         responses = sp.local("responses", sp.set_type_expr(
             sp.list([]), BalanceOfRequest.get_response_type()))
+        # Repeated keys are answered from memory instead of the big_map.
+        balances = sp.local("balances", sp.map(
+            tkey=LedgerKey.get_type(), tvalue=sp.TNat))
         sp.for request in balance_of_request.requests:
-            responses.value.push(sp.record(request=request, balance=self.data.ledger.get(
-                LedgerKey.make(request.owner, request.token_id), 0)))
-        sp.transfer(responses.value, sp.mutez(0), balance_of_request.callback)
+            sp.if ~balances.value.contains(request):
+                balances.value[request] = self.data.ledger.get(
+                    request, sp.nat(0))
+            responses.value.push(
+                sp.record(request=request, balance=balances.value[request]))
+        sp.transfer(responses.value.rev(), sp.mutez(0),
+                    balance_of_request.callback)
+
+    def set_operator(self, owner, operator, token_id, add):
+        sp.verify(owner == sp.sender, message=FA2ErrorMessage.NOT_OWNER)
+        operator_key = OperatorKey.make(owner, operator, token_id)
+        if add:
+            self.data.operators[operator_key] = sp.unit
+        else:
+            del self.data.operators[operator_key]
 
     @sp.entry_point
     def update_operators(self, params):
@@ -271,32 +830,107 @@ class CricTezCards(sp.Contract):
             sp.TVariant(
                 add_operator=OperatorParam.get_type(),
                 remove_operator=OperatorParam.get_type())))
-        sp.failwith(FA2ErrorMessage.OPERATORS_UNSUPPORTED)
+        sp.for update in params:
+            with update.match_cases() as arg:
+                with arg.match("add_operator") as upd:
+                    self.set_operator(upd.owner, upd.operator, sp.some(upd.token_id), True)
+                with arg.match("remove_operator") as upd:
+                    self.set_operator(upd.owner, upd.operator, sp.some(upd.token_id), False)
+
+    @sp.entry_point
+    def update_all_tokens_operators(self, params):
+        sp.set_type(params, sp.TList(
+            sp.TVariant(
+                add_operator=AllTokensOperatorParam.get_type(),
+                remove_operator=AllTokensOperatorParam.get_type())))
+        sp.for update in params:
+            with update.match_cases() as arg:
+                with arg.match("add_operator") as upd:
+                    self.set_operator(upd.owner, upd.operator, sp.none, True)
+                with arg.match("remove_operator") as upd:
+                    self.set_operator(upd.owner, upd.operator, sp.none, False)
+
+    @sp.entry_point
+    def lock_tokens(self, lock_requests):
+        # Escrow-free auctions: the card stays with its owner but cannot be
+        # transferred or listed until the locker transfers it.
+        sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.set_type(lock_requests, sp.TList(TokenLockRequest.get_type()))
+        sp.for request in lock_requests:
+            sp.verify(self.is_token_defined(
+                request.token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+            self.verify_operator(request.owner, request.token_id,
+                                 self.can_transfer_all_from(request.owner))
+            # A zero-amount lock would let anyone lock a card they do not
+            # hold by naming themselves as owner.
+            sp.verify(request.amount > 0,
+                      message=CricTezErrorMessage.MIN_VALUE_SHOULD_BE_MORE_THAN_ZERO)
+            sp.verify(self.data.ledger.get(LedgerKey.make(request.owner, request.token_id), sp.nat(0)) >= request.amount,
+                      message=FA2ErrorMessage.INSUFFICIENT_BALANCE)
+            # Locking a listed card takes it off the marketplace.
+            self.verify_not_in_auction(sp.local(
+                "token_state", self.data.token_states.get_opt(request.token_id)))
+            self.data.token_states[request.token_id] = sp.variant(
+                "in_auction", TokenLock.make(sp.sender, request.owner))
 
     @sp.entry_point
     def intial_auction(self, batch_initial_auction):
+        sp.verify(~self.is_paused(), CricTezErrorMessage.CONTRACT_IS_PAUSED)
+        sp.verify(self.is_administrator(sp.sender),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        sp.set_type(batch_initial_auction, InitialAuctionRequest.get_type())
+        auction_house = sp.contract(sp.TList(AuctionCreateRequest.get_type(
+        )), self.data.initial_auction_house_address, entry_point="create_auctions_batch").open_some()
+        auction_create_requests = sp.local("auction_create_requests", sp.list(
+            t=AuctionCreateRequest.get_type()))
+        end_timestamp = sp.local(
+            'end_timestamp', sp.now.add_hours(INITIAL_AUCTION_DURATION))
         sp.for token_id in batch_initial_auction.token_ids:
-            auction_id_runner = sp.local(
-                'auction_id_runner', batch_initial_auction.auction_id_start)
-            auction_house = sp.contract(AuctionCreateRequest.get_type(
-            ), self.data.initial_auction_house_address, entry_point="create_auction").open_some()
+            sp.verify(self.is_token_defined(
+                token_id), FA2ErrorMessage.TOKEN_UNDEFINED)
+            # The auction house pulls the card from this contract (the
+            # auction seller), so park the admin's card here first.
+            token_state = sp.local(
+                "token_state", self.data.token_states.get_opt(token_id))
+            self.verify_not_in_auction(token_state)
+            # Cards of an unsold initial auction are already here; the others
+            # come from the admin. Cards sent here by anyone else are not
+            # auctioned (see release_parked).
+            sp.if self.data.parked_tokens.contains(token_id):
+                del self.data.parked_tokens[token_id]
+            sp.else:
+                self.move_token(sp.sender, sp.self_address, token_id, 1)
+            sp.if token_state.value.is_some():
+                del self.data.token_states[token_id]
             auction_create_request = sp.record(
-                auction_id=auction_id_runner.value,
                 token_address=sp.self_address,
                 token_id=token_id,
                 token_amount=sp.nat(1),
-                end_timestamp=sp.now.add_hours(INITIAL_AUCTION_DURATION),
+                end_timestamp=end_timestamp.value,
                 bid_amount=INITIAL_BID
             )
-            sp.set_type_expr(auction_create_request,
-                             AuctionCreateRequest.get_type())
-            sp.transfer(auction_create_request, sp.mutez(0), auction_house)
-            auction_id_runner.value += 1
+            auction_create_requests.value.push(auction_create_request)
+        # push builds the list backwards; reverse it so auction ids follow
+        # the order of token_ids.
+        sp.transfer(auction_create_requests.value.rev(),
+                    sp.mutez(0), auction_house)
+
+
+    @sp.entry_point
+    def release_parked(self, params):
+        # Hands a card held by this contract, an unsold initial auction or a
+        # card sent here by mistake, to `to_`.
+        sp.verify(self.is_administrator(sp.sender),
+                  message=FA2ErrorMessage.NOT_OWNER)
+        sp.set_type(params, sp.TRecord(token_id=sp.TNat, to_=sp.TAddress).layout(("token_id", "to_")))
+        self.verify_not_in_auction(sp.local(
+            "token_state", self.data.token_states.get_opt(params.token_id)))
+        self.move_token(sp.self_address, params.to_, params.token_id, 1)
+        del self.data.parked_tokens[params.token_id]
 
 
 class AuctionErrorMessage:
     PREFIX = "AUC_"
-    ID_ALREADY_IN_USE = "{}ID_ALREADY_IN_USE".format(PREFIX)
     SELLER_CANNOT_BID = "{}SELLER_CANNOT_BID".format(PREFIX)
     BID_AMOUNT_TOO_LOW = "{}BID_AMOUNT_TOO_LOW".format(PREFIX)
     AUCTION_IS_OVER = "{}AUCTION_IS_OVER".format(PREFIX)
@@ -305,6 +939,11 @@ class AuctionErrorMessage:
     TOKEN_AMOUNT_TOO_LOW = "{}TOKEN_AMOUNT_TOO_LOW".format(PREFIX)
     END_DATE_TOO_SOON = "{}END_DATE_TOO_SOON".format(PREFIX)
     END_DATE_TOO_LATE = "{}END_DATE_TOO_LATE".format(PREFIX)
+    NO_PENDING_REFUND = "{}NO_PENDING_REFUND".format(PREFIX)
+    AUCTION_UNDEFINED = "{}AUCTION_UNDEFINED".format(PREFIX)
+    SELLER_AUCTION_LIMIT_REACHED = "{}SELLER_AUCTION_LIMIT_REACHED".format(
+        PREFIX)
+    TOKEN_ALREADY_IN_AUCTION = "{}TOKEN_ALREADY_IN_AUCTION".format(PREFIX)
 
 
 INITIAL_BID = sp.mutez(900000)
@@ -318,6 +957,9 @@ THRESHOLD_ADDRESS = sp.address("tz3jfebmewtfXYD1Xef34TwrfMg2rrrw6oum")
 DEFAULT_ADDRESS = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
 AUCTION_EXTENSION_THRESHOLD = sp.int(60*5)  # 5 minutes
 BID_STEP_THRESHOLD = sp.mutez(100000)
+# Live auctions per seller. A token contract auctioning its own cards
+# (intial_auction) is not capped.
+MAXIMAL_AUCTIONS_PER_SELLER = sp.nat(500)
 
 
 class Auction():
@@ -325,10 +967,31 @@ class Auction():
         return sp.TRecord(token_address=sp.TAddress, token_id=sp.TNat, token_amount=sp.TNat,  end_timestamp=sp.TTimestamp, seller=sp.TAddress, bid_amount=sp.TMutez, bidder=sp.TAddress).layout(("token_address", ("token_id", ("token_amount", ("end_timestamp", ("seller", ("bid_amount", "bidder")))))))
 
 
+class AuctionTokenKey():
+    def get_type():
+        return sp.TRecord(token_address=sp.TAddress, token_id=sp.TNat).layout(("token_address", "token_id"))
+
+    def make(token_address, token_id):
+        return sp.set_type_expr(sp.record(token_address=token_address, token_id=token_id), AuctionTokenKey.get_type())
+
+
+class SellerAuctionKey():
+    def get_type():
+        return sp.TRecord(seller=sp.TAddress, index=sp.TNat).layout(("seller", "index"))
+
+    def make(seller, index):
+        return sp.set_type_expr(sp.record(seller=seller, index=index), SellerAuctionKey.get_type())
+
+
+class SellerAuctionsRequest():
+    def get_type():
+        return sp.TRecord(seller=sp.TAddress, offset=sp.TNat, limit=sp.TNat).layout(("seller", ("offset", "limit")))
+
+
 class AuctionCreateRequest():
     def get_type():
-        # .layout(("auction_id",("token_address",("token_id",("token_amount",("end_timestamp","bid_amount"))))))
-        return sp.TRecord(auction_id=sp.TNat, token_address=sp.TAddress, token_id=sp.TNat, token_amount=sp.TNat,  end_timestamp=sp.TTimestamp,  bid_amount=sp.TMutez)
+        # .layout(("token_address",("token_id",("token_amount",("end_timestamp","bid_amount")))))
+        return sp.TRecord(token_address=sp.TAddress, token_id=sp.TNat, token_amount=sp.TNat,  end_timestamp=sp.TTimestamp,  bid_amount=sp.TMutez)
 
 
 class UpdateOperatorsRequest():
@@ -347,16 +1010,54 @@ class UpdateOperatorsRequest():
         )
 
 
-class AuctionHouse(sp.Contract):
-    def __init__(self):
-        self.init(auctions=sp.big_map(tkey=sp.TNat, tvalue=Auction.get_type()))
+def get_auction(self, auction_id):
+    sp.set_type(auction_id, sp.TNat)
+    sp.result(self.data.auctions.get_opt(auction_id))
 
-    @sp.entry_point
-    def create_auction(self, create_auction_request):
-        sp.set_type_expr(create_auction_request,
-                         AuctionCreateRequest.get_type())
-        token_contract = sp.contract(BatchTransfer.get_type(
-        ), create_auction_request.token_address, entry_point="transfer").open_some()
+
+def claim_refunds(self):
+    sp.verify(self.data.pending_refunds.contains(sp.sender),
+              message=AuctionErrorMessage.NO_PENDING_REFUND)
+    sp.send(sp.sender, self.data.pending_refunds[sp.sender])
+    del self.data.pending_refunds[sp.sender]
+
+
+class AuctionHouse(sp.Contract):
+    def __init__(self, pull_payments=False, escrow_free=False, metadata=None):
+        # Compile-time switches: with pull payments, outbid amounts are booked
+        # in pending_refunds and claimed by the bidders instead of being
+        # pushed back inside bid. Escrow-free auctions lock the card with its
+        # seller (lock_tokens) and settle with one seller -> winner transfer
+        # instead of moving it in and out of the auction house.
+        self.pull_payments = pull_payments
+        self.escrow_free = escrow_free
+        storage = dict(auctions=sp.big_map(
+            tkey=sp.TNat, tvalue=Auction.get_type()), next_auction_id=sp.nat(0),
+            token_auctions=sp.big_map(
+                tkey=AuctionTokenKey.get_type(), tvalue=sp.TNat),
+            # Each seller's live auctions as a dense array, like the owner
+            # index of CricTezCards: adding or removing one costs a constant
+            # number of big_map accesses.
+            seller_auction_count=sp.big_map(tkey=sp.TAddress, tvalue=sp.TNat),
+            seller_auctions=sp.big_map(
+                tkey=SellerAuctionKey.get_type(), tvalue=sp.TNat),
+            seller_auction_index=sp.big_map(tkey=sp.TNat, tvalue=sp.TNat),
+            # TZIP-16 metadata, e.g. sp.utils.metadata_of_url(...).
+            metadata=sp.big_map(tkey=sp.TString, tvalue=sp.TBytes) if metadata is None else metadata)
+        if pull_payments:
+            storage["pending_refunds"] = sp.big_map(
+                tkey=sp.TAddress, tvalue=sp.TMutez)
+            self.claim_refunds = sp.entry_point(claim_refunds)
+        self.get_auction = sp.onchain_view()(get_auction)
+        self.offchain_get_auction = sp.offchain_view(pure=True)(get_auction)
+        self.init_metadata("AuctionHouse", dict(
+            name="CricTez Auction House",
+            description="English auctions of CricTez cards",
+            interfaces=["TZIP-016"],
+            views=[self.offchain_get_auction]))
+        self.init(**storage)
+
+    def add_auction(self, auction_id, create_auction_request):
         sp.verify(create_auction_request.token_amount > 0,
                   message=AuctionErrorMessage.TOKEN_AMOUNT_TOO_LOW)
         sp.verify(create_auction_request.end_timestamp >= sp.now.add_hours(
@@ -365,13 +1066,134 @@ class AuctionHouse(sp.Contract):
             MAXIMAL_AUCTION_DURATION), message=AuctionErrorMessage.END_DATE_TOO_LATE)
         sp.verify(create_auction_request.bid_amount >= MINIMAL_BID,
                   message=AuctionErrorMessage.BID_AMOUNT_TOO_LOW)
-        sp.verify(~self.data.auctions.contains(
-            create_auction_request.auction_id), message=AuctionErrorMessage.ID_ALREADY_IN_USE)
+        # token_auctions holds one auction per token; a second live auction
+        # of the same token would overwrite the first one's entry.
+        token_key = AuctionTokenKey.make(
+            create_auction_request.token_address, create_auction_request.token_id)
+        sp.verify(~self.data.token_auctions.contains(token_key),
+                  message=AuctionErrorMessage.TOKEN_ALREADY_IN_AUCTION)
+        count = sp.local("count", self.data.seller_auction_count.get(
+            sp.sender, sp.nat(0))).value
+        sp.verify((count < MAXIMAL_AUCTIONS_PER_SELLER) | (sp.sender == create_auction_request.token_address),
+                  message=AuctionErrorMessage.SELLER_AUCTION_LIMIT_REACHED)
+        self.data.auctions[auction_id] = sp.record(token_address=create_auction_request.token_address, token_id=create_auction_request.token_id,
+                                                    token_amount=create_auction_request.token_amount, end_timestamp=create_auction_request.end_timestamp, seller=sp.sender, bid_amount=create_auction_request.bid_amount, bidder=sp.sender)
+        self.data.token_auctions[token_key] = auction_id
+        self.data.seller_auctions[SellerAuctionKey.make(
+            sp.sender, count)] = auction_id
+        self.data.seller_auction_index[auction_id] = count
+        self.data.seller_auction_count[sp.sender] = count + 1
+        sp.emit(sp.record(auction_id=auction_id, token_address=create_auction_request.token_address,
+                          token_id=create_auction_request.token_id, seller=sp.sender), tag="auction_created")
+
+    def remove_auction(self, auction_id, auction):
+        del self.data.token_auctions[AuctionTokenKey.make(
+            auction.token_address, auction.token_id)]
+        # Swap-remove: the seller's last auction takes the freed slot.
+        index = sp.local("index", self.data.seller_auction_index[auction_id]).value
+        last = sp.local("last", sp.as_nat(
+            self.data.seller_auction_count[auction.seller] - 1)).value
+        sp.if index != last:
+            last_auction_id = sp.local("last_auction_id", self.data.seller_auctions[SellerAuctionKey.make(
+                auction.seller, last)]).value
+            self.data.seller_auctions[SellerAuctionKey.make(
+                auction.seller, index)] = last_auction_id
+            self.data.seller_auction_index[last_auction_id] = index
+        del self.data.seller_auctions[SellerAuctionKey.make(auction.seller, last)]
+        del self.data.seller_auction_index[auction_id]
+        sp.if last == 0:
+            del self.data.seller_auction_count[auction.seller]
+        sp.else:
+            self.data.seller_auction_count[auction.seller] = last
+        del self.data.auctions[auction_id]
 
-        sp.transfer([BatchTransfer.item(sp.sender, [sp.record(to_=sp.self_address, token_id=create_auction_request.token_id,
-                                                              amount=create_auction_request.token_amount)])], sp.mutez(0), token_contract)
-        self.data.auctions[create_auction_request.auction_id] = sp.record(token_address=create_auction_request.token_address, token_id=create_auction_request.token_id,
-                                                                          token_amount=create_auction_request.token_amount, end_timestamp=create_auction_request.end_timestamp, seller=sp.sender, bid_amount=create_auction_request.bid_amount, bidder=sp.sender)
+    def add_custody(self, custody, token_address, seller, token_id, token_amount):
+        # Escrow: the card moves into the auction house. Escrow-free: it stays
+        # with its seller, locked (lock_tokens) until settlement.
+        sp.if ~custody.value.contains(token_address):
+            custody.value[token_address] = []
+        if self.escrow_free:
+            custody.value[token_address].push(
+                sp.record(owner=seller, token_id=token_id, amount=token_amount))
+        else:
+            custody.value[token_address].push(
+                sp.record(to_=sp.self_address, token_id=token_id, amount=token_amount))
+
+    def new_custody(self):
+        # token address -> lock requests (escrow-free) or transfer txs (escrow)
+        if self.escrow_free:
+            return sp.local("custody", sp.map(tkey=sp.TAddress, tvalue=sp.TList(TokenLockRequest.get_type())))
+        return sp.local("custody", sp.map(tkey=sp.TAddress, tvalue=sp.TList(BatchTransfer.get_tx_type())))
+
+    def send_custody(self, custody):
+        # One call per token contract, whatever the number of auctions.
+        sp.for token_custody in custody.value.items():
+            if self.escrow_free:
+                token_contract = sp.contract(sp.TList(TokenLockRequest.get_type(
+                )), token_custody.key, entry_point="lock_tokens").open_some()
+                sp.transfer(token_custody.value, sp.mutez(0), token_contract)
+            else:
+                token_contract = sp.contract(BatchTransfer.get_type(
+                ), token_custody.key, entry_point="transfer").open_some()
+                sp.transfer([BatchTransfer.item(sp.sender, token_custody.value)],
+                            sp.mutez(0), token_contract)
+
+    def settle(self, auction_id, auction, payouts, token_transfers):
+        # Pays the seller when someone bid and hands the card to the bidder,
+        # who is the seller when nobody bid. Escrow-free cards never left the
+        # seller, so the seller -> bidder transfer also releases the lock.
+        sp.verify(sp.now > auction.end_timestamp,
+                  message=AuctionErrorMessage.AUCTION_IS_ONGOING)
+        sp.if auction.bidder != auction.seller:
+            payee = sp.local("payee", auction.seller)
+            sp.if auction.seller > THRESHOLD_ADDRESS:
+                payee.value = DEFAULT_ADDRESS
+            payouts.value[payee.value] = payouts.value.get(
+                payee.value, sp.mutez(0)) + auction.bid_amount
+        from_ = auction.seller if self.escrow_free else sp.self_address
+        sp.if ~token_transfers.value.contains(auction.token_address):
+            token_transfers.value[auction.token_address] = []
+        token_transfers.value[auction.token_address].push(BatchTransfer.item(
+            from_, [sp.record(to_=auction.bidder, token_id=auction.token_id, amount=auction.token_amount)]))
+        self.remove_auction(auction_id, auction)
+
+    def send_settlements(self, payouts, token_transfers):
+        sp.for payout in payouts.value.items():
+            sp.send(payout.key, payout.value)
+        sp.for token_transfer in token_transfers.value.items():
+            token_contract = sp.contract(BatchTransfer.get_type(
+            ), token_transfer.key, entry_point="transfer").open_some()
+            sp.transfer(token_transfer.value, sp.mutez(0), token_contract)
+
+    def new_settlements(self):
+        return (sp.local("payouts", sp.map(tkey=sp.TAddress, tvalue=sp.TMutez)),
+                sp.local("token_transfers", sp.map(tkey=sp.TAddress, tvalue=BatchTransfer.get_type())))
+
+    @sp.entry_point
+    def create_auction(self, create_auction_request):
+        sp.set_type_expr(create_auction_request,
+                         AuctionCreateRequest.get_type())
+        custody = self.new_custody()
+        self.add_auction(self.data.next_auction_id, create_auction_request)
+        self.add_custody(custody, create_auction_request.token_address, sp.sender,
+                         create_auction_request.token_id, create_auction_request.token_amount)
+        self.data.next_auction_id += 1
+        self.send_custody(custody)
+
+    @sp.entry_point
+    def create_auctions_batch(self, create_auction_requests):
+        sp.set_type(create_auction_requests, sp.TList(
+            AuctionCreateRequest.get_type()))
+        custody = self.new_custody()
+        auction_id_runner = sp.local(
+            "auction_id_runner", self.data.next_auction_id)
+        sp.for create_auction_request in create_auction_requests:
+            self.add_auction(auction_id_runner.value, create_auction_request)
+            self.add_custody(custody, create_auction_request.token_address, sp.sender,
+                             create_auction_request.token_id, create_auction_request.token_amount)
+            auction_id_runner.value += 1
+        self.data.next_auction_id = auction_id_runner.value
+        self.send_custody(custody)
 
     @sp.entry_point
     def bid(self, auction_id):
@@ -386,10 +1208,14 @@ class AuctionHouse(sp.Contract):
                   message=AuctionErrorMessage.AUCTION_IS_OVER)
 
         sp.if auction.bidder != auction.seller:
-            sp.if auction.bidder > THRESHOLD_ADDRESS:
-                sp.send(DEFAULT_ADDRESS, auction.bid_amount)
-            sp.else:
-                sp.send(auction.bidder, auction.bid_amount)
+            if self.pull_payments:
+                self.data.pending_refunds[auction.bidder] = self.data.pending_refunds.get(
+                    auction.bidder, sp.mutez(0)) + auction.bid_amount
+            else:
+                sp.if auction.bidder > THRESHOLD_ADDRESS:
+                    sp.send(DEFAULT_ADDRESS, auction.bid_amount)
+                sp.else:
+                    sp.send(auction.bidder, auction.bid_amount)
 
         auction.bidder = sp.sender
         auction.bid_amount = sp.amount
@@ -401,21 +1227,56 @@ class AuctionHouse(sp.Contract):
     @sp.entry_point
     def withdraw(self, auction_id):
         sp.set_type_expr(auction_id, sp.TNat)
-        auction = self.data.auctions[auction_id]
-        sp.verify(sp.now > auction.end_timestamp,
-                  message=AuctionErrorMessage.AUCTION_IS_ONGOING)
+        payouts, token_transfers = self.new_settlements()
+        auction = sp.local("auction", self.data.auctions[auction_id]).value
+        self.settle(auction_id, auction, payouts, token_transfers)
+        self.send_settlements(payouts, token_transfers)
 
-        token_contract = sp.contract(BatchTransfer.get_type(
-        ), auction.token_address, entry_point="transfer").open_some()
-        sp.if auction.bidder != auction.seller:
-            sp.if auction.seller > THRESHOLD_ADDRESS:
-                sp.send(DEFAULT_ADDRESS, auction.bid_amount)
-            sp.else:
-                sp.send(auction.seller, auction.bid_amount)
+    @sp.entry_point
+    def withdraw_many(self, auction_ids):
+        sp.set_type(auction_ids, sp.TList(sp.TNat))
+        payouts, token_transfers = self.new_settlements()
+        sp.for auction_id in auction_ids:
+            auction = sp.local("auction", self.data.auctions.get(auction_id, message=AuctionErrorMessage.AUCTION_UNDEFINED)).value
+            self.settle(auction_id, auction, payouts, token_transfers)
+        self.send_settlements(payouts, token_transfers)
+
+    @sp.onchain_view()
+    def get_token_auction(self, token_key):
+        sp.set_type(token_key, AuctionTokenKey.get_type())
+        sp.result(self.data.token_auctions.get_opt(token_key))
+
+    @sp.onchain_view()
+    def get_seller_auction_count(self, seller):
+        sp.set_type(seller, sp.TAddress)
+        sp.result(self.data.seller_auction_count.get(seller, sp.nat(0)))
+
+    @sp.onchain_view()
+    def get_seller_auctions(self, request):
+        sp.set_type(request, SellerAuctionsRequest.get_type())
+        auction_ids = sp.local("auction_ids", sp.list(t=sp.TNat))
+        end = sp.local("end", request.offset + request.limit)
+        count = self.data.seller_auction_count.get(request.seller, sp.nat(0))
+        sp.if end.value > count:
+            end.value = count
+        index = sp.local("index", request.offset)
+        sp.while index.value < end.value:
+            auction_ids.value.push(
+                self.data.seller_auctions[SellerAuctionKey.make(request.seller, index.value)])
+            index.value += 1
+        sp.result(auction_ids.value.rev())
+
+
+class BalanceOfReceiver(sp.Contract):
+    def __init__(self):
+        self.init_type(sp.TRecord(
+            last_responses=BalanceOfRequest.get_response_type()))
+        self.init(last_responses=[])
 
-        sp.transfer([BatchTransfer.item(sp.self_address, [sp.record(to_=auction.bidder,
-                                                                    token_id=auction.token_id, amount=auction.token_amount)])], sp.mutez(0), token_contract)
-        del self.data.auctions[auction_id]
+    @sp.entry_point
+    def receive_balances(self, responses):
+        sp.set_type(responses, BalanceOfRequest.get_response_type())
+        self.data.last_responses = responses
 
 
 if "templates" not in __name__:
@@ -448,17 +1309,56 @@ if "templates" not in __name__:
 
         scenario += c1
 
+        scenario.h2("Register card templates")
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.register_card_template(player_id=1, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.register_card_template(player_id=1, year=2021, card_type=len(CardType.NAMES),
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin, valid=False)
+
         scenario.h2("Initiate initial minting")
-        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('x')}, player_id=0, year=2021, type="Standard",
-                            edition_no=1, ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
-        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('z')}, player_id=0, year=2021, type="Standard",
-                            edition_no=2, ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
-        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('q')}, player_id=0, year=2021, type="Standard",
-                            edition_no=3, ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
-        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('w')}, player_id=0, year=2021, type="Standard",
-                            edition_no=4, ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
-        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('e')}, player_id=0, year=2021, type="Standard",
-                            edition_no=5, ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('x')}, template_id=0,
+                            edition_no=1).run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('z')}, template_id=0,
+                            edition_no=2).run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('q')}, template_id=0,
+                            edition_no=3).run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('w')}, template_id=0,
+                            edition_no=4).run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('e')}, template_id=0,
+                            edition_no=5).run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('r')}, template_id=2,
+                            edition_no=1).run(sender=admin, valid=False)
+
+        scenario.h2("Mint a whole edition in one operation")
+        scenario += c1.mint_batch(template_id=1, editions=[sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))},
+                                                                     edition_no=edition_no) for edition_no in range(1, 11)]).run(sender=admin)
+        scenario.verify(c1.data.next_token_id == 15)
+        scenario += c1.mint_batch(template_id=1, editions=[]).run(sender=alice, valid=False)
+        scenario.verify_equal(c1.get_card(7), sp.record(global_card_id=7, player_id=1, year=2021, type="Standard", edition_no=3,
+                                                        ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY"))
+
+        scenario.h2("Marketplace")
+        scenario += c1.list_cards_batch([sp.record(token_id=token_id, sale_price=sp.mutez(1000000))
+                                         for token_id in range(5, 10)]).run(sender=admin)
+        scenario += c1.list_cards_batch([sp.record(token_id=10, sale_price=sp.mutez(1000000))]).run(
+            sender=alice, valid=False)
+        scenario += c1.withdraw_cards_batch([5, 6]).run(sender=admin)
+        scenario.verify(~c1.data.token_states.contains(5))
+        scenario.verify(c1.data.token_states[7].is_variant("listed"))
+        scenario.verify_equal(c1.get_listing(7), sp.some(
+            sp.record(seller=admin, sale_value=sp.mutez(1000000))))
+        scenario.verify_equal(c1.get_listing(5), sp.none)
+        scenario += c1.buy_cards_batch([7, 8]).run(sender=bob, amount=sp.mutez(1000000), valid=False)
+        scenario += c1.buy_cards_batch([7, 7]).run(sender=bob, amount=sp.mutez(2000000), valid=False)
+        scenario += c1.buy_cards_batch([7, 8]).run(sender=bob, amount=sp.mutez(2000000))
+        scenario.verify(c1.data.ledger[LedgerKey.make(bob.address, 8)] == 1)
+        scenario.verify(c1.get_balance(LedgerKey.make(bob.address, 8)) == 1)
+        scenario.verify(c1.get_balance(LedgerKey.make(admin, 8)) == 0)
+        scenario.verify(c1.total_supply(8) == 1)
+        scenario.verify(c1.count_tokens() == 15)
+        scenario.verify(~c1.data.token_states.contains(8))
 
         # scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=0, amount=1)])]).run(sender=admin)
         # scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=1, amount=1)])]).run(sender=admin)
@@ -466,10 +1366,73 @@ if "templates" not in __name__:
         # scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=3, amount=1)])]).run(sender=admin)
         # scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=4, amount=1)])]).run(sender=admin)
 
-        auction_id = sp.nat(0)
         scenario.p("Admin creates Auction")
-        scenario += auction_house.create_auction(sp.record(auction_id=auction_id, token_address=c1.address, token_id=sp.nat(1), token_amount=sp.nat(
-            1),  end_timestamp=sp.timestamp(60*60),  bid_amount=sp.mutez(100000))).run(sender=admin, source=admin, now=sp.timestamp(0))
+        admin_auction = sp.record(token_address=c1.address, token_id=sp.nat(1), token_amount=sp.nat(
+            1),  end_timestamp=sp.timestamp(60*60),  bid_amount=sp.mutez(100000))
+        scenario += auction_house.create_auction(admin_auction).run(sender=admin, now=sp.timestamp(0), valid=False)
+        scenario += c1.update_operators([sp.variant("add_operator", OperatorParam.make(
+            admin, auction_house.address, 1))]).run(sender=admin)
+        scenario += auction_house.create_auction(admin_auction).run(sender=admin, now=sp.timestamp(0))
+
+        scenario.p("Admin launches the initial auctions of three cards")
+        scenario += c1.intial_auction(token_ids=[2, 3, 4]).run(sender=admin, now=sp.timestamp(0))
+        scenario.verify(auction_house.data.auctions[3].token_id == 4)
+        scenario.verify(auction_house.get_auction(3).open_some().seller == c1.address)
+        scenario.verify(c1.data.ledger[LedgerKey.make(auction_house.address, 4)] == 1)
+        scenario += c1.intial_auction(token_ids=[0]).run(sender=alice, now=sp.timestamp(0), valid=False)
+
+        scenario.p("Bob puts his two cards up for auction in one operation")
+        scenario += c1.update_all_tokens_operators([sp.variant("add_operator", sp.record(
+            owner=bob.address, operator=auction_house.address))]).run(sender=bob)
+        scenario += auction_house.create_auctions_batch([
+            sp.record(token_address=c1.address, token_id=token_id, token_amount=1,
+                      end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000))
+            for token_id in [7, 8]]).run(sender=bob, now=sp.timestamp(0))
+        scenario.verify(c1.data.ledger[LedgerKey.make(auction_house.address, 7)] == 1)
+        scenario.verify(auction_house.data.auctions[5].seller == bob.address)
+        scenario.verify(auction_house.data.next_auction_id == 6)
+        scenario += auction_house.create_auction(token_address=c1.address, token_id=7, token_amount=1,
+                                                 end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000)).run(
+            sender=bob, now=sp.timestamp(0), valid=False, exception=AuctionErrorMessage.TOKEN_ALREADY_IN_AUCTION)
+        scenario.verify(auction_house.data.token_auctions[AuctionTokenKey.make(c1.address, 8)] == 5)
+        scenario.verify(auction_house.data.seller_auctions[SellerAuctionKey.make(bob.address, 0)] == 4)
+        scenario.verify(auction_house.get_seller_auction_count(bob.address) == 2)
+        scenario.verify_equal(auction_house.get_seller_auctions(
+            sp.record(seller=bob.address, offset=0, limit=10)), [4, 5])
+
+        scenario.p("Settle the ended auctions of the drop in one operation")
+        scenario += auction_house.bid(4).run(sender=alice, amount=sp.mutez(200000), now=sp.timestamp(10))
+        scenario += auction_house.bid(5).run(sender=alice, amount=sp.mutez(300000), now=sp.timestamp(10))
+        scenario += auction_house.withdraw_many([4, 5]).run(sender=dan, now=sp.timestamp(60*60), valid=False)
+        scenario += auction_house.withdraw_many([4, 5]).run(sender=dan, now=sp.timestamp(60*60+1))
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 7)] == 1)
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 8)] == 1)
+        scenario.verify(~auction_house.data.auctions.contains(4))
+        scenario.verify(~auction_house.data.seller_auction_count.contains(bob.address))
+        scenario.verify(~auction_house.data.seller_auction_index.contains(4))
+        scenario.verify_equal(auction_house.get_token_auction(
+            AuctionTokenKey.make(c1.address, 7)), sp.none)
+
+        scenario.p("An unsold initial auction returns the card to the contract, which auctions it again")
+        scenario += auction_house.withdraw(1).run(sender=dan, now=sp.timestamp(24*5*3600+1))
+        scenario.verify(c1.data.ledger[LedgerKey.make(c1.address, 2)] == 1)
+        scenario.verify(c1.data.parked_tokens.contains(2))
+        scenario += c1.intial_auction(token_ids=[2]).run(sender=alice, now=sp.timestamp(24*5*3600+2), valid=False)
+        scenario += c1.intial_auction(token_ids=[2]).run(sender=admin, now=sp.timestamp(24*5*3600+2))
+        scenario.verify(auction_house.data.auctions[6].seller == c1.address)
+        scenario.verify(c1.data.ledger[LedgerKey.make(auction_house.address, 2)] == 1)
+        scenario.verify(~c1.data.ledger.contains(LedgerKey.make(c1.address, 2)))
+        scenario.verify(~c1.data.parked_tokens.contains(2))
+
+        scenario.p("A card sent to the contract by its owner is not auctioned; the admin hands it back")
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=c1.address, token_id=7, amount=1)])]).run(
+            sender=alice)
+        scenario.verify(~c1.data.parked_tokens.contains(7))
+        scenario += c1.intial_auction(token_ids=[7]).run(sender=admin, now=sp.timestamp(24*5*3600+3), valid=False,
+                                                         exception=FA2ErrorMessage.INSUFFICIENT_BALANCE)
+        scenario += c1.release_parked(token_id=7, to_=alice.address).run(sender=bob, valid=False)
+        scenario += c1.release_parked(token_id=7, to_=alice.address).run(sender=admin)
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 7)] == 1)
 
         # scenario.p("Bob tries to withdraw")
         # scenario += auction_house.withdraw(0).run(sender=bob,
@@ -495,3 +1458,400 @@ if "templates" not in __name__:
         # scenario.p("Alice withdraws")
         # scenario += auction_house.withdraw(0).run(sender=alice,
         #                                           amount=sp.mutez(0), now=sp.timestamp(60*60+5*60-6+5*60+1))
+
+    @sp.add_test(name="Pull-payment refunds")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Auction House with pull-payment refunds")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        alice = sp.test_account("Alice")
+        dan = sp.test_account("Dan")
+
+        auction_house = AuctionHouse(pull_payments=True)
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint(metadata={'': sp.utils.bytes_of_string('x')}, template_id=0,
+                            edition_no=1).run(sender=admin)
+        scenario += c1.update_operators([sp.variant("add_operator", OperatorParam.make(
+            admin, auction_house.address, 0))]).run(sender=admin)
+        scenario += auction_house.create_auction(sp.record(token_address=c1.address, token_id=0, token_amount=1,
+                                                           end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000))).run(sender=admin, now=sp.timestamp(0))
+
+        scenario.p("Outbid amounts are booked instead of sent back")
+        scenario += auction_house.bid(0).run(sender=alice, amount=sp.mutez(200000), now=sp.timestamp(0))
+        scenario += auction_house.bid(0).run(sender=dan, amount=sp.mutez(300000), now=sp.timestamp(1))
+        scenario += auction_house.bid(0).run(sender=alice, amount=sp.mutez(400000), now=sp.timestamp(2))
+        scenario += auction_house.bid(0).run(sender=dan, amount=sp.mutez(500000), now=sp.timestamp(3))
+        scenario.verify(auction_house.data.pending_refunds[alice.address] == sp.mutez(600000))
+        scenario.verify(auction_house.data.pending_refunds[dan.address] == sp.mutez(300000))
+
+        scenario.p("Alice claims all her refunds at once")
+        scenario += auction_house.claim_refunds().run(sender=alice)
+        scenario.verify(~auction_house.data.pending_refunds.contains(alice.address))
+        scenario += auction_house.claim_refunds().run(sender=alice, valid=False)
+
+    @sp.add_test(name="Seller auction cap")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Live auctions per seller")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        cap = 500  # MAXIMAL_AUCTIONS_PER_SELLER
+
+        auction_house = AuctionHouse()
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint_batch(template_id=0, editions=[sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))},
+                                                                     edition_no=edition_no) for edition_no in range(1, 2 * cap + 3)]).run(sender=admin, show=False)
+        scenario += c1.update_all_tokens_operators([sp.variant("add_operator", sp.record(
+            owner=admin, operator=auction_house.address))]).run(sender=admin)
+
+        scenario.p("A seller cannot have more than the cap of live auctions")
+        scenario += auction_house.create_auctions_batch([
+            sp.record(token_address=c1.address, token_id=token_id, token_amount=1,
+                      end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000))
+            for token_id in range(cap)]).run(sender=admin, now=sp.timestamp(0), show=False)
+        scenario.verify(auction_house.get_seller_auction_count(admin) == cap)
+        scenario += auction_house.create_auction(token_address=c1.address, token_id=cap, token_amount=1,
+                                                 end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000)).run(
+            sender=admin, now=sp.timestamp(0), valid=False, exception=AuctionErrorMessage.SELLER_AUCTION_LIMIT_REACHED)
+
+        scenario.p("Initial auctions are run by the token contract itself and are not capped")
+        scenario += c1.intial_auction(token_ids=list(range(cap, 2 * cap + 2))).run(
+            sender=admin, now=sp.timestamp(0), show=False)
+        scenario.verify(auction_house.get_seller_auction_count(c1.address) == cap + 2)
+
+    @sp.add_test(name="Owner index")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("CricTez Cards with the owner index")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+
+        auction_house = AuctionHouse()
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address,
+            owner_index=True)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint_batch(template_id=0, editions=[sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))},
+                                                                     edition_no=edition_no) for edition_no in range(1, 5)]).run(sender=admin)
+        scenario.verify(c1.get_owner_token_count(admin) == 4)
+
+        scenario.p("Moving a card out swaps the owner's last card into its slot")
+        scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=1, amount=1)])]).run(sender=admin)
+        scenario.verify_equal(c1.get_owner_tokens(sp.record(owner=admin, offset=0, limit=10)), [0, 3, 2])
+        scenario.verify_equal(c1.get_owner_tokens(sp.record(owner=alice.address, offset=0, limit=10)), [1])
+
+        scenario.p("Marketplace purchases keep the index in step")
+        scenario += c1.list_card_on_marketplace(token_id=1, sale_price=sp.mutez(1000000)).run(sender=alice)
+        scenario += c1.buy_card_from_marketplace(token_id=1).run(sender=bob, amount=sp.mutez(1000000))
+        scenario.verify(c1.get_owner_token_count(alice.address) == 0)
+        scenario.verify_equal(c1.get_owner_tokens(sp.record(owner=bob.address, offset=0, limit=10)), [1])
+        scenario.verify_equal(c1.get_owner_tokens(sp.record(owner=admin, offset=1, limit=1)), [3])
+
+    @sp.add_test(name="balance_of")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("FA2 balance_of")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+
+        auction_house = AuctionHouse()
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address)
+        scenario += c1
+        receiver = BalanceOfReceiver()
+        scenario += receiver
+        callback = sp.contract(BalanceOfRequest.get_response_type(), receiver.address,
+                               entry_point="receive_balances").open_some()
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint_batch(template_id=0, editions=[sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))},
+                                                                     edition_no=edition_no) for edition_no in range(1, 4)]).run(sender=admin)
+        scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=1, amount=1)])]).run(sender=admin)
+
+        scenario.p("Answers come back in request order, repeated keys included, while the contract is paused")
+        scenario += c1.set_pause(True).run(sender=admin)
+        requests = [(alice.address, 1), (admin, 2), (bob.address, 0), (alice.address, 1), (admin, 0), (admin, 1),
+                    (admin, 2)]
+        balances = [1, 1, 0, 1, 1, 0, 1]
+        scenario += c1.balance_of(requests=[LedgerKey.make(owner, token_id) for owner, token_id in requests],
+                                  callback=callback).run(sender=bob)
+        scenario.verify_equal(receiver.data.last_responses, [
+            sp.record(request=LedgerKey.make(owner, token_id), balance=balance)
+            for (owner, token_id), balance in zip(requests, balances)])
+
+    @sp.add_test(name="Operators")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("FA2 operators")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        dan = sp.test_account("Dan")
+
+        auction_house = AuctionHouse()
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint_batch(template_id=0, editions=[sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))},
+                                                                     edition_no=edition_no) for edition_no in range(1, 5)]).run(sender=admin)
+        scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=token_id, amount=1)
+                                                            for token_id in range(4)])]).run(sender=admin)
+
+        scenario.p("Only the owner manages its operators")
+        scenario += c1.update_operators([sp.variant("add_operator", OperatorParam.make(
+            alice.address, dan.address, 0))]).run(sender=dan, valid=False)
+        scenario += c1.update_operators([sp.variant("add_operator", OperatorParam.make(
+            alice.address, dan.address, 0))]).run(sender=alice)
+
+        scenario.p("A token operator moves that token only")
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=bob.address, token_id=1, amount=1)])]).run(
+            sender=dan, valid=False)
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=bob.address, token_id=0, amount=1)])]).run(
+            sender=dan)
+        scenario.verify(c1.data.ledger[LedgerKey.make(bob.address, 0)] == 1)
+
+        scenario.p("An all-tokens operator moves a whole batch")
+        scenario += c1.update_all_tokens_operators([sp.variant("add_operator", sp.record(
+            owner=alice.address, operator=dan.address))]).run(sender=alice)
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=bob.address, token_id=token_id, amount=1)
+                                                                    for token_id in [1, 2]])]).run(sender=dan)
+        scenario.verify(c1.data.ledger[LedgerKey.make(bob.address, 2)] == 1)
+
+        scenario.p("Removed operators lose access")
+        scenario += c1.update_all_tokens_operators([sp.variant("remove_operator", sp.record(
+            owner=alice.address, operator=dan.address))]).run(sender=alice)
+        scenario.verify(~c1.data.operators.contains(OperatorKey.make(alice.address, dan.address, sp.none)))
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=bob.address, token_id=3, amount=1)])]).run(
+            sender=dan, valid=False)
+
+    @sp.add_test(name="Drops")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Fixed-price drops")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+
+        auction_house = AuctionHouse()
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.RARE,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+
+        scenario.p("The admin registers a 10,000 card drop in one operation")
+        scenario += c1.register_drop(template_id=0, metadata={'': sp.utils.bytes_of_string("drop")},
+                                     price=sp.mutez(1000000), supply=10000, wallet_cap=3).run(sender=alice, valid=False)
+        scenario += c1.register_drop(template_id=1, metadata={'': sp.utils.bytes_of_string("drop")},
+                                     price=sp.mutez(1000000), supply=10000, wallet_cap=3).run(sender=admin, valid=False)
+        scenario += c1.register_drop(template_id=0, metadata={'': sp.utils.bytes_of_string("drop")},
+                                     price=sp.mutez(1000000), supply=10000, wallet_cap=3).run(sender=admin)
+        scenario.verify(c1.count_tokens() == 0)
+
+        scenario.p("Buyers mint editions in order, paying the drop price")
+        scenario += c1.buy_from_drop(drop_id=0, quantity=2).run(sender=alice, amount=sp.mutez(1000000), valid=False)
+        scenario += c1.buy_from_drop(drop_id=1, quantity=1).run(sender=alice, amount=sp.mutez(1000000), valid=False)
+        scenario += c1.buy_from_drop(drop_id=0, quantity=2).run(sender=alice, amount=sp.mutez(2000000))
+        scenario += c1.buy_from_drop(drop_id=0, quantity=1).run(sender=bob, amount=sp.mutez(1000000))
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 1)] == 1)
+        scenario.verify(c1.data.tokens[2].edition_no == 3)
+        scenario.verify(c1.data.token_metadata[2].token_info["edition_no"] == sp.utils.bytes_of_string("3"))
+        scenario.verify(c1.data.token_metadata[2].token_info[""] == sp.utils.bytes_of_string("drop"))
+        scenario.verify(c1.get_drop(0).sold == 3)
+
+        scenario.p("Each wallet buys at most wallet_cap cards of a drop")
+        scenario += c1.buy_from_drop(drop_id=0, quantity=2).run(sender=alice, amount=sp.mutez(2000000), valid=False)
+        scenario += c1.buy_from_drop(drop_id=0, quantity=1).run(sender=alice, amount=sp.mutez(1000000))
+        scenario.verify(c1.data.drop_purchases[DropWalletKey.make(0, alice.address)] == 3)
+
+        scenario.p("A drop sells no more than its supply")
+        scenario += c1.register_drop(template_id=0, metadata={'': sp.utils.bytes_of_string("drop")},
+                                     price=sp.mutez(500000), supply=2, wallet_cap=5).run(sender=admin)
+        scenario += c1.buy_from_drop(drop_id=1, quantity=3).run(sender=bob, amount=sp.mutez(1500000), valid=False)
+        scenario += c1.buy_from_drop(drop_id=1, quantity=2).run(sender=bob, amount=sp.mutez(1000000))
+        scenario += c1.buy_from_drop(drop_id=1, quantity=1).run(sender=alice, amount=sp.mutez(500000), valid=False)
+        scenario.verify(c1.count_tokens() == 6)
+
+        scenario.p("A later drop of the same template continues its edition numbers")
+        scenario.verify(c1.get_drop(1).first_edition == 10001)
+        scenario.verify(c1.data.tokens[4].edition_no == 10001)
+        scenario.verify(c1.data.tokens[5].edition_no == 10002)
+        scenario.verify(c1.data.token_metadata[5].token_info["edition_no"] == sp.utils.bytes_of_string("10002"))
+
+    @sp.add_test(name="Vouchers")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Lazy minting with signed vouchers")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        signer = sp.test_account("Voucher signer")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+
+        auction_house = AuctionHouse()
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address,
+            voucher_signer=signer.public_key)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.LEGENDARY,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+
+        def voucher(edition_no, price):
+            return sp.record(template_id=0, edition_no=edition_no,
+                             metadata={'': sp.utils.bytes_of_string(str(edition_no))}, price=price)
+
+        def sign(account, voucher):
+            return sp.make_signature(account.secret_key, Voucher.get_payload(c1.address, voucher),
+                                     message_format="Raw")
+
+        scenario.p("The first redemption mints the card to the buyer")
+        first = voucher(1, sp.mutez(1000000))
+        scenario += c1.redeem_voucher(voucher=first, signature=sign(signer, first)).run(
+            sender=alice, amount=sp.mutez(500000), valid=False)
+        scenario += c1.redeem_voucher(voucher=first, signature=sign(signer, first)).run(
+            sender=alice, amount=sp.mutez(1000000))
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 0)] == 1)
+        scenario.verify(c1.data.tokens[0].edition_no == 1)
+
+        scenario.p("A voucher redeems once")
+        scenario += c1.redeem_voucher(voucher=first, signature=sign(signer, first)).run(
+            sender=bob, amount=sp.mutez(1000000), valid=False)
+        scenario.verify(c1.count_tokens() == 1)
+
+        scenario.p("Vouchers not signed by the voucher signer, or altered after signing, are rejected")
+        second = voucher(2, sp.mutez(1000000))
+        scenario += c1.redeem_voucher(voucher=second, signature=sign(alice, second)).run(
+            sender=alice, amount=sp.mutez(1000000), valid=False)
+        scenario += c1.redeem_voucher(voucher=voucher(2, sp.mutez(1)), signature=sign(signer, second)).run(
+            sender=alice, amount=sp.mutez(1), valid=False)
+
+        scenario.p("Rotating the signer key voids outstanding vouchers")
+        scenario += c1.set_voucher_signer(bob.public_key).run(sender=alice, valid=False)
+        scenario += c1.set_voucher_signer(bob.public_key).run(sender=admin)
+        scenario += c1.redeem_voucher(voucher=second, signature=sign(signer, second)).run(
+            sender=alice, amount=sp.mutez(1000000), valid=False)
+        scenario += c1.redeem_voucher(voucher=second, signature=sign(bob, second)).run(
+            sender=alice, amount=sp.mutez(1000000))
+        scenario.verify(c1.count_tokens() == 2)
+
+    @sp.add_test(name="Escrow-free auctions")
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Escrow-free auctions")
+
+        admin = sp.address("tz1aW9v8Ka7UCuoGFWjzag9Fv599mLbWVSq9")
+        alice = sp.test_account("Alice")
+        bob = sp.test_account("Bob")
+        dan = sp.test_account("Dan")
+
+        auction_house = AuctionHouse(escrow_free=True)
+        scenario += auction_house
+        c1 = CricTezCards(
+            admin=admin,
+            metadata=sp.utils.metadata_of_url(
+                "https://gist.githubusercontent.com/shubham-kukreja/dfdd7e6f7745acd167173a480d86e92f/"),
+            initial_auction_house_address=auction_house.address)
+        scenario += c1
+        scenario += c1.register_card_template(player_id=0, year=2021, card_type=CardType.STANDARD,
+                                              ipfs_string="ipfs://QmVdbn8QvAADa5ydnqn4dwRdixJiaCHgrWhrxsZ56ZK2vY").run(sender=admin)
+        scenario += c1.mint_batch(template_id=0, editions=[sp.record(metadata={'': sp.utils.bytes_of_string(str(edition_no))},
+                                                                     edition_no=edition_no) for edition_no in range(1, 4)]).run(sender=admin)
+        scenario += c1.transfer([BatchTransfer.item(admin, [sp.record(to_=alice.address, token_id=token_id, amount=1)
+                                                            for token_id in range(3)])]).run(sender=admin)
+        scenario += c1.list_card_on_marketplace(token_id=2, sale_price=sp.mutez(1000000)).run(sender=alice)
+
+        scenario.p("Only an operator of the seller can lock the card")
+        auction_request = sp.record(token_address=c1.address, token_id=0, token_amount=1,
+                                    end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000))
+        scenario += auction_house.create_auction(auction_request).run(sender=alice, now=sp.timestamp(0), valid=False)
+        scenario += c1.update_all_tokens_operators([sp.variant("add_operator", sp.record(
+            owner=alice.address, operator=auction_house.address))]).run(sender=alice)
+
+        scenario.p("Nobody locks a card they do not hold")
+        scenario += c1.lock_tokens([sp.record(owner=dan.address, token_id=0, amount=0)]).run(sender=dan, valid=False)
+        scenario += c1.lock_tokens([sp.record(owner=dan.address, token_id=0, amount=1)]).run(sender=dan, valid=False)
+        scenario.verify(~c1.data.token_states.contains(0))
+
+        scenario.p("The card stays with Alice, locked")
+        scenario += auction_house.create_auction(auction_request).run(sender=alice, now=sp.timestamp(0))
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 0)] == 1)
+        scenario.verify(c1.data.token_states[0].open_variant("in_auction").locker == auction_house.address)
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=bob.address, token_id=0, amount=1)])]).run(
+            sender=alice, valid=False)
+        scenario += c1.list_card_on_marketplace(token_id=0, sale_price=sp.mutez(1000000)).run(sender=alice, valid=False)
+
+        scenario.p("The locker only moves the card out of the locked owner's account")
+        scenario += c1.transfer([BatchTransfer.item(bob.address, [sp.record(to_=dan.address, token_id=0, amount=0)])]).run(
+            sender=auction_house.address, valid=False, exception=CricTezErrorMessage.TOKEN_LOCKED)
+        scenario += c1.transfer([BatchTransfer.item(bob.address, [sp.record(to_=dan.address, token_id=0, amount=1)])]).run(
+            sender=auction_house.address, valid=False, exception=CricTezErrorMessage.TOKEN_LOCKED)
+
+        scenario.p("Locking a listed card takes it off the marketplace")
+        scenario += auction_house.create_auctions_batch([
+            sp.record(token_address=c1.address, token_id=token_id, token_amount=1,
+                      end_timestamp=sp.timestamp(60*60), bid_amount=sp.mutez(100000))
+            for token_id in [1, 2]]).run(sender=alice, now=sp.timestamp(0))
+        scenario.verify(c1.data.token_states[2].is_variant("in_auction"))
+        scenario += auction_house.create_auction(auction_request).run(sender=alice, now=sp.timestamp(0), valid=False)
+
+        scenario.p("Settlement moves the card straight from seller to winner")
+        scenario += auction_house.bid(0).run(sender=bob, amount=sp.mutez(200000), now=sp.timestamp(10))
+        scenario += auction_house.withdraw(0).run(sender=bob, now=sp.timestamp(60*60+1))
+        scenario.verify(c1.data.ledger[LedgerKey.make(bob.address, 0)] == 1)
+        scenario.verify(~c1.data.token_states.contains(0))
+
+        scenario.p("Auctions without bids just release the lock")
+        scenario += auction_house.bid(2).run(sender=dan, amount=sp.mutez(200000), now=sp.timestamp(10))
+        scenario += auction_house.withdraw_many([1, 2]).run(sender=dan, now=sp.timestamp(60*60+1))
+        scenario.verify(c1.data.ledger[LedgerKey.make(alice.address, 1)] == 1)
+        scenario.verify(c1.data.ledger[LedgerKey.make(dan.address, 2)] == 1)
+        scenario.verify(~c1.data.token_states.contains(1))
+        scenario += c1.transfer([BatchTransfer.item(alice.address, [sp.record(to_=bob.address, token_id=1, amount=1)])]).run(
+            sender=alice)